@@ -0,0 +1,120 @@
+"""
+自动标签插件分批扫描的收敛检查。
+
+同一个模拟种子库分别执行一次完整扫描和按接口调用预算的多次分批扫描，
+分批扫描完成一轮后，每个种子的标签和限速应与完整扫描的结果一致。
+另外检查首次运行时还没有文件列表（磁力链接、刚添加）的种子，文件列表出现后的下一次运行应补上文件标签。
+
+用法（仓库根目录）::
+
+    python -m benchmarks.converge
+    python -m benchmarks.converge --size 2000 --budget-calls 100 --dl-type transmission
+"""
+import argparse
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import shims
+from .run import Scenario, job_of, setup
+
+TAG_CONFIG = {
+    "content_map": "iso:软件\nflac,mp3>50:音乐",
+    "pipeline": True,
+}
+
+
+def specs() -> Dict[str, Any]:
+    """
+    下载器替身中的全部种子
+    """
+    result = {}
+    for name, service in shims.REGISTRY["services"].items():
+        client = service.instance.qbc if service.type == "qbittorrent" else service.instance.trc
+        for _hash, spec in client.specs.items():
+            result[f"{name}:{_hash}"] = spec
+    return result
+
+
+def final_state() -> Dict[str, Tuple[Tuple[str, ...], int]]:
+    """
+    下载器替身中每个种子的 (标签, 上传限速)
+    """
+    return {key: (tuple(sorted(spec.tags)), spec.up_limit or 0) for key, spec in specs().items()}
+
+
+def mismatches(expected: Dict[str, Tuple[Tuple[str, ...], int]]) -> int:
+    actual = final_state()
+    return sum(1 for key, value in expected.items() if actual.get(key) != value)
+
+
+def run(dl_type: str, size: int, budget_calls: int, max_runs: int, page_size: int) -> Tuple[int, int]:
+    """
+    返回 (分批扫描完成一轮的运行次数, 与完整扫描结果不一致的种子数)
+    """
+    config = {**TAG_CONFIG, "page_size": str(page_size)}
+    plugin, _ = setup(Scenario("converge", "tag", dl_type, size, tag_config=config), latency=0)
+    job_of(plugin)()
+    expected = final_state()
+
+    scenario = Scenario("converge", "tag", dl_type, size, tag_config={**config, "budget_calls": str(budget_calls)})
+    plugin, _ = setup(scenario, latency=0)
+    runs = 0
+    while runs < max_runs:
+        job_of(plugin)()
+        runs += 1
+        if not plugin.get_data("cursor"):
+            break
+    return runs, mismatches(expected)
+
+
+def late_files(dl_type: str, size: int, page_size: int, every: int = 10) -> int:
+    """
+    每 every 个种子中有一个首次运行时没有文件列表，第二次运行前出现，返回第二次运行后与完整扫描不一致的种子数
+    """
+    scenario = Scenario("converge", "tag", dl_type, size, tag_config={**TAG_CONFIG, "page_size": str(page_size)})
+    plugin, _ = setup(scenario, latency=0)
+    job_of(plugin)()
+    expected = final_state()
+
+    plugin, _ = setup(scenario, latency=0)
+    hidden = {}
+    for i, spec in enumerate(specs().values()):
+        if i % every == 0:
+            hidden[spec], spec.files = spec.files, []
+    job_of(plugin)()
+    for spec, files in hidden.items():
+        spec.files = files
+    job_of(plugin)()
+    return mismatches(expected)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="自动标签插件分批扫描收敛检查")
+    parser.add_argument("--size", type=int, default=2000, help="种子数量")
+    parser.add_argument("--budget-calls", type=int, default=100, help="每次运行的接口调用预算")
+    parser.add_argument("--page-size", type=int, default=1000, help="qBittorrent 分页大小")
+    parser.add_argument("--max-runs", type=int, default=200, help="最多运行次数")
+    parser.add_argument("--dl-type", action="append", choices=["qbittorrent", "transmission"],
+                        help="只检查指定的下载器类型")
+    args = parser.parse_args(argv)
+
+    shims.install()
+    logging.getLogger("moviepilot").setLevel("ERROR")
+    failed = []
+    for dl_type in args.dl_type or ["qbittorrent", "transmission"]:
+        runs, mismatched = run(dl_type, args.size, args.budget_calls, args.max_runs, args.page_size)
+        done = runs < args.max_runs or mismatched == 0
+        print(f"{dl_type:<14}种子 {args.size}，预算 {args.budget_calls} 次调用，运行 {runs} 次"
+              f"{'完成一轮' if done else '仍未完成'}，与完整扫描不一致 {mismatched} 个")
+        if mismatched or not done:
+            failed.append(dl_type)
+        mismatched = late_files(dl_type, args.size, args.page_size)
+        print(f"{dl_type:<14}种子 {args.size}，部分种子的文件列表在第二次运行前出现，与完整扫描不一致 {mismatched} 个")
+        if mismatched:
+            failed.append(f"{dl_type}(文件列表)")
+    if failed:
+        raise SystemExit(f"分批扫描未收敛: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
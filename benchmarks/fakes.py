@@ -0,0 +1,421 @@
+"""
+进程内的 qBittorrent / Transmission 下载器替身。
+
+实现自动标签、自动限速插件用到的下载器接口，写入会真实修改种子状态，
+每次调用按类型计数，并可按调用注入固定延迟。
+"""
+import hashlib
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+# 站点：(站点名, tracker 地址模板)，模板中的 {passkey} 会被替换
+SITES = [
+    ("馒头", "https://tracker.m-team.cc/announce.php?passkey={passkey}"),
+    ("憨憨", "https://tracker.hhanclub.top/announce.php?passkey={passkey}"),
+    ("观众", "https://t.audiences.me/announce.php?passkey={passkey}"),
+    ("朋友", "https://tracker.pterclub.com/announce.php?passkey={passkey}"),
+    ("猫站", "https://pterclub.com:8443/announce.php?passkey={passkey}"),
+    ("红叶", "https://tracker.hdsky.me/announce.php?passkey={passkey}"),
+    ("柠檬", "https://LEMONHD.org/announce.php?passkey={passkey}"),
+    ("天空", "http://Tracker.HDSky.Me:2710/announce?passkey={passkey}"),
+    ("北洋", "https://tracker.tjupt.org/announce.php?passkey={passkey}"),
+    ("春天", "https://springsunday.net/announce.php?passkey={passkey}"),
+    ("城市", "https://hdcity.city/trackerssl.php?passkey={passkey}"),
+    ("海胆", "https://tracker.haidan.video/announce.php?passkey={passkey}"),
+    ("聆音", "https://tracker.soulvoice.club/announce.php?passkey={passkey}"),
+    ("我堡", "https://tracker.ourbits.club/announce.php?passkey={passkey}"),
+    ("学校", "https://pt.btschool.club/announce.php?passkey={passkey}"),
+    ("麒麟", "https://www.hdkyl.in/announce.php?passkey={passkey}"),
+    ("织梦", "https://zmpt.cc/announce.php?passkey={passkey}"),
+    ("象站", "https://tracker.ptvicomo.net/announce.php?passkey={passkey}"),
+    ("蝴蝶", "udp://tracker.hudbt.hust.edu.cn:6969/announce"),
+    ("彩虹岛", "https://tracker.chdbits.co/announce.php?passkey={passkey}"),
+]
+# 公共 tracker，不对应任何站点
+PUBLIC_TRACKERS = [
+    "udp://tracker.opentrackr.org:1337/announce",
+    "udp://open.stealth.si:80/announce",
+    "http://tracker.openbittorrent.com:80/announce",
+]
+SAVE_PATHS = [
+    "/volume1/downloads/movies/",
+    "/volume1/downloads/tv/",
+    "/volume1/downloads/anime/",
+    "/volume1/保种/",
+    "/volume1/馒头保种/",
+    "/volume2/music/",
+    "/volume2/software/",
+    "/downloads/",
+    "/downloads/incomplete/",
+    "/mnt/media/4K/",
+]
+USER_TAGS = ["刷流", "收藏", "待删除", "H&R", "Keep", "keep"]
+EXTENSIONS = [".mkv", ".mp4", ".flac", ".iso", ".nfo", ".jpg", ".srt", ".ass", ".mp3", ".zip"]
+
+
+def _zipf_choice(rnd: random.Random, items: List[Any], s: float = 1.1) -> Any:
+    weights = [1 / (i + 1) ** s for i in range(len(items))]
+    return rnd.choices(items, weights=weights, k=1)[0]
+
+
+class CallCounter(Counter):
+    """按接口类型统计下载器调用次数，并模拟网络延迟"""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+
+    def hit(self, kind: str, num: int = 1):
+        self[kind] += num
+        if self.latency:
+            time.sleep(self.latency)
+
+    @property
+    def total(self) -> int:
+        return sum(self.values())
+
+    @property
+    def writes(self) -> int:
+        return sum(num for kind, num in self.items() if kind.startswith("write"))
+
+
+class TorrentSpec:
+    """与下载器无关的种子描述，用于生成两种下载器的替身种子"""
+
+    __slots__ = ("hash", "name", "save_path", "tags", "trackers", "tiers", "size", "category", "up_limit", "files")
+
+    def __init__(self, **kwargs):
+        for key in self.__slots__:
+            setattr(self, key, kwargs.get(key))
+        if self.tiers is None:
+            self.tiers = list(range(len(self.trackers or [])))
+        if self.files is None:
+            self.files = []
+
+
+def generate_library(size: int, seed: int = 0, tagged_ratio: float = 0.6, sites: List[Tuple[str, str]] = None,
+                     save_paths: List[str] = None) -> List[TorrentSpec]:
+    """
+    生成模拟的种子库：站点、保存路径按 Zipf 分布，部分种子已有站点标签或用户标签
+    """
+    rnd = random.Random(seed)
+    sites = sites or SITES
+    save_paths = save_paths or SAVE_PATHS
+    library = []
+    for i in range(size):
+        site_name, tracker = _zipf_choice(rnd, sites)
+        passkey = hashlib.md5(f"{seed}-{site_name}".encode()).hexdigest()
+        trackers = [tracker.format(passkey=passkey)]
+        if rnd.random() < 0.1:
+            trackers.extend(rnd.sample(PUBLIC_TRACKERS, k=rnd.randint(1, len(PUBLIC_TRACKERS))))
+        if rnd.random() < 0.05:
+            # 无法识别站点的种子
+            trackers = rnd.sample(PUBLIC_TRACKERS, k=1)
+        tags = []
+        if rnd.random() < tagged_ratio:
+            tags.append(site_name)
+        if rnd.random() < 0.2:
+            tags.append(rnd.choice(USER_TAGS))
+        files = []
+        for _ in range(rnd.randint(1, 12)):
+            files.append((f"file{len(files)}{_zipf_choice(rnd, EXTENSIONS)}", rnd.randint(1, 4 * 1024 ** 3)))
+        library.append(TorrentSpec(
+            hash=hashlib.sha1(f"{seed}-{i}".encode()).hexdigest(),
+            name=f"Some.Release.{i}.2160p.WEB-DL.H265-GROUP",
+            save_path=_zipf_choice(rnd, save_paths),
+            tags=tags,
+            trackers=trackers,
+            size=sum(file_size for _, file_size in files),
+            category=rnd.choice(["", "movie", "tv", "music"]),
+            up_limit=0 if rnd.random() < 0.8 else rnd.choice([0, 51200, 102400]),
+            files=files,
+        ))
+    return library
+
+
+def indexers_for(sites: List[Tuple[str, str]] = None) -> List[dict]:
+    """
+    站点索引，格式与 SitesHelper.get_indexers() 一致
+    """
+    indexers = []
+    for name, tracker in sites or SITES:
+        if tracker.startswith("udp://"):
+            continue
+        host = tracker.split("/")[2].split(":")[0].lower()
+        domain = ".".join(host.split(".")[-2:])
+        indexers.append({"id": domain, "name": name, "domain": f"https://{domain}/"})
+    return indexers
+
+
+def _as_list(ids: Union[str, Iterable[str], None]) -> Optional[List[str]]:
+    if ids is None:
+        return None
+    if isinstance(ids, str):
+        return [ids]
+    return list(ids)
+
+
+# ---------------------------------------------------------------- qBittorrent
+
+
+class QbTorrent(dict):
+    """qbittorrent-api TorrentDictionary 的替身，trackers 属性会触发一次接口调用"""
+
+    def __init__(self, client: "FakeQbClient", spec: TorrentSpec):
+        super().__init__(
+            hash=spec.hash,
+            name=spec.name,
+            save_path=spec.save_path,
+            tags=", ".join(spec.tags),
+            category=spec.category,
+            size=spec.size,
+            total_size=spec.size,
+            up_limit=spec.up_limit,
+            tracker=spec.trackers[0] if spec.trackers else "",
+            state="uploading",
+        )
+        self._client = client
+
+    def __getattr__(self, item: str) -> Any:
+        try:
+            return self[item]
+        except KeyError:
+            raise AttributeError(item)
+
+    @property
+    def trackers(self) -> List[dict]:
+        return self._client.torrents_trackers(torrent_hash=self["hash"])
+
+    @property
+    def files(self) -> List[dict]:
+        return self._client.torrents_files(torrent_hash=self["hash"])
+
+
+class FakeQbClient:
+    """qbittorrent-api Client 的替身"""
+
+    def __init__(self, library: List[TorrentSpec], calls: CallCounter):
+        self.calls = calls
+        self.specs: Dict[str, TorrentSpec] = {spec.hash: spec for spec in library}
+
+    def torrents_info(self, status_filter: str = None, torrent_hashes: Union[str, List[str]] = None,
+                      limit: int = None, offset: int = None, sort: str = None,
+                      **kwargs) -> List[QbTorrent]:
+        self.calls.hit("read:torrents_info")
+        specs = list(self.specs.values())
+        if sort:
+            specs.sort(key=lambda spec: getattr(spec, sort, ""))
+        hashes = _as_list(torrent_hashes)
+        if hashes is not None:
+            wanted = set(hashes)
+            specs = [spec for spec in specs if spec.hash in wanted]
+        start = offset or 0
+        end = start + limit if limit else None
+        return [QbTorrent(self, spec) for spec in specs[start:end]]
+
+    def torrents_trackers(self, torrent_hash: str) -> List[dict]:
+        self.calls.hit("read:torrents_trackers")
+        spec = self.specs[torrent_hash]
+        trackers = [{"url": "** [DHT] **", "tier": -1}, {"url": "** [PeX] **", "tier": -1}]
+        trackers.extend({"url": url, "tier": tier} for url, tier in zip(spec.trackers, spec.tiers))
+        return trackers
+
+    def torrents_files(self, torrent_hash: str) -> List[dict]:
+        self.calls.hit("read:torrents_files")
+        return [{"name": name, "size": size} for name, size in self.specs[torrent_hash].files]
+
+    def torrents_add_tags(self, tags: Union[str, List[str]], torrent_hashes: Union[str, List[str]]):
+        self.calls.hit("write:torrents_add_tags")
+        tags = [tag.strip() for tag in (tags.split(",") if isinstance(tags, str) else tags)]
+        for _hash in _as_list(torrent_hashes):
+            spec = self.specs[_hash]
+            spec.tags = spec.tags + [tag for tag in tags if tag not in spec.tags]
+
+    def torrents_remove_tags(self, tags: Union[str, List[str]] = None, torrent_hashes: Union[str, List[str]] = None):
+        self.calls.hit("write:torrents_remove_tags")
+        tags = [tag.strip() for tag in (tags.split(",") if isinstance(tags, str) else tags or [])]
+        for _hash in _as_list(torrent_hashes):
+            spec = self.specs[_hash]
+            spec.tags = [tag for tag in spec.tags if tags and tag not in tags]
+
+    def torrents_set_upload_limit(self, limit: int, torrent_hashes: Union[str, List[str]]):
+        self.calls.hit("write:torrents_set_upload_limit")
+        for _hash in _as_list(torrent_hashes):
+            self.specs[_hash].up_limit = limit
+
+    def transfer_set_upload_limit(self, limit: int):
+        self.calls.hit("write:transfer_set_upload_limit")
+
+
+class FakeQbittorrent:
+    """MoviePilot Qbittorrent 模块实例的替身"""
+
+    def __init__(self, library: List[TorrentSpec], latency: float = 0.0, calls: CallCounter = None):
+        self.calls = calls if calls is not None else CallCounter(latency)
+        self.qbc = FakeQbClient(library, self.calls)
+
+    def is_inactive(self) -> bool:
+        return False
+
+    def get_torrents(self, ids: Union[str, list] = None, status: str = None,
+                     tags: Union[str, list] = None) -> Tuple[List[QbTorrent], bool]:
+        return self.qbc.torrents_info(torrent_hashes=ids), False
+
+    def set_torrents_tag(self, ids: Union[str, list], tags: list) -> bool:
+        self.qbc.torrents_add_tags(tags=tags, torrent_hashes=ids)
+        return True
+
+    def set_speed_limit(self, download_limit: float = None, upload_limit: float = None) -> bool:
+        self.qbc.transfer_set_upload_limit(limit=upload_limit)
+        return True
+
+
+# ---------------------------------------------------------------- Transmission
+
+
+class TrTracker:
+    __slots__ = ("announce", "tier")
+
+    def __init__(self, announce: str, tier: int):
+        self.announce = announce
+        self.tier = tier
+
+
+class TrTorrent:
+    """transmission-rpc Torrent 的替身，只暴露请求的字段"""
+
+    def __init__(self, spec: TorrentSpec, fields: Optional[List[str]] = None):
+        self.fields = {
+            "hashString": spec.hash,
+            "name": spec.name,
+            "downloadDir": spec.save_path,
+            "labels": list(spec.tags),
+            "trackers": [{"announce": url, "tier": tier} for url, tier in zip(spec.trackers, spec.tiers)],
+            "totalSize": spec.size,
+            "uploadLimit": spec.up_limit or 0,
+            "uploadLimited": bool(spec.up_limit),
+            "status": "seeding",
+            "files": [{"name": name, "length": size} for name, size in spec.files],
+            "priorities": [0] * len(spec.files),
+            "wanted": [1] * len(spec.files),
+        }
+        if fields:
+            self.fields = {key: value for key, value in self.fields.items() if key in fields}
+
+    def _get(self, key: str) -> Any:
+        try:
+            return self.fields[key]
+        except KeyError:
+            raise KeyError(f"Field '{key}' not fetched")
+
+    @property
+    def hashString(self) -> str:
+        return self._get("hashString")
+
+    @property
+    def name(self) -> str:
+        return self._get("name")
+
+    @property
+    def download_dir(self) -> str:
+        return self._get("downloadDir")
+
+    @property
+    def labels(self) -> List[str]:
+        return self._get("labels")
+
+    @property
+    def trackers(self) -> List[TrTracker]:
+        return [TrTracker(item["announce"], item["tier"]) for item in self._get("trackers")]
+
+    @property
+    def total_size(self) -> int:
+        return self._get("totalSize")
+
+    @property
+    def upload_limit(self) -> int:
+        return self._get("uploadLimit")
+
+    @property
+    def upload_limited(self) -> bool:
+        return self._get("uploadLimited")
+
+    @property
+    def status(self) -> str:
+        return self._get("status")
+
+    def get_files(self) -> List[Any]:
+        # 与 transmission-rpc 4.x 一致，同时需要 files、priorities、wanted 字段
+        files, priorities, wanted = self._get("files"), self._get("priorities"), self._get("wanted")
+        return [type("File", (), {"name": item["name"], "size": item["length"], "priority": priority,
+                                  "selected": bool(selected)})()
+                for item, priority, selected in zip(files, priorities, wanted)]
+
+
+class FakeTrClient:
+    """transmission-rpc Client 的替身"""
+
+    def __init__(self, library: List[TorrentSpec], calls: CallCounter):
+        self.calls = calls
+        self.specs: Dict[str, TorrentSpec] = {spec.hash: spec for spec in library}
+        # 最近有活动的种子，"recently-active" 查询时返回
+        self.recently_active: set = set()
+
+    def get_torrents(self, ids: Union[str, List[str], None] = None,
+                     arguments: List[str] = None) -> List[TrTorrent]:
+        self.calls.hit("read:torrent_get")
+        if ids == "recently-active":
+            # 两次运行间隔远大于 Transmission 的活动窗口，读取后视为过期
+            specs = [self.specs[_hash] for _hash in self.recently_active]
+            self.recently_active.clear()
+        elif ids is not None:
+            specs = [self.specs[_hash] for _hash in _as_list(ids) if _hash in self.specs]
+        else:
+            specs = list(self.specs.values())
+        return [TrTorrent(spec, fields=arguments) for spec in specs]
+
+    def change_torrent(self, ids: Union[str, List[str]], labels: List[str] = None,
+                       upload_limit: int = None, upload_limited: bool = None, **kwargs):
+        self.calls.hit("write:torrent_set")
+        for _hash in _as_list(ids):
+            spec = self.specs[_hash]
+            if labels is not None:
+                spec.tags = list(labels)
+            if upload_limited is not None:
+                spec.up_limit = upload_limit if upload_limited else 0
+            self.recently_active.add(_hash)
+
+    def set_session(self, **kwargs):
+        self.calls.hit("write:session_set")
+
+
+class FakeTransmission:
+    """MoviePilot Transmission 模块实例的替身"""
+
+    def __init__(self, library: List[TorrentSpec], latency: float = 0.0, calls: CallCounter = None):
+        self.calls = calls if calls is not None else CallCounter(latency)
+        self.trc = FakeTrClient(library, self.calls)
+
+    def is_inactive(self) -> bool:
+        return False
+
+    def get_torrents(self, ids: Union[str, list] = None, status: str = None,
+                     tags: Union[str, list] = None) -> Tuple[List[TrTorrent], bool]:
+        return self.trc.get_torrents(ids=ids), False
+
+    def set_torrent_tag(self, ids: str, tags: list, org_tags: list = None) -> bool:
+        labels = list(dict.fromkeys((org_tags or []) + tags))
+        self.trc.change_torrent(ids=ids, labels=labels)
+        return True
+
+    def change_torrent(self, hash_string: Union[str, list], upload_limit: int = None, download_limit: int = None,
+                       ratio_limit: float = None, seeding_time_limit: int = None) -> bool:
+        self.trc.change_torrent(ids=hash_string, upload_limit=int(upload_limit or 0),
+                                upload_limited=bool(upload_limit))
+        return True
+
+    def set_speed_limit(self, download_limit: float = None, upload_limit: float = None) -> bool:
+        self.trc.set_session(speed_limit_up=upload_limit)
+        return True
@@ -0,0 +1,108 @@
+"""
+回放插件录制的样本并分析性能热点。
+
+在插件配置中勾选「录制样本」后，下一次运行会把获取到的种子、tracker 和站点索引
+脱敏保存到插件数据目录下的 capture-*.json.gz，用户提供该文件即可离线复现问题。
+
+用法（仓库根目录）::
+
+    python -m benchmarks.replay capture-tag-20261019120000.json.gz
+    python -m benchmarks.replay capture.json.gz --plugin limit --runs 2 --sort tottime --top 40
+"""
+import argparse
+import cProfile
+import importlib
+import io
+import logging
+import pstats
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import shims
+from .fakes import TorrentSpec
+from .run import Scenario, format_results, job_of, measure, setup
+
+
+def library_of(downloader: Dict[str, Any]) -> List[TorrentSpec]:
+    """
+    样本中的种子还原为下载器替身使用的种子描述，保留原始的标签顺序和tracker层级
+    """
+    library = []
+    for item in downloader.get("torrents") or []:
+        tags = item.get("tags")
+        if isinstance(tags, str):
+            tags = [tag.strip() for tag in tags.split(",") if tag.strip()]
+        library.append(TorrentSpec(
+            hash=item.get("hash"),
+            name=item.get("name"),
+            save_path=item.get("save_path"),
+            tags=tags or [],
+            trackers=[tracker[0] for tracker in item.get("trackers") or []],
+            tiers=[tracker[1] for tracker in item.get("trackers") or []],
+            size=item.get("size") or 0,
+            category=item.get("category") or "",
+            up_limit=item.get("up_limit") or 0,
+        ))
+    return library
+
+
+def load(file: str, plugin: str) -> Tuple[Scenario, Dict[str, Tuple[str, list]], list]:
+    """
+    读取样本，返回 (场景, 下载器种子库, 站点索引)
+    """
+    capture = importlib.import_module(f"app.plugins.{plugin}.capture")
+    data = capture.load_capture(file)
+    libraries = {item.get("name"): (item.get("type"), library_of(item)) for item in data.get("downloaders")}
+    configs = data.get("configs") or {}
+    overrides = {"downloaders": list(libraries), "capture": False, "onlyonce": False}
+    size = sum(len(library) for _, library in libraries.values())
+    dl_types = sorted({dl_type for dl_type, _ in libraries.values()})
+    scenario = Scenario("replay", plugin, "/".join(dl_types), size,
+                        tag_config={**(configs.get("Tag") or {}), **overrides},
+                        limit_config={**(configs.get("Limit") or {}), **overrides})
+    return scenario, libraries, data.get("indexers") or []
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="回放录制的样本并分析性能热点")
+    parser.add_argument("file", help="录制的样本文件 capture-*.json.gz")
+    parser.add_argument("--plugin", choices=["tag", "limit"], help="回放的插件，默认取样本录制时的插件")
+    parser.add_argument("--runs", type=int, default=1, help="连续运行次数，第二次起为写入后的稳定状态")
+    parser.add_argument("--latency", type=float, default=0.0, help="每次下载器调用的模拟延迟(毫秒)")
+    parser.add_argument("--sort", default="cumulative", help="性能分析排序字段，如 cumulative/tottime/ncalls")
+    parser.add_argument("--top", type=int, default=30, help="输出的函数数量")
+    parser.add_argument("--no-profile", action="store_true", help="只统计耗时和调用次数，不做性能分析")
+    parser.add_argument("--log-level", default="ERROR", help="插件日志级别，默认只输出错误")
+    args = parser.parse_args(argv)
+
+    shims.install()
+    logging.getLogger("moviepilot").setLevel(args.log_level.upper())
+    plugin_name = args.plugin
+    if not plugin_name:
+        shims.load_plugin("tag")
+        capture = importlib.import_module("app.plugins.tag.capture")
+        plugin_name = (capture.load_capture(args.file).get("plugin") or "Tag").lower()
+    shims.load_plugin(plugin_name)
+
+    scenario, libraries, indexers = load(args.file, plugin_name)
+    plugin, calls = setup(scenario, latency=args.latency / 1000, libraries=libraries, indexers=indexers)
+    results = []
+    for i in range(args.runs):
+        profiler = None if args.no_profile else cProfile.Profile()
+        func = job_of(plugin)
+        if profiler:
+            def func(job=func):
+                profiler.runcall(job)
+        result = measure(func, calls)
+        result.update(scenario=scenario.name, dl_type=scenario.dl_type, size=scenario.size,
+                      run="cold" if i == 0 else f"warm{i}")
+        results.append(result)
+        if profiler:
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats(args.sort).print_stats(args.top)
+            print(f"==== 第 {i + 1} 次运行 ====")
+            print(stream.getvalue())
+    print(format_results(results, verbose=True))
+
+
+if __name__ == "__main__":
+    main()
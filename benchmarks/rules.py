@@ -0,0 +1,128 @@
+"""
+自动标签插件规则引擎压测。
+
+生成大量名称、分类、保存路径、tracker 域名、大小混合的规则和模拟种子，
+分别用编译后的规则引擎和逐条判断的方式匹配，校验两者结果一致并输出耗时。
+
+用法（仓库根目录）::
+
+    python -m benchmarks.rules
+    python -m benchmarks.rules --rules 500 --torrents 50000
+"""
+import argparse
+import importlib
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from . import shims
+from .fakes import SAVE_PATHS, SITES, generate_library
+
+WORDS = ["Alpha", "Blue", "City", "Dawn", "Echo", "Frost", "Gold", "Harbor", "Iron", "Jade", "King", "Lost",
+         "Moon", "Night", "Ocean", "Prime", "Quiet", "River", "Storm", "Tide", "Under", "Valley", "Wild", "Zero"]
+SOURCES = ["WEB-DL", "BluRay", "Remux", "HDTV", "WEBRip"]
+RESOLUTIONS = ["2160p", "1080p", "720p"]
+CODECS = ["H264", "H265", "x264", "x265", "AV1"]
+GROUPS = ["CHD", "HDS", "WiKi", "FRDS", "MTeam", "OurTV", "HHWEB", "ADWeb", "PTer", "NTb", "FLUX", "CMCT"]
+CATEGORIES = ["", "movie", "tv", "music", "anime", "doc"]
+
+
+def release_name(rnd: random.Random) -> str:
+    title = ".".join(rnd.sample(WORDS, k=rnd.randint(1, 3)))
+    episode = f".S{rnd.randint(1, 12):02d}" if rnd.random() < 0.4 else ""
+    return f"{title}{episode}.{rnd.randint(1990, 2025)}.{rnd.choice(RESOLUTIONS)}.{rnd.choice(SOURCES)}." \
+           f"{rnd.choice(CODECS)}-{rnd.choice(GROUPS)}"
+
+
+def generate_rules(count: int, seed: int = 0) -> str:
+    """
+    生成混合规则，多数规则只命中少量种子，匹配时需要越过大部分规则
+    """
+    rnd = random.Random(seed)
+    domains = sorted({SITES[i][1].split("/")[2].split(":")[0].lower() for i in range(len(SITES))})
+    lines = []
+    for i in range(count):
+        kind = i % 10
+        label = f"L{i}"
+        if kind == 0:
+            cond = f"name:{rnd.choice(WORDS)}.{rnd.choice(WORDS)}.S{rnd.randint(1, 12):02d}"
+        elif kind == 1:
+            cond = f"name:re:(?i)^{rnd.choice(WORDS).lower()}\\..*{rnd.choice(RESOLUTIONS)}.*-{rnd.choice(GROUPS)}$" \
+                if i % 20 == 1 else f"name:re:{rnd.choice(WORDS)}\\.{rnd.randint(1990, 2025)}\\."
+        elif kind == 2:
+            cond = f"name:glob:*.{rnd.randint(1990, 2025)}.{rnd.choice(RESOLUTIONS)}.*-{rnd.choice(GROUPS)}"
+        elif kind == 3:
+            cond = f"path:glob:{rnd.choice(SAVE_PATHS).rstrip('/')}*/{rnd.choice(WORDS)} & name:-{rnd.choice(GROUPS)}"
+        elif kind == 4:
+            cond = f"category:{rnd.choice(CATEGORIES[1:])} & name:.{rnd.randint(1990, 2025)}.{rnd.choice(RESOLUTIONS)}"
+        elif kind == 5:
+            cond = f"tracker:{rnd.choice(domains)} & size:<{rnd.randint(1, 200)}M"
+        elif kind == 6:
+            cond = f"tracker:glob:*.{rnd.choice(domains).split('.')[-1]} & name:re:{rnd.choice(CODECS)}-" \
+                   f"{rnd.choice(GROUPS)}$"
+        elif kind == 7:
+            low = rnd.randint(1, 40)
+            cond = f"size:{low}G-{low}.{rnd.randint(1, 9)}G & name:{rnd.choice(SOURCES)}.{rnd.choice(CODECS)}"
+        elif kind == 8:
+            cond = f"name:re:S(?:0[1-9]|1[0-2])\\.{rnd.randint(1990, 2025)}\\..*-{rnd.choice(GROUPS)}"
+        else:
+            cond = f"name:{rnd.choice(WORDS)}.{rnd.choice(WORDS)}.{rnd.choice(WORDS)}.{rnd.randint(1990, 2025)}"
+        lines.append(f"{cond} => {label}")
+    return "\n".join(lines)
+
+
+def generate_values(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    record = importlib.import_module("app.plugins.tag.record")
+    rnd = random.Random(seed)
+    values = []
+    for spec in generate_library(count, seed=seed):
+        values.append({
+            "name": release_name(rnd),
+            "category": rnd.choice(CATEGORIES),
+            "path": f"{spec.save_path.rstrip('/')}/{rnd.choice(WORDS)}",
+            "tracker": [record.tracker_domain(url) for url in spec.trackers],
+            "size": spec.size,
+        })
+    return values
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="自动标签插件规则引擎压测")
+    parser.add_argument("--rules", type=int, default=500, help="规则数量")
+    parser.add_argument("--torrents", type=int, default=50000, help="种子数量")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args(argv)
+
+    shims.install()
+    shims.load_plugin("tag")
+    rules_mod = importlib.import_module("app.plugins.tag.rules")
+
+    start = time.perf_counter()
+    rules, errors = rules_mod.parse_rules(generate_rules(args.rules, seed=args.seed))
+    engine = rules_mod.RuleEngine(rules)
+    compile_time = time.perf_counter() - start
+    if errors:
+        raise SystemExit("无法解析的规则:\n" + "\n".join(errors))
+    values = generate_values(args.torrents, seed=args.seed)
+
+    start = time.perf_counter()
+    linear = [next((rule for rule in rules if rule.test(item)), None) for item in values]
+    linear_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compiled = [engine.match(item) for item in values]
+    compiled_time = time.perf_counter() - start
+
+    mismatched = sum(1 for a, b in zip(linear, compiled) if a is not b)
+    matched = sum(1 for rule in compiled if rule)
+    summary = engine.summary()
+    print(f"规则 {len(rules)} 条（合并正则 {summary['combined']}，完全匹配 {summary['exact']}，"
+          f"逐条判断 {summary['scan']}），编译 {compile_time * 1000:.1f} ms")
+    print(f"种子 {len(values)} 个，命中 {matched} 个")
+    print(f"逐条判断 {linear_time:.3f} s，编译后 {compiled_time:.3f} s，加速 {linear_time / compiled_time:.1f} 倍")
+    if mismatched:
+        raise SystemExit(f"{mismatched} 个种子的匹配结果与逐条判断不一致")
+
+
+if __name__ == "__main__":
+    main()
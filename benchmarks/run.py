@@ -0,0 +1,192 @@
+"""
+自动标签 / 自动限速插件离线压测。
+
+用进程内的下载器替身生成模拟种子库，依次执行插件的扫描任务，
+统计每个场景的耗时、下载器接口调用次数和内存峰值，不需要 MoviePilot 和网络。
+
+用法（仓库根目录）::
+
+    python -m benchmarks.run
+    python -m benchmarks.run --sizes 1000,10000,100000 --latency 2 --output bench_output.txt
+"""
+import argparse
+import gc
+import logging
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import shims
+from .fakes import CallCounter, FakeQbittorrent, FakeTransmission, generate_library, indexers_for
+
+DEFAULT_SIZES = [1000, 10000]
+
+TAG_CONFIG = {
+    "enabled": True,
+    "interval": "禁用",
+    "downloaders": ["bench"],
+    "tracker_map": "hudbt:蝴蝶",
+    "save_path_map": "/volume1/馒头保种/:馒头保种\n/volume1/保种/:保种",
+}
+LIMIT_CONFIG = {
+    "enabled": True,
+    "interval": "禁用",
+    "downloaders": ["bench"],
+    "tag_map": "馒头:1024\n憨憨:2048\n保种:512",
+}
+
+
+class Scenario:
+    def __init__(self, name: str, plugin: str, dl_type: str, size: int, runs: int = 2,
+                 tag_config: dict = None, limit_config: dict = None):
+        self.name = name
+        self.plugin = plugin
+        self.dl_type = dl_type
+        self.size = size
+        self.runs = runs
+        self.tag_config = {**TAG_CONFIG, **(tag_config or {})}
+        self.limit_config = {**LIMIT_CONFIG, **(limit_config or {})}
+
+
+def default_scenarios(sizes: List[int]) -> List[Scenario]:
+    scenarios = []
+    for size in sizes:
+        for dl_type in ("qbittorrent", "transmission"):
+            scenarios.append(Scenario("tag", "tag", dl_type, size))
+            scenarios.append(Scenario("limit", "limit", dl_type, size))
+            # 按站点限速：没有限速标签的种子按 tracker 识别站点，站点查询按域名缓存
+            scenarios.append(Scenario("sitelimit", "limit", dl_type, size, limit_config={"site_limit": True}))
+            scenarios.append(Scenario("pipeline", "tag", dl_type, size, tag_config={"pipeline": True}))
+            # 分批扫描：每次最多 1000 次接口调用，多次运行逐步完成整个种子库
+            scenarios.append(Scenario("budget", "tag", dl_type, size, runs=4, tag_config={"budget_calls": 1000}))
+            # 共享快照：有效期内再次运行不读取下载器
+            scenarios.append(Scenario("snapshot", "tag", dl_type, size, tag_config={"snapshot_ttl": "600"}))
+            # 按文件构成贴标签：首次运行读取文件列表，之后使用持久缓存
+            scenarios.append(Scenario("content", "tag", dl_type, size,
+                                      tag_config={"content_map": "iso:软件\nflac,mp3>50:音乐"}))
+        # 分页读取只对 qBittorrent 生效：内存峰值降低，读取请求按页增加
+        scenarios.append(Scenario("paged", "tag", "qbittorrent", size, tag_config={"page_size": "1000"}))
+        # 增量扫描只对 Transmission 生效
+        scenarios.append(Scenario("incr", "tag", "transmission", size, runs=3, tag_config={"incremental": True}))
+    return scenarios
+
+
+def make_downloader(dl_type: str, library: list, calls: CallCounter):
+    if dl_type == "qbittorrent":
+        return FakeQbittorrent(library, calls=calls)
+    return FakeTransmission(library, calls=calls)
+
+
+def setup(scenario: Scenario, latency: float, libraries: Dict[str, Tuple[str, list]] = None,
+          indexers: list = None) -> Tuple[Any, CallCounter]:
+    """
+    注册下载器替身并初始化插件，返回 (插件实例, 调用计数)
+
+    :param libraries: 下载器名称 -> (下载器类型, 种子库)，缺省时生成一个名为 bench 的下载器
+    """
+    shims.install()
+    calls = CallCounter(latency)
+    libraries = libraries or {"bench": (scenario.dl_type, generate_library(scenario.size))}
+    shims.REGISTRY["services"] = {
+        name: shims.ServiceInfo(name=name, instance=make_downloader(dl_type, library, calls), type=dl_type)
+        for name, (dl_type, library) in libraries.items()
+    }
+    shims.REGISTRY["indexers"] = indexers if indexers is not None else indexers_for()
+    shims.REGISTRY["configs"] = {}
+    shims.REGISTRY["site_calls"] = 0
+    plugins = {}
+    for name, overrides in (("tag", scenario.tag_config), ("limit", scenario.limit_config)):
+        module = shims.load_plugin(name)
+        plugin_cls = getattr(module, name.capitalize())
+        plugin = plugin_cls()
+        plugin.init_plugin()
+        # 以插件表单的默认值为基础，与 MoviePilot 保存的配置结构一致
+        config = {**plugin.get_form()[1], **overrides}
+        shims.REGISTRY["configs"][plugin_cls.__name__] = config
+        plugins[name] = plugin
+    for name, plugin in plugins.items():
+        plugin.init_plugin(dict(shims.REGISTRY["configs"][plugin.__class__.__name__]))
+    return plugins[scenario.plugin], calls
+
+
+def job_of(plugin: Any) -> Callable[[], Any]:
+    return plugin._complemented_tags if plugin.__class__.__name__ == "Tag" else plugin._complete_limit
+
+
+def measure(func: Callable[[], Any], calls: CallCounter) -> Dict[str, Any]:
+    """
+    执行一次任务，记录耗时、调用次数和内存峰值
+    """
+    calls.clear()
+    shims.REGISTRY["site_calls"] = 0
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    wall = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "wall": wall,
+        "calls": calls.total,
+        "writes": calls.writes,
+        "site_calls": shims.REGISTRY["site_calls"],
+        "peak_mb": peak / 1024 / 1024,
+        "by_kind": dict(calls),
+    }
+
+
+def run_scenario(scenario: Scenario, latency: float = 0.0) -> List[Dict[str, Any]]:
+    plugin, calls = setup(scenario, latency)
+    results = []
+    for i in range(scenario.runs):
+        result = measure(job_of(plugin), calls)
+        result.update(scenario=scenario.name, dl_type=scenario.dl_type, size=scenario.size,
+                      run="cold" if i == 0 else f"warm{i}")
+        results.append(result)
+    return results
+
+
+def format_results(results: List[Dict[str, Any]], verbose: bool = False) -> str:
+    header = f"{'scenario':<10}{'downloader':<14}{'size':>8}  {'run':<6}{'wall(s)':>9}{'calls':>9}" \
+             f"{'writes':>8}{'site':>8}{'peak(MB)':>10}"
+    lines = [header, "-" * len(header)]
+    for item in results:
+        lines.append(f"{item['scenario']:<10}{item['dl_type']:<14}{item['size']:>8}  {item['run']:<6}"
+                     f"{item['wall']:>9.3f}{item['calls']:>9}{item['writes']:>8}{item['site_calls']:>8}"
+                     f"{item['peak_mb']:>10.1f}")
+        if verbose:
+            for kind, num in sorted(item["by_kind"].items()):
+                lines.append(f"{'':>12}{kind:<40}{num:>8}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="自动标签/自动限速插件离线压测")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="种子数量，逗号分隔，如 1000,10000,100000")
+    parser.add_argument("--latency", type=float, default=0.0, help="每次下载器调用的模拟延迟(毫秒)")
+    parser.add_argument("--scenario", action="append", help="只运行指定场景：tag/limit/sitelimit/pipeline/budget/snapshot/content/paged/incr")
+    parser.add_argument("--verbose", action="store_true", help="输出各接口的调用次数")
+    parser.add_argument("--log-level", default="ERROR", help="插件日志级别，默认只输出错误")
+    parser.add_argument("--output", help="同时写入结果文件")
+    args = parser.parse_args(argv)
+
+    shims.install()
+    logging.getLogger("moviepilot").setLevel(args.log_level.upper())
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    results = []
+    for scenario in default_scenarios(sizes):
+        if args.scenario and scenario.name not in args.scenario:
+            continue
+        results.extend(run_scenario(scenario, latency=args.latency / 1000))
+    report = format_results(results, verbose=args.verbose)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+检查自动标签、自动限速插件共用的模块是否一致。
+
+两个插件在插件市场中分别安装，不能互相导入，共用的模块（两个插件目录中同名的文件，
+__init__.py 除外）在两个目录中各有一份。自动标签插件中的文件为准，修改后用 --sync 复制到自动限速插件。
+
+用法（仓库根目录）::
+
+    python -m benchmarks.shared
+    python -m benchmarks.shared --sync
+"""
+import argparse
+import filecmp
+import shutil
+from pathlib import Path
+from typing import List, Optional
+
+PLUGINS = Path(__file__).resolve().parent.parent / "plugins.v2"
+SOURCE, TARGET = PLUGINS / "tag", PLUGINS / "limit"
+
+
+def shared_modules() -> List[str]:
+    return sorted(path.name for path in SOURCE.glob("*.py")
+                  if path.name != "__init__.py" and (TARGET / path.name).exists())
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="检查自动标签、自动限速插件共用的模块是否一致")
+    parser.add_argument("--sync", action="store_true", help="将自动标签插件中的共用模块复制到自动限速插件")
+    args = parser.parse_args(argv)
+
+    differ = [name for name in shared_modules() if not filecmp.cmp(SOURCE / name, TARGET / name, shallow=False)]
+    if args.sync:
+        for name in differ:
+            shutil.copyfile(SOURCE / name, TARGET / name)
+            print(f"已同步 {name}")
+        return
+    print(f"共用模块 {len(shared_modules())} 个: {', '.join(shared_modules())}")
+    if differ:
+        raise SystemExit(f"以下模块不一致，请以自动标签插件为准用 --sync 同步: {', '.join(differ)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+MoviePilot 运行环境的最小替身，使插件可以脱离 MoviePilot 在本地加载和压测。
+
+仅在无法导入真正的 ``app`` 包时才会注入，只实现插件实际用到的接口。
+"""
+import importlib.util
+import logging
+import sys
+import tempfile
+import types
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+PLUGIN_ROOT = Path(__file__).resolve().parent.parent / "plugins.v2"
+
+# 压测时由场景注入的下载器与站点
+REGISTRY: Dict[str, Any] = {
+    "services": {},
+    "indexers": [],
+    "configs": {},
+    "site_calls": 0,
+}
+
+
+@dataclass
+class ServiceInfo:
+    name: Optional[str] = None
+    instance: Any = None
+    module: Any = None
+    type: Optional[str] = None
+    config: Any = None
+
+
+@dataclass
+class DownloaderConf:
+    name: str
+    type: str
+
+
+class SitesHelper:
+    def get_indexers(self) -> List[dict]:
+        REGISTRY["site_calls"] += 1
+        return list(REGISTRY["indexers"])
+
+    def get_indexer(self, url: str) -> Optional[dict]:
+        REGISTRY["site_calls"] += 1
+        return self._domains().get(url)
+
+    @staticmethod
+    def _domains() -> Dict[str, dict]:
+        # 索引按域名缓存，避免替身自身的开销混入性能分析结果
+        indexers = REGISTRY["indexers"]
+        cache = REGISTRY.get("_indexer_domains")
+        if not cache or cache[0] is not indexers:
+            domains = {}
+            for indexer in indexers:
+                for domain in [indexer.get("domain")] + list(indexer.get("ext_domains") or []):
+                    domains.setdefault(StringUtils.get_url_domain(domain), indexer)
+            cache = REGISTRY["_indexer_domains"] = (indexers, domains)
+        return cache[1]
+
+
+class DownloaderHelper:
+    def get_services(self, name_filters: List[str] = None, type_filter: str = None) -> Dict[str, ServiceInfo]:
+        return {name: service for name, service in REGISTRY["services"].items()
+                if not name_filters or name in name_filters}
+
+    def get_configs(self) -> Dict[str, DownloaderConf]:
+        return {name: DownloaderConf(name=name, type=service.type)
+                for name, service in REGISTRY["services"].items()}
+
+
+class StringUtils:
+    @staticmethod
+    def get_url_domain(url: str) -> str:
+        """与 MoviePilot 一致：域名不超过三段时取主域名"""
+        if not url:
+            return ""
+        if "u2.dmhy.org" in url:
+            return "u2.dmhy.org"
+        netloc = urlparse(url if "://" in url else f"http://{url}").hostname or ""
+        locs = netloc.split(".")
+        if len(locs) > 3:
+            return netloc
+        return ".".join(locs[-2:])
+
+
+class _PluginBase:
+    def __init__(self):
+        self._data: Dict[str, Any] = {}
+        self._data_path = Path(tempfile.mkdtemp(prefix="mp-bench-"))
+
+    def get_config(self, plugin_id: str = None) -> Any:
+        return REGISTRY["configs"].get(plugin_id or self.__class__.__name__)
+
+    def update_config(self, config: dict, plugin_id: str = None) -> bool:
+        REGISTRY["configs"][plugin_id or self.__class__.__name__] = config
+        return True
+
+    def save_data(self, key: str, value: Any, plugin_id: str = None):
+        self._data[key] = value
+
+    def get_data(self, key: str = None, plugin_id: str = None) -> Any:
+        return self._data.get(key)
+
+    def del_data(self, key: str, plugin_id: str = None) -> Any:
+        return self._data.pop(key, None)
+
+    def get_data_path(self, plugin_id: str = None) -> Path:
+        return self._data_path
+
+
+class _Settings:
+    TZ = "Asia/Shanghai"
+    API_TOKEN = "moviepilot"
+
+
+class _Scheduler:
+    """定时器替身，压测中不需要真正调度"""
+
+    def __init__(self, *args, **kwargs):
+        self.running = False
+        self._jobs = []
+
+    def add_job(self, *args, **kwargs):
+        self._jobs.append((args, kwargs))
+
+    def get_jobs(self):
+        return self._jobs
+
+    def print_jobs(self):
+        pass
+
+    def start(self):
+        self.running = True
+
+    def remove_all_jobs(self):
+        self._jobs = []
+
+    def shutdown(self, *args, **kwargs):
+        self.running = False
+
+
+class _CronTrigger:
+    @staticmethod
+    def from_crontab(expr: str, timezone: Any = None):
+        return expr
+
+
+def _module(name: str, **attrs) -> types.ModuleType:
+    module = sys.modules.get(name) or types.ModuleType(name)
+    module.__dict__.update(attrs)
+    module.__path__ = getattr(module, "__path__", [])
+    sys.modules[name] = module
+    return module
+
+
+def install():
+    """
+    注入 MoviePilot 替身模块，已安装 MoviePilot 时不做任何事
+    """
+    try:
+        import app.plugins  # noqa: F401
+        return
+    except ImportError:
+        pass
+    logger = logging.getLogger("moviepilot")
+    logger.warn = logger.warning
+    _module("app")
+    _module("app.log", logger=logger)
+    _module("app.core")
+    _module("app.core.config", settings=_Settings())
+    _module("app.helper")
+    _module("app.helper.sites", SitesHelper=SitesHelper)
+    _module("app.helper.downloader", DownloaderHelper=DownloaderHelper)
+    _module("app.plugins", _PluginBase=_PluginBase)
+    _module("app.schemas", ServiceInfo=ServiceInfo, Response=dict)
+    _module("app.utils")
+    _module("app.utils.string", StringUtils=StringUtils)
+    for name in ["pytz", "apscheduler", "apscheduler.schedulers", "apscheduler.triggers"]:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            _module(name)
+    sys.modules["pytz"].__dict__.setdefault("timezone", lambda tz: None)
+    _module("apscheduler.schedulers.background", BackgroundScheduler=_Scheduler)
+    _module("apscheduler.triggers.cron", CronTrigger=_CronTrigger)
+
+
+def load_plugin(name: str) -> types.ModuleType:
+    """
+    以 app.plugins.<name> 包的形式加载插件，插件内的相对导入可以正常使用
+    """
+    install()
+    module_name = f"app.plugins.{name}"
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    package_dir = PLUGIN_ROOT / name
+    spec = importlib.util.spec_from_file_location(module_name, package_dir / "__init__.py",
+                                                  submodule_search_locations=[str(package_dir)])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
@@ -1,10 +1,12 @@
+import re
 import threading
-from queue import Queue
-from time import time, sleep
+from hashlib import md5
+from time import time
 from typing import Any, List, Dict, Tuple
 
 
 from app import schemas
+from app.core.config import settings
 from app.log import logger
 from pydantic import BaseModel
 from app.plugins import _PluginBase
@@ -12,6 +14,10 @@ from app.utils.http import RequestUtils
 from app.core.event import eventmanager, Event
 from app.schemas.types import EventType, NotificationType
 
+from .dedup import MessageDeduplicator
+from .endpoint import Endpoint
+from .metrics import DeliveryMetrics
+
 class NotifyRequest(BaseModel):
     title: str
     text: str
@@ -24,7 +30,7 @@ class HA(_PluginBase):
     # 插件图标
     plugin_icon = "https://github.com/aClarkChen/MoviePilot-Plugins/blob/main/icons/ha.png?raw=true"
     # 插件版本
-    plugin_version = "1.0.6"
+    plugin_version = "1.4.5"
     # 插件作者
     plugin_author = "ClarkChen"
     # 作者主页
@@ -42,30 +48,77 @@ class HA(_PluginBase):
     _notify = False
     _get_dir = ""
     _msg_type = []
+    _publish = False
+    _ha_host = ""
+    _ha_token = ""
+    _publish_interval = 30
+    _deadband = 0
+    _dedup_window = 60
+    _downloader_helper = None
+
+    _extra_dirs = ""
 
-    # 消息处理线程
+    # 消息分发线程
     processing_thread = None
-    # 上次发送时间
-    last_send_time = 0
-    # 消息队列
-    message_queue = Queue()
+    # 消息接收地址，每个地址独立队列和发送线程
+    _endpoints: List[Endpoint] = []
     # 消息发送间隔（秒）
     send_interval = 5
+    # 停止服务时等待各地址发完剩余消息的最长时间（秒）
+    drain_timeout = 10
+    # 消息发送指标，重载配置后保留
+    _metrics = DeliveryMetrics()
     # 退出事件
     __event = threading.Event()
+    # 重复消息合并
+    _deduplicator = MessageDeduplicator()
+    # 已推送到HA的实体状态
+    _published_states: Dict[str, Any] = {}
 
     def init_plugin(self, config: dict = None):
+        # 停止现有线程，原地址剩余的消息在后台发送，保存配置时不等待
+        self.stop_service(wait=False)
         if config:
             self._enabled = config.get("enabled")
             self._notify = config.get("notify")
             self._get_dir = config.get("get_dir")
             self._msg_type = config.get("msg_type") or []
+            self._extra_dirs = config.get("extra_dirs") or ""
+            self._publish = config.get("publish")
+            self._ha_host = (config.get("ha_host") or "").rstrip("/")
+            self._ha_token = config.get("ha_token") or ""
+            self._publish_interval = max(self.str_to_number(config.get("publish_interval"), 30), 5)
+            self._deadband = max(self.str_to_number(config.get("deadband"), 0), 0)
+            self._dedup_window = max(self.str_to_number(config.get("dedup_window"), 60), 0)
+            self._deduplicator = MessageDeduplicator(window=self._dedup_window)
+            # 配置变更后全部实体重新推送一次
+            self._published_states = {}
 
-            if self._enabled and self._get_dir:
-                # 启动处理队列的后台线程
-                self.processing_thread = threading.Thread(target=self.process_queue)
-                self.processing_thread.daemon = True
-                self.processing_thread.start()
+            if self._enabled:
+                self._endpoints = []
+                if self._get_dir:
+                    self._endpoints.append(Endpoint(url=self._get_dir, msg_types=self._msg_type,
+                                                    send_interval=self.send_interval, log_tag=self.LOG_TAG,
+                                                    metrics=self._metrics))
+                self._endpoints.extend(Endpoint.parse(self._extra_dirs, send_interval=self.send_interval,
+                                                      log_tag=self.LOG_TAG, metrics=self._metrics))
+                if self._endpoints:
+                    # 每个地址启动独立的发送线程，慢地址不会阻塞其它地址
+                    for endpoint in self._endpoints:
+                        endpoint.start()
+                    self.processing_thread = threading.Thread(target=self.dispatch_loop)
+                    self.processing_thread.daemon = True
+                    self.processing_thread.start()
+
+    @property
+    def downloader_helper(self):
+        """
+        下载器帮助类，首次使用时创建
+        """
+        if self._downloader_helper is None:
+            from app.helper.downloader import DownloaderHelper
+            self._downloader_helper = DownloaderHelper()
+        return self._downloader_helper
 
     def get_state(self) -> bool:
         return self._enabled
@@ -74,6 +127,13 @@ class HA(_PluginBase):
     def get_command() -> List[Dict[str, Any]]:
         pass
 
+    @staticmethod
+    def str_to_number(s: str, i: int) -> int:
+        try:
+            return int(s)
+        except (ValueError, TypeError):
+            return i
+
     def get_api(self) -> List[Dict[str, Any]]:
         return [{
             "path": "/webhook",
@@ -81,8 +141,52 @@ class HA(_PluginBase):
             "methods": ["POST"],
             "summary": "HA的webhook",
             "description": "接受HA的webhook通知并推送",
+        }, {
+            "path": "/metrics",
+            "endpoint": self.metrics,
+            "methods": ["GET"],
+            "summary": "消息队列指标",
+            "description": "查询各地址的队列深度、最早消息等待时间、按类型的发送统计和发送延迟分位数",
         }]
 
+    def metrics(self, apikey: str) -> schemas.Response:
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        return schemas.Response(success=True, data=self._get_metrics())
+
+    def _get_metrics(self) -> Dict[str, Any]:
+        endpoints = [endpoint.status() for endpoint in self._endpoints]
+        return {
+            "depth": sum(endpoint.get("depth") for endpoint in endpoints),
+            "oldest_age": max([endpoint.get("oldest_age") for endpoint in endpoints] or [0]),
+            "endpoints": endpoints,
+            "types": self._metrics.counters(),
+            "latency": self._metrics.percentiles()
+        }
+
+    def get_service(self) -> List[Dict[str, Any]]:
+        """
+        注册插件公共服务
+        [{
+            "id": "服务ID",
+            "name": "服务名称",
+            "trigger": "触发器：cron/interval/date/CronTrigger.from_crontab()",
+            "func": self.xxx,
+            "kwargs": {} # 定时器参数
+        }]
+        """
+        if self._enabled and self._publish and self._ha_host and self._ha_token:
+            return [{
+                "id": "HAPublish",
+                "name": "推送下载器统计到HA",
+                "trigger": "interval",
+                "func": self.publish_states,
+                "kwargs": {
+                    "seconds": self._publish_interval
+                }
+            }]
+        return []
+
     def post(self, request: NotifyRequest) -> schemas.Response:
         title = request.title
         text = request.text
@@ -100,46 +204,156 @@ class HA(_PluginBase):
         if not msg_body.get("title") and not msg_body.get("text"):
             logger.warn("标题和内容不能同时为空")
             return
-        self.message_queue.put(msg_body)
-        logger.info("消息已加入队列等待发送")
-
-    def process_queue(self):
-        while True:
-            if self.__event.is_set():
-                logger.info("消息发送线程正在退出...")
-                break
-            # 获取队列中的下一条消息
-            msg_body = self.message_queue.get()
-            # 检查是否满足发送间隔时间
-            current_time = time()
-            time_since_last_send = current_time - self.last_send_time
-            if time_since_last_send < self.send_interval:
-                sleep(self.send_interval - time_since_last_send)
-
-            # 处理消息内容
-            channel = msg_body.get("channel")
-            if channel:
-                continue
+        if msg_body.get("channel"):
+            return
+        accepted = self._deduplicator.accept(msg_body)
+        # 先补发被替换或淘汰的消息的合并消息，保持先后顺序
+        self._flush_duplicates()
+        if not accepted:
+            self._metrics.count(msg_body, "folded")
+            logger.debug("重复消息已合并，窗口结束后统一发送")
+            return
+        self._dispatch(msg_body)
+
+    def _dispatch(self, msg_body: dict):
+        """
+        将消息分发到所有接收该类型消息的地址队列
+        """
+        endpoints = [endpoint for endpoint in self._endpoints if endpoint.accepts(msg_body)]
+        if not endpoints:
             msg_type: NotificationType = msg_body.get("type")
-            # 检查消息类型是否已启用
-            if msg_type and self._msg_type and msg_type.name not in self._msg_type:
-                logger.info(f"消息类型 {msg_type.value} 未开启消息发送")
+            logger.info(f"消息类型 {msg_type.value if msg_type else ''} 未开启消息发送")
+            self._metrics.count(msg_body, "dropped")
+            return
+        for endpoint in endpoints:
+            endpoint.put(msg_body)
+        logger.info(f"消息已加入 {len(endpoints)} 个地址的队列等待发送")
+
+    def _flush_duplicates(self, force: bool = False):
+        """
+        去重窗口结束后，将重复消息合并为一条加入队列
+        """
+        for msg_body in self._deduplicator.flush(force=force):
+            self._dispatch(msg_body)
+
+    def dispatch_loop(self):
+        """
+        定时检查去重窗口，窗口结束后补发合并消息
+        """
+        while not self.__event.wait(1):
+            self._flush_duplicates()
+        logger.info("消息分发线程正在退出...")
+
+    def publish_states(self):
+        """
+        汇总下载器统计并以实体状态推送到HA，只推送超出死区的变化
+        """
+        if not self._publish or not self._ha_host or not self._ha_token:
+            return
+        states = self._collect_states()
+        if not states:
+            return
+        headers = {
+            "Authorization": f"Bearer {self._ha_token}",
+            "Content-Type": "application/json"
+        }
+        for entity_id, (value, attributes) in states.items():
+            if not self._state_changed(entity_id, value):
                 continue
-            data = {"title": msg_body.get("title"), "text": msg_body.get("text")}
-            # 尝试发送消息
             try:
-                res = RequestUtils().post_res(url=self._get_dir, data=data)
-                if res and res.status_code == 200:
-                    logger.info("HA消息发送成功")
-                    self.last_send_time = time()
+                res = RequestUtils(headers=headers).post_res(url=f"{self._ha_host}/api/states/{entity_id}",
+                                                             json={"state": value, "attributes": attributes})
+                if res is not None and res.status_code in (200, 201):
+                    self._published_states[entity_id] = value
                 elif res is not None:
-                    logger.warn(f"HA消息发送失败，错误码：{res.status_code}，错误原因：{res.reason}")
+                    logger.warn(f"{self.LOG_TAG}推送实体 {entity_id} 失败，错误码：{res.status_code}，错误原因：{res.reason}")
                 else:
-                    logger.warn("HA消息发送失败，未获取到返回信息")
-            except Exception as msg_e:
-                logger.error(f"HA消息发送失败，{str(msg_e)}")
-            # 标记任务完成
-            self.message_queue.task_done()
+                    logger.warn(f"{self.LOG_TAG}推送实体 {entity_id} 失败，未获取到返回信息")
+            except Exception as e:
+                logger.error(f"{self.LOG_TAG}推送实体 {entity_id} 失败，{str(e)}")
+
+    def _state_changed(self, entity_id: str, value: Any) -> bool:
+        """
+        判断实体状态是否需要推送，速度类实体变化不超过死区时不推送
+        """
+        if entity_id not in self._published_states:
+            return True
+        last_value = self._published_states[entity_id]
+        if entity_id.endswith("_speed"):
+            return abs(value - last_value) > self._deadband
+        return value != last_value
+
+    def _collect_states(self) -> Dict[str, Tuple[Any, Dict[str, Any]]]:
+        """
+        汇总各下载器的活动种子数、上下行速度和排队数（排队数仅 qBittorrent）
+        """
+        services = self.downloader_helper.get_services()
+        if not services:
+            return {}
+        states = {}
+        totals = {"active": 0, "queued": 0, "upload_speed": 0, "download_speed": 0}
+        for service_name, service in services.items():
+            downloader_obj = service.instance
+            if not downloader_obj or downloader_obj.is_inactive():
+                continue
+            try:
+                stats = self._get_downloader_stats(service.type, downloader_obj)
+            except Exception as e:
+                logger.error(f"{self.LOG_TAG}获取下载器 {service_name} 统计信息失败，{str(e)}")
+                continue
+            slug = self._entity_slug(service_name)
+            for key, value in stats.items():
+                totals[key] += value
+                states[f"sensor.moviepilot_{slug}_{key}"] = (value, self._state_attributes(key, service_name))
+        for key, value in totals.items():
+            states[f"sensor.moviepilot_total_{key}"] = (value, self._state_attributes(key))
+        return states
+
+    @staticmethod
+    def _get_downloader_stats(dl_type: str, downloader_obj: Any) -> Dict[str, int]:
+        """
+        获取单个下载器的统计信息，速度单位为KB/s
+
+        Transmission 的会话统计没有排队数，逐个种子读取状态开销太大，不提供排队数。
+        """
+        if dl_type == "qbittorrent":
+            transfer = downloader_obj.qbc.transfer_info()
+            active = downloader_obj.qbc.torrents_info(status_filter="active")
+            downloading = downloader_obj.qbc.torrents_info(status_filter="downloading")
+            return {
+                "active": len(active or []),
+                "queued": len([t for t in downloading or [] if t.get("state") == "queuedDL"]),
+                "upload_speed": int(transfer.get("up_info_speed") or 0) // 1024,
+                "download_speed": int(transfer.get("dl_info_speed") or 0) // 1024
+            }
+        session_stats = downloader_obj.trc.session_stats()
+        return {
+            "active": int(session_stats.active_torrent_count or 0),
+            "upload_speed": int(session_stats.upload_speed or 0) // 1024,
+            "download_speed": int(session_stats.download_speed or 0) // 1024
+        }
+
+    @staticmethod
+    def _entity_slug(name: str) -> str:
+        """
+        下载器名称转为HA实体ID可用的字符
+        """
+        slug = re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+        return slug or md5(name.encode("utf-8")).hexdigest()[:8]
+
+    @staticmethod
+    def _state_attributes(key: str, downloader: str = None) -> Dict[str, Any]:
+        names = {
+            "active": ("活动种子", None),
+            "queued": ("排队种子", None),
+            "upload_speed": ("上传速度", "KB/s"),
+            "download_speed": ("下载速度", "KB/s")
+        }
+        friendly_name, unit = names[key]
+        attributes = {"friendly_name": f"MoviePilot {downloader or '总'}{friendly_name}"}
+        if unit:
+            attributes["unit_of_measurement"] = unit
+        return attributes
 
     def get_form(self) -> Tuple[List[dict], Dict[str, Any]]:
         MsgTypeOptions = []
@@ -209,6 +423,29 @@ class HA(_PluginBase):
                             }
                         ],
                     },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {
+                                    "cols": 12
+                                },
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "extra_dirs",
+                                            "label": "附加接受消息的网址",
+                                            "rows": 2,
+                                            "placeholder": "每行一个，网址|消息类型1,消息类型2|发送间隔(秒)，后两项可省略\n"
+                                                           "如:https://YYYY:8123/api/webhook/xx|资源下载,整理入库|10",
+                                        },
+                                    }
+                                ],
+                            }
+                        ],
+                    },
                     {
                         'component': 'VRow',
                         'content': [
@@ -231,6 +468,144 @@ class HA(_PluginBase):
                                 ]
                             }
                         ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'publish',
+                                            'label': '推送下载器统计',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 6,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'publish_interval',
+                                            'label': '推送间隔(秒)',
+                                            'placeholder': '30'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 6,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'deadband',
+                                            'label': '速度死区(KB/s)',
+                                            'placeholder': '0'
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'dedup_window',
+                                            'label': '重复消息合并窗口(秒)',
+                                            'placeholder': '60',
+                                            'hint': '窗口内相同的消息只发送一次，窗口结束后合并为一条(×N)，0为不合并',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 6
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'ha_host',
+                                            'label': 'HA地址',
+                                            'placeholder': '如:http://XXXX:8123'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 6
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'ha_token',
+                                            'label': 'HA长期访问令牌',
+                                            'type': 'password'
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VAlert',
+                                        'props': {
+                                            'type': 'info',
+                                            'variant': 'tonal',
+                                            'text': '推送的实体为sensor.moviepilot_*，速度变化不超过死区时不推送，数量类实体仅在变化时推送。'
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
                     }
                 ]
             }],
@@ -238,12 +613,160 @@ class HA(_PluginBase):
                 "enabled": False,
                 "notify": False,
                 "get_dir": "",
-                "msg_type": []
+                "msg_type": [],
+                "extra_dirs": "",
+                "publish": False,
+                "publish_interval": "30",
+                "deadband": "0",
+                "dedup_window": "60",
+                "ha_host": "",
+                "ha_token": ""
             }
         )
 
     def get_page(self) -> List[dict]:
-        pass
+        metrics = self._get_metrics()
+        latency = metrics.get("latency")
 
-    def stop_service(self):
-        pass
+        def _card(title: str, value: Any) -> dict:
+            return {
+                'component': 'VCol',
+                'props': {
+                    'cols': 6,
+                    'md': 2
+                },
+                'content': [
+                    {
+                        'component': 'VCard',
+                        'props': {
+                            'variant': 'tonal'
+                        },
+                        'content': [
+                            {
+                                'component': 'VCardText',
+                                'content': [
+                                    {
+                                        'component': 'div',
+                                        'props': {
+                                            'class': 'text-caption'
+                                        },
+                                        'text': title
+                                    },
+                                    {
+                                        'component': 'div',
+                                        'props': {
+                                            'class': 'text-h6'
+                                        },
+                                        'text': str(value)
+                                    }
+                                ]
+                            }
+                        ]
+                    }
+                ]
+            }
+
+        def _table(headers: List[str], rows: List[List[Any]]) -> dict:
+            return {
+                'component': 'VCol',
+                'props': {
+                    'cols': 12
+                },
+                'content': [
+                    {
+                        'component': 'VTable',
+                        'props': {
+                            'hover': True
+                        },
+                        'content': [
+                            {
+                                'component': 'thead',
+                                'content': [
+                                    {
+                                        'component': 'th',
+                                        'props': {
+                                            'class': 'text-start ps-4'
+                                        },
+                                        'text': header
+                                    } for header in headers
+                                ]
+                            },
+                            {
+                                'component': 'tbody',
+                                'content': [
+                                    {
+                                        'component': 'tr',
+                                        'content': [
+                                            {
+                                                'component': 'td',
+                                                'props': {
+                                                    'class': 'ps-4'
+                                                },
+                                                'text': str(cell)
+                                            } for cell in row
+                                        ]
+                                    } for row in rows
+                                ]
+                            }
+                        ]
+                    }
+                ]
+            }
+
+        def _seconds(value: Any) -> str:
+            return f"{value}s" if value is not None else "-"
+
+        return [
+            {
+                'component': 'VRow',
+                'content': [
+                    _card('队列深度', metrics.get("depth")),
+                    _card('最早消息等待', _seconds(metrics.get("oldest_age"))),
+                    _card('延迟P50', _seconds(latency.get("p50"))),
+                    _card('延迟P90', _seconds(latency.get("p90"))),
+                    _card('延迟P99', _seconds(latency.get("p99")))
+                ]
+            },
+            {
+                'component': 'VRow',
+                'content': [
+                    _table(['接收地址', '队列深度', '最早消息等待'],
+                           [[item.get("url"), item.get("depth"), _seconds(item.get("oldest_age"))]
+                            for item in metrics.get("endpoints")]),
+                    _table(['消息类型', '已发送', '发送失败', '已丢弃', '已合并'],
+                           [[name, item.get("sent"), item.get("failed"), item.get("dropped"), item.get("folded")]
+                            for name, item in metrics.get("types").items()])
+                ]
+            }
+        ]
+
+    def stop_service(self, wait: bool = True):
+        """
+        停止服务，各地址在 drain_timeout 秒内发送剩余消息；wait 为 False 时在后台发送，不等待发送线程结束
+        """
+        try:
+            if self.processing_thread:
+                self.__event.set()
+                self.processing_thread.join(timeout=2)
+                self.processing_thread = None
+            # 补发窗口内尚未发送的合并消息，各地址同时发送剩余消息，最多等待 drain_timeout 秒
+            self._flush_duplicates(force=True)
+            deadline = time() + self.drain_timeout
+            for endpoint in self._endpoints:
+                endpoint.shutdown(deadline)
+            endpoints, self._endpoints = self._endpoints, []
+            if wait:
+                self._drain(endpoints, deadline)
+            elif endpoints:
+                threading.Thread(target=self._drain, args=(endpoints, deadline), name="ha-drain", daemon=True).start()
+            self.__event.clear()
+        except Exception as e:
+            logger.error(f"{self.LOG_TAG}停止服务时发生错误: {str(e)}")
+
+    @staticmethod
+    def _drain(endpoints: List[Endpoint], deadline: float):
+        """
+        等待各地址发完剩余消息后停止，截止时间前仍未发送的计为丢弃
+        """
+        for endpoint in endpoints:
+            endpoint.stop(deadline)
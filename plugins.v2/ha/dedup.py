@@ -0,0 +1,78 @@
+import re
+import threading
+from collections import OrderedDict
+from hashlib import md5
+from time import time
+from typing import Any, Dict, List, Optional
+
+
+class MessageDeduplicator:
+    """
+    消息去重，窗口期内相同的消息只发送第一条，窗口结束后将重复的消息合并为一条 "(×N)"
+    """
+
+    def __init__(self, window: int = 60, max_size: int = 256):
+        # 去重窗口（秒），为0时不去重
+        self.window = window
+        # 最多缓存的消息数，超出后淘汰最早的消息
+        self.max_size = max_size
+        # 消息指纹 -> [首次出现时间, 出现次数, 消息体]
+        self._cache: "OrderedDict[str, list]" = OrderedDict()
+        # accept 中被替换或淘汰的消息，下次 flush 时补发
+        self._expired: List[list] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(text: Optional[str]) -> str:
+        return re.sub(r"\s+", " ", str(text or "")).strip().lower()
+
+    def _fingerprint(self, msg_body: Dict[str, Any]) -> str:
+        msg_type = msg_body.get("type")
+        raw = "\n".join([getattr(msg_type, "name", str(msg_type or "")),
+                         self._normalize(msg_body.get("title")),
+                         self._normalize(msg_body.get("text"))])
+        return md5(raw.encode("utf-8")).hexdigest()
+
+    def accept(self, msg_body: Dict[str, Any]) -> bool:
+        """
+        记录一条消息，返回是否需要立即发送
+        """
+        if not self.window:
+            return True
+        key = self._fingerprint(msg_body)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and time() - entry[0] < self.window:
+                entry[1] += 1
+                return False
+            if entry and entry[1] > 1:
+                # 窗口已结束、尚未 flush 的消息，保留其重复次数
+                self._expired.append(entry)
+            self._cache[key] = [time(), 1, msg_body]
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                _, entry = self._cache.popitem(last=False)
+                if entry[1] > 1:
+                    self._expired.append(entry)
+            return True
+
+    def flush(self, force: bool = False) -> List[Dict[str, Any]]:
+        """
+        清理窗口已结束的消息，返回需要补发的合并消息
+        """
+        now = time()
+        with self._lock:
+            folded, self._expired = self._expired, []
+            for key in [key for key, entry in self._cache.items()
+                        if force or now - entry[0] >= self.window]:
+                folded.append(self._cache.pop(key))
+        return [self._fold(msg_body, count) for _, count, msg_body in folded if count > 1]
+
+    @staticmethod
+    def _fold(msg_body: Dict[str, Any], count: int) -> Dict[str, Any]:
+        folded = dict(msg_body)
+        if folded.get("title"):
+            folded["title"] = f"{folded.get('title')} (×{count})"
+        else:
+            folded["text"] = f"{folded.get('text')} (×{count})"
+        return folded
@@ -0,0 +1,176 @@
+import threading
+from queue import Queue, Empty
+from time import time, sleep
+from typing import Any, Dict, List, Optional
+
+from requests import Session
+
+from app.log import logger
+from app.schemas.types import NotificationType
+from app.utils.http import RequestUtils
+
+from .metrics import DeliveryMetrics
+
+
+class Endpoint:
+    """
+    单个HA消息接收地址，拥有独立的队列、连接池和发送间隔，互不阻塞
+    """
+
+    def __init__(self, url: str, msg_types: List[str] = None, send_interval: int = 5, log_tag: str = "[HA]",
+                 metrics: DeliveryMetrics = None):
+        # 接收消息的网址
+        self.url = url
+        # 允许发送的消息类型（NotificationType.name），为空时全部发送
+        self.msg_types = msg_types or []
+        # 消息发送间隔（秒）
+        self.send_interval = send_interval
+        self.log_tag = log_tag
+        # 发送指标，多个地址共用
+        self.metrics = metrics or DeliveryMetrics()
+        # 消息队列，元素为 (入队时间, 消息体)
+        self.queue = Queue()
+        # 上次发送时间
+        self.last_send_time = 0
+        self._session = Session()
+        self._thread: Optional[threading.Thread] = None
+        self._event = threading.Event()
+        # 停止后继续发送剩余消息的截止时间
+        self._deadline = 0.0
+
+    def __repr__(self):
+        return f"Endpoint({self.url})"
+
+    @staticmethod
+    def parse(lines: str, send_interval: int = 5, log_tag: str = "[HA]",
+              metrics: DeliveryMetrics = None) -> List["Endpoint"]:
+        """
+        解析附加地址配置，每行一个：网址|消息类型1,消息类型2|发送间隔(秒)，后两项可省略
+        """
+        endpoints = []
+        for line in (lines or "").split("\n"):
+            parts = [part.strip() for part in line.split("|")]
+            if not parts[0]:
+                continue
+            msg_types = []
+            if len(parts) > 1 and parts[1]:
+                for name in parts[1].split(","):
+                    msg_type = Endpoint._match_type(name.strip())
+                    if msg_type:
+                        msg_types.append(msg_type.name)
+                    else:
+                        logger.warn(f"{log_tag}未知的消息类型 {name}，已忽略")
+            interval = send_interval
+            if len(parts) > 2 and parts[2].isdigit():
+                interval = int(parts[2])
+            endpoints.append(Endpoint(url=parts[0], msg_types=msg_types, send_interval=interval, log_tag=log_tag,
+                                      metrics=metrics))
+        return endpoints
+
+    @staticmethod
+    def _match_type(name: str) -> Optional[NotificationType]:
+        for item in NotificationType:
+            if name in (item.name, item.value):
+                return item
+        return None
+
+    def accepts(self, msg_body: Dict[str, Any]) -> bool:
+        """
+        判断该地址是否接收此类型的消息
+        """
+        msg_type: NotificationType = msg_body.get("type")
+        return not msg_type or not self.msg_types or msg_type.name in self.msg_types
+
+    def put(self, msg_body: Dict[str, Any]):
+        self.queue.put((time(), msg_body))
+
+    def status(self) -> Dict[str, Any]:
+        """
+        当前队列深度和最早消息的等待时间
+        """
+        with self.queue.mutex:
+            depth = len(self.queue.queue)
+            oldest = self.queue.queue[0][0] if depth else None
+        return {
+            "url": self.url,
+            "depth": depth,
+            "oldest_age": round(time() - oldest, 1) if oldest else 0
+        }
+
+    def start(self):
+        self._event.clear()
+        self._thread = threading.Thread(target=self.process_queue, daemon=True)
+        self._thread.start()
+
+    def shutdown(self, deadline: float = 0):
+        """
+        通知发送线程退出，deadline 前继续发送队列中剩余的消息，不等待线程结束
+        """
+        self._deadline = deadline
+        self._event.set()
+
+    def stop(self, deadline: float = 0):
+        """
+        停止发送线程，deadline 前仍未发送的消息计为丢弃
+        """
+        if not self._event.is_set():
+            self.shutdown(deadline)
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=max(self._deadline - time(), 0) + 2)
+        self._thread = None
+        self._session.close()
+        # 未发送的消息计为丢弃
+        while True:
+            try:
+                _, msg_body = self.queue.get_nowait()
+            except Empty:
+                break
+            self.metrics.count(msg_body, "dropped")
+
+    def _running(self) -> bool:
+        if not self._event.is_set():
+            return True
+        # 停止后在截止时间前发完队列中剩余的消息
+        return not self.queue.empty() and time() < self._deadline
+
+    def process_queue(self):
+        while self._running():
+            # 获取队列中的下一条消息
+            try:
+                queued_time, msg_body = self.queue.get(timeout=1)
+            except Empty:
+                continue
+            # 检查是否满足发送间隔时间
+            wait = self.send_interval - (time() - self.last_send_time)
+            if wait > 0 and self._event.is_set() and time() + wait >= self._deadline:
+                # 截止前无法再发送
+                self.metrics.count(msg_body, "dropped")
+                self.queue.task_done()
+                break
+            if wait > 0:
+                sleep(wait)
+            if self._deliver(msg_body):
+                self.metrics.count(msg_body, "sent")
+                self.metrics.observe(time() - queued_time)
+            else:
+                self.metrics.count(msg_body, "failed")
+            # 标记任务完成
+            self.queue.task_done()
+        logger.info(f"{self.log_tag}地址 {self.url} 消息发送线程已退出")
+
+    def _deliver(self, msg_body: Dict[str, Any]) -> bool:
+        data = {"title": msg_body.get("title"), "text": msg_body.get("text")}
+        # 尝试发送消息
+        try:
+            res = RequestUtils(session=self._session).post_res(url=self.url, data=data)
+            if res and res.status_code == 200:
+                logger.info(f"{self.log_tag}HA消息发送成功：{self.url}")
+                self.last_send_time = time()
+                return True
+            elif res is not None:
+                logger.warn(f"{self.log_tag}HA消息发送失败：{self.url}，错误码：{res.status_code}，错误原因：{res.reason}")
+            else:
+                logger.warn(f"{self.log_tag}HA消息发送失败：{self.url}，未获取到返回信息")
+        except Exception as msg_e:
+            logger.error(f"{self.log_tag}HA消息发送失败：{self.url}，{str(msg_e)}")
+        return False
@@ -0,0 +1,45 @@
+import threading
+from collections import defaultdict, deque
+from typing import Any, Dict, List, Optional
+
+
+class DeliveryMetrics:
+    """
+    消息发送指标：按消息类型统计发送/失败/丢弃/合并数，并保留最近的发送延迟用于计算分位数
+
+    合并数为去重窗口内被合并的重复消息，这些消息随窗口结束后的 "(×N)" 消息发送，不计为丢弃。
+    """
+
+    def __init__(self, max_samples: int = 1000):
+        self._lock = threading.Lock()
+        # 消息类型 -> {"sent": 0, "failed": 0, "dropped": 0, "folded": 0}
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"sent": 0, "failed": 0, "dropped": 0, "folded": 0})
+        # 最近的发送延迟（秒），从入队到发送完成
+        self._latencies = deque(maxlen=max_samples)
+
+    @staticmethod
+    def _type_name(msg_body: Dict[str, Any]) -> str:
+        msg_type = msg_body.get("type")
+        return getattr(msg_type, "value", None) or "未分类"
+
+    def count(self, msg_body: Dict[str, Any], result: str, num: int = 1):
+        with self._lock:
+            self._counters[self._type_name(msg_body)][result] += num
+
+    def observe(self, latency: float):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def percentiles(self, points: List[int] = None) -> Dict[str, Optional[float]]:
+        points = points or [50, 90, 99]
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return {f"p{point}": None for point in points}
+        return {f"p{point}": round(samples[min(len(samples) - 1, int(len(samples) * point / 100))], 3)
+                for point in points}
+
+    def counters(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {name: dict(values) for name, values in self._counters.items()}
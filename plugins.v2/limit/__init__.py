@@ -1,25 +1,26 @@
-import datetime
 import threading
+from time import monotonic
 from typing import List, Tuple, Dict, Any, Optional
 
-import pytz
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
+from app import schemas
 from app.core.config import settings
-from app.helper.downloader import DownloaderHelper
 from app.log import logger
 from app.plugins import _PluginBase
 from app.schemas import ServiceInfo
 
-
-def _parse_tag_map(tag_map: str) -> Dict[str, int]:
-    """解析标签限速配置"""
-    parsed_map = {}
-    for item in tag_map.split("\n"):
-        parts = item.split(":")
-        if len(parts) == 2 and parts[1].strip().isdigit():
-            parsed_map[parts[0].strip()] = int(parts[1].strip())
-    return parsed_map
+from .capture import TorrentRecorder
+from .health import DownloaderHealth
+from .jobs import Job, JobRegistry
+from .pipeline import WritePipeline
+from .plan import ChangePlan, load_plans, parse_limit_map, plan_page, remove_plans, save_plans
+from .reader import TorrentReader
+from .record import TorrentRecord
+from .runner import SingleFlight
+from .sites import SiteCache, SiteResolver, sites_key
+from .snapshot import SnapshotCache
+from .stats import RunStats, NullStats, RunHistory, history_page
+from .summary import ChangeSummary
+from .throttle import WriteLimiter
 
 
 class Limit(_PluginBase):
@@ -30,7 +31,7 @@ class Limit(_PluginBase):
     # 插件图标
     plugin_icon = "Youtube-dl_A.png"
     # 插件版本
-    plugin_version = "1.2.0"
+    plugin_version = "1.2.24"
     # 插件作者
     plugin_author = "ClarkChen"
     # 作者主页
@@ -46,59 +47,139 @@ class Limit(_PluginBase):
 
     # 退出事件
     _event = threading.Event()
+    # 运行保护，定时任务与立即运行共用
+    _runner = SingleFlight(LOG_TAG)
+    # 接口提交的定向运行
+    _jobs = JobRegistry()
+    # 种子读取，保存增量扫描的状态
+    _reader = TorrentReader(LOG_TAG)
+    _health = DownloaderHealth(LOG_TAG)
     # 私有属性
-    sites_helper = None
-    downloader_helper = None
-    _scheduler = None
+    _sites_helper = None
+    _downloader_helper = None
+    # (生成时间, 表单中的下载器选项)
+    _form_options = None
     _enabled = False
     _onlyonce = False
     _cover = False
     _global = False
+    _site_limit = False
+    _capture = False
+    _stats = False
+    _dry_run = False
+    _apply_plan = False
+    _history: RunHistory = None
     _interval = "计划任务"
     _interval_cron = "0 13 * * *"
     _interval_time = 24
     _interval_unit = "小时"
     _downloaders = None
     _global_speed = 0
+    _write_rate = 0
+    _write_burst = 5
+    _concurrency = 4
+    _log_sample = 100
+    _incremental = False
+    _full_hours = 24
+    _page_size = 0
+    _snapshot_ttl = 0
     _tag_map = "标签:限速(KB)"
     _parsed_tag_map = {}
 
     def init_plugin(self, config: dict = None):
-        self.downloader_helper = DownloaderHelper()
         # 读取配置
         if config:
             self._enabled = config.get("enabled")
             self._onlyonce = config.get("onlyonce")
             self._cover = config.get("cover")
             self._global = config.get("global")
+            self._site_limit = config.get("site_limit")
+            self._capture = config.get("capture")
+            self._stats = config.get("stats")
+            self._dry_run = config.get("dry_run")
+            self._apply_plan = config.get("apply_plan")
             self._interval = config.get("interval") or "计划任务"
             self._interval_cron = config.get("interval_cron") or "0 13 * * *"
             self._interval_time = self.str_to_number(config.get("interval_time"), 24)
             self._interval_unit = config.get("interval_unit") or "小时"
             self._downloaders = config.get("downloaders")
             self._global_speed = self.str_to_number(config.get("global_speed"), 0)
+            self._write_rate = self.str_to_number(config.get("write_rate"), 0)
+            self._write_burst = self.str_to_number(config.get("write_burst"), 5)
+            self._concurrency = self.str_to_number(config.get("concurrency"), 4)
+            self._log_sample = self.str_to_number(config.get("log_sample"), 100)
+            self._incremental = config.get("incremental")
+            self._full_hours = self.str_to_number(config.get("full_hours"), 24)
+            self._page_size = self.str_to_number(config.get("page_size"), 0)
+            self._snapshot_ttl = self.str_to_number(config.get("snapshot_ttl"), 0)
             self._tag_map = config.get("tag_map") or "标签:限速(KB)"
-            self._parsed_tag_map = _parse_tag_map(self._tag_map)
+            self._parsed_tag_map = parse_limit_map(self._tag_map)
+
+        # 运行记录在首次使用时读取，下拉选项在配置变更后重新生成
+        self._history = None
+        self._form_options = None
 
         # 停止现有任务
         self.stop_service()
+        # 配置变更后下一次运行重新全量扫描
+        self._reader.reset()
+        # 后台探测下载器连接状态，运行时不再等待未连接的下载器
+        self._health.reset()
+        if self._enabled and self._downloaders:
+            self._health.start(self._configured_services)
 
         if self._onlyonce:
-            # 创建定时任务控制器
-            self._scheduler = BackgroundScheduler(timezone=settings.TZ)
             # 执行一次, 关闭onlyonce
             self._onlyonce = False
             config.update({"onlyonce": self._onlyonce})
             self.update_config(config)
-            # 执行自动限速
-            self._scheduler.add_job(func=self._complete_limit, trigger='date',
-                                    run_date=datetime.datetime.now(
-                                        tz=pytz.timezone(settings.TZ)) + datetime.timedelta(seconds=3)
-                                    )
-            if self._scheduler and self._scheduler.get_jobs():
-                # 启动服务
-                self._scheduler.print_jobs()
-                self._scheduler.start()
+            # 执行自动限速，正在运行时合并到当前运行之后
+            self._runner.submit(self._complete_limit, trigger="立即运行")
+
+        if self._apply_plan:
+            # 执行一次, 关闭apply_plan
+            self._apply_plan = False
+            config.update({"apply_plan": self._apply_plan})
+            self.update_config(config)
+            self._runner.submit(self._apply_saved_plan, trigger="执行计划")
+
+    @property
+    def sites_helper(self):
+        """
+        站点帮助类，首次使用时创建
+        """
+        if self._sites_helper is None:
+            from app.helper.sites import SitesHelper
+            self._sites_helper = SitesHelper()
+        return self._sites_helper
+
+    @property
+    def downloader_helper(self):
+        """
+        下载器帮助类，首次使用时创建
+        """
+        if self._downloader_helper is None:
+            from app.helper.downloader import DownloaderHelper
+            self._downloader_helper = DownloaderHelper()
+        return self._downloader_helper
+
+    @property
+    def history(self) -> RunHistory:
+        """
+        运行记录，首次使用时读取
+        """
+        if self._history is None:
+            self._history = RunHistory(self.get_data("history") or [])
+        return self._history
+
+    def _downloader_options(self) -> List[Dict[str, str]]:
+        """
+        表单中的下载器选项，缓存至插件配置变更，最长一分钟
+        """
+        if self._form_options is None or monotonic() - self._form_options[0] > 60:
+            self._form_options = (monotonic(), [{"title": config.name, "value": config.name}
+                                                for config in self.downloader_helper.get_configs().values()])
+        return self._form_options[1]
 
     @property
     def service_infos(self) -> Optional[Dict[str, ServiceInfo]]:
@@ -106,17 +187,13 @@ class Limit(_PluginBase):
             logger.warning("尚未配置下载器，请检查配置")
             return None
 
-        services = self.downloader_helper.get_services(name_filters=self._downloaders)
+        services = self._configured_services()
         if not services:
             logger.warning("获取下载器实例失败，请检查配置")
             return None
 
-        active_services = {}
-        for service_name, service_info in services.items():
-            if service_info.instance.is_inactive():
-                logger.warning(f"下载器 {service_name} 未连接，请检查配置")
-            else:
-                active_services[service_name] = service_info
+        # 使用后台探测缓存的连接状态，未连接的下载器跳过
+        active_services = self._health.active(services)
 
         if not active_services:
             logger.warning("没有已连接的下载器，请检查配置")
@@ -124,6 +201,14 @@ class Limit(_PluginBase):
 
         return active_services
 
+    def _configured_services(self) -> Optional[Dict[str, ServiceInfo]]:
+        """
+        已配置的下载器，不检查连接状态
+        """
+        if not self._downloaders:
+            return None
+        return self.downloader_helper.get_services(name_filters=self._downloaders)
+
     def get_state(self) -> bool:
         return self._enabled
 
@@ -132,7 +217,86 @@ class Limit(_PluginBase):
         pass
 
     def get_api(self) -> List[Dict[str, Any]]:
-        pass
+        return [{
+            "path": "/stats",
+            "endpoint": self.get_stats,
+            "methods": ["GET"],
+            "summary": "运行统计",
+            "description": "最近运行的分阶段耗时、下载器接口调用次数、各下载器汇总和连接状态",
+        }, {
+            "path": "/plan",
+            "endpoint": self.get_plan,
+            "methods": ["GET"],
+            "summary": "变更计划",
+            "description": "仅生成计划时保存的完整计划，包含各下载器待设置限速的种子",
+        }, {
+            "path": "/run",
+            "endpoint": self.run_job,
+            "methods": ["GET", "POST"],
+            "summary": "定向运行",
+            "description": "只处理指定下载器(downloader)、指定种子(hashes，英文逗号分隔)或只应用一条限速配置"
+                           "(rule，配置中的标签或站点名称)，返回任务id",
+        }, {
+            "path": "/status",
+            "endpoint": self.get_status,
+            "methods": ["GET"],
+            "summary": "运行进度",
+            "description": "指定任务id(job)时返回该任务的进度，否则返回最近的任务",
+        }]
+
+    def get_stats(self, apikey: str) -> schemas.Response:
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        return schemas.Response(success=True, data={
+            "history": self.history.list(),
+            "runner": self._runner.summary(),
+            "health": self._health.summary()
+        })
+
+    def get_plan(self, apikey: str) -> schemas.Response:
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        try:
+            saved = load_plans(self.get_data_path())
+        except Exception as e:
+            return schemas.Response(success=False, message=f"读取计划失败: {str(e)}")
+        if not saved:
+            return schemas.Response(success=False, message="没有已保存的计划")
+        summary, plans = saved
+        return schemas.Response(success=True, data={
+            "summary": summary,
+            "plans": [plan.to_dict() for plan in plans]
+        })
+
+    def run_job(self, apikey: str, downloader: str = None, hashes: str = None,
+                rule: str = None) -> schemas.Response:
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        if not self._enabled:
+            return schemas.Response(success=False, message="插件未启用")
+        if downloader and downloader not in (self._downloaders or []):
+            return schemas.Response(success=False, message=f"下载器 {downloader} 未在插件中配置")
+        if rule and rule not in self._parsed_tag_map:
+            return schemas.Response(success=False, message=f"限速配置中没有 {rule}")
+        hash_list = [_hash.strip().lower() for _hash in (hashes or "").split(",") if _hash.strip()]
+        job = self._jobs.create(params={"downloader": downloader, "hashes": len(hash_list), "rule": rule})
+        # 排队等待正在进行的运行结束，不与定时任务合并
+        self._runner.enqueue(self._run_job, trigger="接口", job=job, downloader=downloader or None,
+                             hashes=hash_list or None, only_tag=rule or None)
+        return schemas.Response(success=True, data={"job": job.id})
+
+    def get_status(self, apikey: str, job: str = None) -> schemas.Response:
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        if job:
+            item = self._jobs.get(job)
+            if not item:
+                return schemas.Response(success=False, message=f"任务 {job} 不存在")
+            return schemas.Response(success=True, data=item.to_dict())
+        return schemas.Response(success=True, data={
+            "jobs": self._jobs.list(),
+            "runner": self._runner.summary()
+        })
 
     def get_service(self) -> List[Dict[str, Any]]:
         """
@@ -153,7 +317,7 @@ class Limit(_PluginBase):
                             "id": "Limit",
                             "name": "自动限速",
                             "trigger": "interval",
-                            "func": self._complete_limit,
+                            "func": self._scheduled_run,
                             "kwargs": {
                                 "hours": self._interval_time
                             }
@@ -166,17 +330,18 @@ class Limit(_PluginBase):
                             "id": "Limit",
                             "name": "自动限速",
                             "trigger": "interval",
-                            "func": self._complete_limit,
+                            "func": self._scheduled_run,
                             "kwargs": {
                                 "minutes": self._interval_time
                             }
                         }]
                 else:
+                    from apscheduler.triggers.cron import CronTrigger
                     return [{
                         "id": "Limit",
                         "name": "自动限速",
                         "trigger": CronTrigger.from_crontab(self._interval_cron),
-                        "func": self._complete_limit,
+                        "func": self._scheduled_run,
                         "kwargs": {}
                     }]
         return []
@@ -185,91 +350,335 @@ class Limit(_PluginBase):
     def str_to_number(s: str, i: int) -> int:
         try:
             return int(s)
-        except ValueError:
+        except (TypeError, ValueError):
             return i
 
-    def _complete_limit(self):
-        if not self.service_infos:
+    def _scheduled_run(self):
+        """
+        定时任务入口，上一次运行未结束时合并触发
+        """
+        self._runner.run(self._complete_limit, trigger="定时任务")
+
+    def _run_job(self, trigger: str, job: Job, **kwargs):
+        """
+        运行接口提交的定向任务，记录任务状态
+        """
+        job.start()
+        try:
+            self._complete_limit(trigger=trigger, job=job, **kwargs)
+        except Exception as e:
+            job.finish("failed", str(e))
+            raise
+        job.finish("stopped" if self._event.is_set() else "done")
+
+    def _complete_limit(self, trigger: str = "定时任务", job: Job = None, downloader: str = None,
+                        hashes: List[str] = None, only_tag: str = None):
+        """
+        :param job: 记录进度的任务，接口提交时传入
+        :param downloader: 只处理该下载器
+        :param hashes: 只处理这些种子
+        :param only_tag: 只应用限速配置中的这一项（标签或站点名称）
+        """
+        job = job or Job(trigger)
+        service_infos = self.service_infos
+        if not service_infos:
+            job.message = "没有可用的下载器"
             return
-        logger.info(f"{self.LOG_TAG}开始执行 ...")
-        for service in self.service_infos.values():
+        if downloader:
+            if downloader not in service_infos:
+                logger.warning(f"{self.LOG_TAG}下载器 {downloader} 未连接")
+                job.message = f"下载器 {downloader} 未连接"
+                return
+            service_infos = {downloader: service_infos[downloader]}
+        targeted = bool(hashes or only_tag)
+        # 定向运行的计划只包含部分种子，不保存，避免覆盖完整扫描生成的计划
+        partial = targeted or bool(downloader)
+        tag_map = {only_tag: self._parsed_tag_map[only_tag]} \
+            if only_tag in self._parsed_tag_map else self._parsed_tag_map
+        dry_run = self._dry_run
+        logger.info(f"{self.LOG_TAG}开始执行{'，仅生成计划' if dry_run else ''} ...")
+        stats = RunStats(trigger=trigger) if self._stats else NullStats()
+        pipeline_downloaders = self._get_pipeline_downloaders()
+        recorder = self._get_recorder()
+        sites = self._get_site_resolver(stats, tag_map)
+        plans: List[ChangePlan] = []
+        for service in service_infos.values():
             downloader = service.name
             downloader_obj = service.instance
             logger.info(f"{self.LOG_TAG}开始扫描下载器 {downloader} ...")
             if not downloader_obj:
                 logger.error(f"{self.LOG_TAG} 获取下载器失败 {downloader}")
                 continue
-            # 全局限速
-            if self._global:
-                downloader_obj.set_speed_limit(download_limit=0, upload_limit=self._global_speed)
+            limiter = WriteLimiter.of(service, rate=self._write_rate, burst=self._write_burst)
+            throttled = limiter.throttled
+            # 全局限速，定向到种子或单项配置时不设置
+            if self._global and not targeted and dry_run:
+                logger.info(f"{self.LOG_TAG}仅生成计划，下载器 {downloader} 跳过全局限速")
+            elif self._global and not targeted:
+                with stats.phase("写入", downloader):
+                    limiter.call(downloader_obj.set_speed_limit, download_limit=0, upload_limit=self._global_speed)
+                stats.count("set_speed_limit", downloader, write=True)
+                job.writes += 1
             # 按标签限速
-            if not self._parsed_tag_map:
+            if not tag_map:
+                self._report_throttled(stats, downloader, limiter.throttled - throttled)
                 continue
-            # 获取下载器中的种子
-            torrents, error = downloader_obj.get_torrents()
-            # 如果下载器获取种子发生错误 或 没有种子 则跳过
-            if error or not isinstance(torrents, list):
-                logger.error(f"{self.LOG_TAG} 下载器 {downloader} 获取种子失败: {error}")
+            # 自动标签插件开启联动限速时，由其在贴标签的同一次扫描中完成限速；
+            # 联动限速只按标签匹配，按站点限速时仍需扫描；接口定向运行时按请求扫描
+            if downloader in pipeline_downloaders and not sites and not partial:
+                logger.info(f"{self.LOG_TAG}下载器 {downloader} 已由自动标签联动限速，跳过扫描")
                 continue
+            # 获取下载器中的种子，qBittorrent 设置分页时处理完一页再读取下一页
+            if hashes:
+                pages = self._reader.select(service, hashes, stats=stats)
+            else:
+                pages = self._reader.pages(service, stats=stats, incremental=self._incremental,
+                                           full_hours=self._full_hours, page_size=self._page_size,
+                                           ttl=self._snapshot_ttl)
             logger.info(f"{self.LOG_TAG}下载器 {downloader} 分析种子信息中 ...")
-            for torrent in torrents:
-                if self._get_limited(self, torrent=torrent, dl_type=service.type):
-                    continue
-                try:
-                    if self._event.is_set():
-                        logger.info(f"{self.LOG_TAG}停止服务")
-                        return
-                    # 获取种子hash
-                    _hash = self._get_hash(torrent=torrent, dl_type=service.type)
-                    # 获取种子当前标签
-                    torrent_tags = self._get_tags(torrent=torrent, dl_type=service.type)
-                    for tag in torrent_tags:
-                        if tag in self._parsed_tag_map:
-                            speed = self._parsed_tag_map[tag]
-                            self._set_torrent_speed(service=service, _hash=_hash, _speed=speed)
+            # 按限速分组的种子，扫描完成后批量写入并同步修改共享快照；仅生成计划时不写入
+            plan = ChangePlan(downloader=downloader, dl_type=service.type)
+            changes = ChangeSummary(self.LOG_TAG, downloader, sample=self._log_sample)
+            stopped = False
+            for torrents in stats.timed(pages, "获取种子", downloader):
+                stats.torrents(downloader, len(torrents))
+                job.total += len(torrents)
+                if recorder:
+                    recorder.add_downloader(name=downloader, dl_type=service.type, torrents=torrents,
+                                            load_trackers=lambda t: self._reader.trackers(service, t, stats))
+                # 并发读取本页没有限速标签、需要按tracker匹配站点的种子
+                if sites and self._concurrency > 1:
+                    wanted = [torrent for torrent in torrents
+                              if not self._get_limited(torrent=torrent, dl_type=service.type)
+                              and not self._tag_limit(torrent, tag_map) and not sites.known(torrent.hash)]
+                    with stats.phase("获取tracker"):
+                        fetched = self._reader.prefetch_trackers(service, wanted, workers=self._concurrency)
+                    stats.count("torrents_trackers", downloader, num=fetched)
+                with stats.phase("分析种子", downloader):
+                    for torrent in torrents:
+                        if self._event.is_set():
+                            stopped = True
                             break
-                except Exception as e:
-                    logger.error(
-                        f"{self.LOG_TAG}分析种子信息时发生了错误: 下载器={downloader}, 错误={str(e)}")
+                        job.processed += 1
+                        if self._get_limited(torrent=torrent, dl_type=service.type):
+                            continue
+                        try:
+                            matched = self._tag_limit(torrent, tag_map)
+                            if not matched and sites:
+                                matched = self._site_speed(service, torrent, sites, tag_map, stats)
+                            if not matched:
+                                continue
+                            speed, rule = matched
+                            plan.limit(torrent.hash, speed)
+                            plan.note(rule)
+                            changes.torrent(f"下载器: {downloader} 种子id: {torrent.hash} 上传限速为 {speed}KB/S",
+                                            labels=[f"{speed}KB/S"], rules=[rule])
+                        except Exception as e:
+                            stats.error()
+                            job.errors += 1
+                            logger.error(
+                                f"{self.LOG_TAG}分析种子信息时发生了错误: 下载器={downloader}, 错误={str(e)}")
+                if stopped:
+                    break
+            # 提前结束时关闭读取，共享快照读完剩余的页后保存，之后的写入才能同步修改快照
+            pages.close()
+            changes.flush("计划限速" if dry_run else "限速")
+            if not dry_run and not plan.is_empty():
+                # 相同限速的种子合并为一次请求，失败的请求在 finish 时重试
+                pipeline = WritePipeline(downloader, workers=self._concurrency, limiter=limiter,
+                                         log_tag=self.LOG_TAG)
+                with stats.phase("写入", downloader):
+                    calls = plan.apply(service=service, log_tag=self.LOG_TAG, pipeline=pipeline)
+                    failed = pipeline.finish()
+                stats.error(failed)
+                job.errors += failed
+                if failed:
+                    SnapshotCache.of(service).invalidate()
+                else:
+                    plan.patch(SnapshotCache.of(service))
+                for kind, num in calls.items():
+                    stats.count(kind, downloader, num=num, write=True)
+                job.writes += sum(calls.values())
+            self._report_throttled(stats, downloader, limiter.throttled - throttled)
+            if stopped:
+                if sites:
+                    sites.cache.save()
+                logger.info(f"{self.LOG_TAG}停止服务")
+                return
+            if dry_run:
+                plans.append(plan)
+                logger.info(f"{self.LOG_TAG}下载器 {downloader} 计划 {plan.request_count()} 次写入请求，本次不写入")
+        if sites:
+            # 全部下载器完整扫描后清理已删除种子的缓存
+            sites.cache.save(prune=not targeted and not self._incremental
+                             and len(service_infos) == len(self._downloaders or []))
+        if dry_run and partial:
+            job.message = f"仅生成计划，预计 {sum(plan.request_count() for plan in plans)} 次写入请求，定向运行不保存计划"
+        elif dry_run:
+            self._save_plans(plans, trigger=trigger)
+        if recorder:
+            self._save_recorder(recorder)
+        self._save_stats(stats)
         logger.info(f"{self.LOG_TAG}执行完成")
 
-    @staticmethod
-    def _get_hash(torrent: Any, dl_type: str):
+    def _save_plans(self, plans: List[ChangePlan], trigger: str):
+        """
+        保存本次生成的计划，详情页显示汇总
+        """
         try:
-            return torrent.get("hash") if dl_type == "qbittorrent" else torrent.hashString
+            summary = save_plans(self.get_data_path(), plugin="Limit", trigger=trigger, plans=plans)
         except Exception as e:
-            logger.error(f"获取种子哈希值失败: {str(e)}")
-            return ""
+            logger.error(f"{self.LOG_TAG}保存计划失败: {str(e)}")
+            return
+        self.save_data("plan", summary)
+        logger.info(f"{self.LOG_TAG}计划已生成，共 {len(plans)} 个下载器，预计 {summary.get('requests')} 次写入请求")
 
-    @staticmethod
-    def _get_tags(torrent: Any, dl_type: str):
+    def _apply_saved_plan(self, trigger: str = "执行计划"):
+        """
+        按保存的计划批量设置限速，不重新分析种子，执行后删除计划
+        """
         try:
-            return [str(tag).strip() for tag in torrent.get("tags", "").split(',')] \
-                if dl_type == "qbittorrent" else torrent.labels or []
+            saved = load_plans(self.get_data_path())
         except Exception as e:
-            logger.error(f"获取种子标签失败: {str(e)}")
-            return []
+            logger.error(f"{self.LOG_TAG}读取计划失败: {str(e)}")
+            return
+        if not saved:
+            logger.warning(f"{self.LOG_TAG}没有已保存的计划")
+            return
+        summary, plans = saved
+        service_infos = self.service_infos
+        if not service_infos:
+            return
+        logger.info(f"{self.LOG_TAG}开始执行 {summary.get('time')} 生成的计划 ...")
+        stats = RunStats(trigger=trigger) if self._stats else NullStats()
+        # 下载器不可用时保留其计划，下次继续执行
+        remaining = []
+        for plan in plans:
+            if self._event.is_set():
+                logger.info(f"{self.LOG_TAG}停止服务")
+                return
+            service = service_infos.get(plan.downloader)
+            if not service or service.type != plan.dl_type:
+                logger.warning(f"{self.LOG_TAG}下载器 {plan.downloader} 不可用，保留其计划")
+                remaining.append(plan)
+                continue
+            limiter = WriteLimiter.of(service, rate=self._write_rate, burst=self._write_burst)
+            throttled = limiter.throttled
+            pipeline = WritePipeline(plan.downloader, workers=self._concurrency, limiter=limiter,
+                                     log_tag=self.LOG_TAG)
+            with stats.phase("写入", plan.downloader):
+                calls = plan.apply(service=service, log_tag=self.LOG_TAG, pipeline=pipeline)
+                failed = pipeline.finish()
+            stats.error(failed)
+            if failed:
+                SnapshotCache.of(service).invalidate()
+            else:
+                plan.patch(SnapshotCache.of(service))
+            for kind, num in calls.items():
+                stats.count(kind, plan.downloader, num=num, write=True)
+            self._report_throttled(stats, plan.downloader, limiter.throttled - throttled)
+        if remaining:
+            self._save_plans(remaining, trigger=summary.get("trigger"))
+        else:
+            remove_plans(self.get_data_path())
+            self.del_data("plan")
+        self._save_stats(stats)
+        logger.info(f"{self.LOG_TAG}计划执行完成")
 
-    @staticmethod
-    def _get_limited(self, torrent: Any, dl_type: str):
-        if self._cover or dl_type != "qbittorrent":
-            return False
+    def _report_throttled(self, stats: RunStats, downloader: str, seconds: float):
+        """
+        记录本次运行在下载器上的限流等待时间
+        """
+        if seconds <= 0:
+            return
+        stats.throttled(downloader, seconds)
+        logger.info(f"{self.LOG_TAG}下载器 {downloader} 写入限流等待 {round(seconds, 1)} 秒")
+
+    def _save_stats(self, stats: RunStats):
+        """
+        保存本次运行记录
+        """
+        if not stats.enabled:
+            return
+        self.history.add(stats.finish())
+        self.save_data("history", self.history.list())
+
+    def _get_recorder(self) -> Optional[TorrentRecorder]:
+        """
+        开启录制样本时，记录本次运行获取到的数据
+        """
+        if not self._capture:
+            return None
+        return TorrentRecorder(plugin="Limit", configs={"Tag": self.get_config("Tag"), "Limit": self.get_config("Limit")})
+
+    def _save_recorder(self, recorder: TorrentRecorder):
+        """
+        保存录制的样本，只录制一次，保存后关闭录制
+        """
         try:
-            return torrent.up_limit > 0
+            file = recorder.save(self.get_data_path())
+            logger.info(f"{self.LOG_TAG}样本已保存: {file}")
         except Exception as e:
-            logger.error(f"判断种子是否已限速失败: {str(e)}")
+            logger.error(f"{self.LOG_TAG}保存样本失败: {str(e)}")
+        self._capture = False
+        config = self.get_config() or {}
+        config.update({"capture": False})
+        self.update_config(config)
+
+    def _get_pipeline_downloaders(self) -> List[str]:
+        """
+        自动标签插件开启联动限速的下载器
+        """
+        config = self.get_config("Tag") or {}
+        if not config.get("enabled") or not config.get("pipeline"):
+            return []
+        return config.get("downloaders") or []
+
+    def _get_limited(self, torrent: TorrentRecord, dl_type: str) -> bool:
+        """
+        qBittorrent 中已单独限速的种子，非覆盖模式下跳过
+        """
+        if self._cover or dl_type != "qbittorrent":
             return False
+        return torrent.up_limit > 0
 
-    def _set_torrent_speed(self, service: ServiceInfo, _hash: str, _speed: int = None):
-        if not service or not service.instance:
-            return
-        downloader_obj = service.instance
-        # 下载器api不通用, 因此需分开处理
-        if service.type == "qbittorrent":
-            downloader_obj.qbc.torrents_set_upload_limit(torrent_hashes=_hash, limit=_speed)
-        else:
-            downloader_obj.change_torrent(hash_string=_hash, upload_limit=_speed)
-        logger.info(f"{self.LOG_TAG}下载器: {service.name} 种子id: {_hash} 上传限速为 {_speed}KB/S")
+    def _get_site_resolver(self, stats: RunStats, tag_map: Dict[str, int]) -> Optional[SiteResolver]:
+        """
+        开启按站点限速且限速配置中有站点名称时，返回站点查询，种子的识别结果跨运行缓存
+        """
+        if not self._site_limit or not tag_map:
+            return None
+        with stats.phase("站点索引"):
+            indexers = self.sites_helper.get_indexers() or []
+        if not {indexer.get("name") for indexer in indexers}.intersection(tag_map):
+            logger.info(f"{self.LOG_TAG}限速配置中没有站点名称，不按站点限速")
+            return None
+        cache = SiteCache(self.get_data_path(), key=sites_key(indexers), log_tag=self.LOG_TAG)
+        return SiteResolver(self.sites_helper, stats=stats, cache=cache)
+
+    @staticmethod
+    def _tag_limit(torrent: TorrentRecord, tag_map: Dict[str, int]) -> Optional[Tuple[int, str]]:
+        """
+        按种子标签匹配的 (限速, 规则)
+        """
+        for tag in torrent.tags:
+            if tag in tag_map:
+                return tag_map[tag], f"限速 {tag}"
+        return None
+
+    def _site_speed(self, service: ServiceInfo, torrent: TorrentRecord, sites: SiteResolver,
+                    tag_map: Dict[str, int], stats: RunStats) -> Optional[Tuple[int, str]]:
+        """
+        按 tracker 对应的站点匹配的 (限速, 规则)，不依赖自动标签插件是否已贴上站点标签
+        """
+        def trackers() -> List[str]:
+            with stats.phase("获取tracker"):
+                return self._reader.trackers(service, torrent, stats)
+
+        site = sites.torrent_site(torrent.hash, trackers)
+        if not site or site not in tag_map:
+            return None
+        return tag_map[site], f"限速 站点 {site}"
 
     def get_form(self) -> Tuple[List[dict], Dict[str, Any]]:
         return [
@@ -339,6 +748,273 @@ class Limit(_PluginBase):
                                     }
                                 ]
                             },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VCheckboxBtn',
+                                        'props': {
+                                            'model': 'capture',
+                                            'label': '录制样本'
+                                        }
+                                    }
+                                ]
+                            },
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'stats',
+                                            'label': '运行统计',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 9
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VAlert',
+                                        'props': {
+                                            'type': 'info',
+                                            'variant': 'tonal',
+                                            'density': 'compact',
+                                            'text': '开启后记录每次运行各阶段的耗时和下载器接口调用次数，可在详情页查看。'
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'dry_run',
+                                            'label': '仅生成计划',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'apply_plan',
+                                            'label': '执行已保存的计划',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 6
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VAlert',
+                                        'props': {
+                                            'type': 'info',
+                                            'variant': 'tonal',
+                                            'density': 'compact',
+                                            'text': '仅生成计划时只分析不写入，计划在详情页汇总显示，也可通过 /plan 接口下载；执行已保存的计划时按计划批量设置限速，不重新分析种子。'
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'write_rate',
+                                            'label': '写入速率(次/秒)',
+                                            'placeholder': '0',
+                                            'hint': '下载器响应变慢或出错时自动降速，0为不限制，两个插件对同一下载器共用限流',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 6,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'write_burst',
+                                            'label': '突发写入数',
+                                            'placeholder': '5'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 6,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'concurrency',
+                                            'label': '并发请求数',
+                                            'placeholder': '4',
+                                            'hint': '同一下载器同时进行的请求数，1为逐个请求',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'log_sample',
+                                            'label': '种子日志抽样',
+                                            'placeholder': '100',
+                                            'hint': '每N个修改的种子输出一条日志，其余只在调试日志中输出；0为只输出汇总，1为全部输出',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 6,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'incremental',
+                                            'label': '增量扫描(TR)',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 6,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'full_hours',
+                                            'label': '全量扫描间隔(小时)',
+                                            'placeholder': '24',
+                                            'hint': '仅对Transmission生效，两次全量扫描之间只处理最近有活动和新增的种子',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 6,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'page_size',
+                                            'label': '分页读取(QB)',
+                                            'placeholder': '0',
+                                            'hint': '每次从qBittorrent读取的种子数，处理完一页再读下一页，降低内存峰值；'
+                                                    '请求数按页增加，下载器每页都要排序全部种子，0为一次读取全部',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 6,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'snapshot_ttl',
+                                            'label': '种子快照有效期(秒)',
+                                            'placeholder': '0',
+                                            'hint': '有效期内再次读取同一下载器直接使用快照，多个插件共用；有效期内占用全部种子精简记录的内存，0为不使用',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            }
                         ]
                     },
                     {
@@ -358,8 +1034,7 @@ class Limit(_PluginBase):
                                             'clearable': True,
                                             'model': 'downloaders',
                                             'label': '下载器',
-                                            'items': [{"title": config.name, "value": config.name}
-                                                      for config in self.downloader_helper.get_configs().values()]
+                                            'items': self._downloader_options()
                                         }
                                     }
                                 ]
@@ -490,6 +1165,45 @@ class Limit(_PluginBase):
                             }
                         ],
                     },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'site_limit',
+                                            'label': '按站点限速',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 9
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VAlert',
+                                        'props': {
+                                            'type': 'info',
+                                            'variant': 'tonal',
+                                            'density': 'compact',
+                                            'text': '开启后配置中的标签也可以是站点名称，种子没有匹配的标签时按 tracker 识别站点后限速，新种子无需等待自动标签插件贴上站点标签。'
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
                     {
                         'component': 'VRow',
                         'content': [
@@ -516,27 +1230,39 @@ class Limit(_PluginBase):
         ], {
             "enabled": False,
             "onlyonce": False,
+            "capture": False,
             "cover": False,
             "global": False,
+            "site_limit": False,
+            "stats": False,
+            "dry_run": False,
+            "apply_plan": False,
             "interval": "计划任务",
             "interval_cron": "0 13 * * *",
             "interval_time": "24",
             "interval_unit": "小时",
             "global_speed": "0",
+            "write_rate": "0",
+            "write_burst": "5",
+            "concurrency": "4",
+            "log_sample": "100",
+            "incremental": False,
+            "full_hours": "24",
+            "page_size": "0",
+            "snapshot_ttl": "0",
             "tag_map": "标签:限速(KB)"
         }
 
     def get_page(self) -> List[dict]:
-        pass
+        return plan_page(self.get_data("plan")) \
+            + history_page(self.history.list(), self._runner.summary())
 
     def stop_service(self):
         try:
-            if self._scheduler:
-                self._scheduler.remove_all_jobs()
-                if self._scheduler.running:
-                    self._event.set()
-                    self._scheduler.shutdown()
-                    self._event.clear()
-                self._scheduler = None
+            self._health.stop()
+            self._runner.cancel()
+            self._jobs.cancel_pending()
+            if not self._runner.stop(self._event, timeout=60):
+                logger.warning(f"{self.LOG_TAG}任务 60 秒内未能停止，停止信号保持到该任务结束")
         except Exception as e:
             logger.error(f"停止服务时发生错误: {str(e)}")
@@ -0,0 +1,115 @@
+import gzip
+import hashlib
+import json
+import re
+import secrets
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from app.log import logger
+
+from .record import TorrentRecord
+
+# 样本格式版本，回放时据此兼容
+CAPTURE_VERSION = 1
+
+
+class TorrentRecorder:
+    """
+    录制插件一次运行时从下载器和站点索引获取到的数据，脱敏后保存为压缩样本，用于离线回放分析。
+    """
+
+    # 路径或参数中疑似密钥的部分
+    _secret_re = re.compile(r"[0-9a-fA-F]{16,}|[A-Za-z0-9_-]{24,}")
+
+    def __init__(self, plugin: str, configs: Dict[str, Any] = None):
+        self.plugin = plugin
+        self.configs = configs or {}
+        self.indexers: List[Dict[str, Any]] = []
+        self.downloaders: List[Dict[str, Any]] = []
+        # 每个样本独立的盐，种子hash无法反查但在样本内保持一致
+        self._salt = secrets.token_hex(8)
+
+    def _anonymize_hash(self, _hash: str) -> str:
+        return hashlib.sha1(f"{self._salt}{_hash}".encode()).hexdigest()
+
+    @classmethod
+    def anonymize_url(cls, url: str) -> str:
+        """
+        去掉tracker地址中的passkey等密钥，保留协议、大小写、主机和端口
+        """
+        if not url or "://" not in url:
+            return url
+        parts = urlsplit(url)
+        path = cls._secret_re.sub("x", parts.path)
+        query = "&".join(f"{item.split('=', 1)[0]}=x" if "=" in item else item
+                         for item in parts.query.split("&") if item)
+        return urlunsplit((parts.scheme, parts.netloc, path, query, ""))
+
+    def add_indexers(self, indexers: List[Dict[str, Any]]):
+        self.indexers = [{
+            "name": indexer.get("name"),
+            "domain": indexer.get("domain"),
+            "ext_domains": indexer.get("ext_domains") or []
+        } for indexer in indexers or []]
+
+    def add_downloader(self, name: str, dl_type: str, torrents: List[TorrentRecord],
+                       load_trackers: Callable[[TorrentRecord], Any] = None):
+        """
+        记录下载器返回的种子，分页读取时追加到同一下载器
+
+        :param load_trackers: 读取尚未获取的tracker（qBittorrent）
+        """
+        item = next((item for item in self.downloaders if item["name"] == name), None)
+        if not item:
+            item = {"name": name, "type": dl_type, "torrents": []}
+            self.downloaders.append(item)
+        records = item["torrents"]
+        for torrent in torrents or []:
+            try:
+                if torrent.trackers is None and load_trackers:
+                    load_trackers(torrent)
+                records.append(self._record(len(records), torrent, dl_type))
+            except Exception as e:
+                logger.debug(f"录制种子信息失败: {str(e)}")
+
+    def _record(self, index: int, torrent: TorrentRecord, dl_type: str) -> Dict[str, Any]:
+        return {
+            "hash": self._anonymize_hash(torrent.hash),
+            "name": f"torrent-{index}",
+            "save_path": torrent.path,
+            # qBittorrent 样本保持下载器返回的逗号分隔格式
+            "tags": ", ".join(torrent.tags) if dl_type == "qbittorrent" else list(torrent.tags),
+            "category": torrent.category,
+            "size": torrent.size,
+            "up_limit": torrent.up_limit,
+            "trackers": [[self.anonymize_url(url), tier] for url, tier in torrent.trackers or ()]
+        }
+
+    def save(self, path: Path) -> Optional[Path]:
+        path.mkdir(parents=True, exist_ok=True)
+        file = path / f"capture-{self.plugin.lower()}-{time.strftime('%Y%m%d%H%M%S')}.json.gz"
+        data = {
+            "version": CAPTURE_VERSION,
+            "plugin": self.plugin,
+            "created": int(time.time()),
+            "configs": self.configs,
+            "indexers": self.indexers,
+            "downloaders": self.downloaders
+        }
+        with gzip.open(file, "wt", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        return file
+
+
+def load_capture(file: str) -> Dict[str, Any]:
+    """
+    读取录制的样本
+    """
+    with gzip.open(file, "rt", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("version") != CAPTURE_VERSION:
+        raise ValueError(f"不支持的样本版本: {data.get('version')}")
+    return data
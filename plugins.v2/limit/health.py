@@ -0,0 +1,164 @@
+import threading
+from time import monotonic
+from typing import Callable, Dict, List, Optional
+
+from app.log import logger
+from app.schemas import ServiceInfo
+
+
+class _HostState:
+    __slots__ = ("active", "checked_at", "failures", "next_probe", "probing", "thread")
+
+    def __init__(self):
+        self.active = False
+        self.checked_at = 0.0
+        # 连续探测失败的次数
+        self.failures = 0
+        # 下一次允许探测的时间
+        self.next_probe = 0.0
+        # 探测线程仍未返回时不再重复探测，需要结果的一方等待该线程
+        self.probing = False
+        self.thread: Optional[threading.Thread] = None
+
+
+class DownloaderHealth:
+    """
+    下载器连接状态缓存，后台定时探测，运行时直接使用缓存的结果
+
+    每个下载器的探测在独立线程中进行，超过 timeout 未返回视为未连接；
+    未连接的下载器按指数退避延后下一次探测，期间运行直接跳过，不再等待其连接超时。
+    """
+
+    def __init__(self, log_tag: str = "", interval: float = 60, timeout: float = 5,
+                 max_backoff: float = 1800):
+        self.log_tag = log_tag
+        # 已连接下载器的探测间隔（秒）
+        self.interval = interval
+        # 单个下载器探测的最长等待时间（秒）
+        self.timeout = timeout
+        # 未连接下载器的最长探测间隔（秒）
+        self.max_backoff = max_backoff
+        self._states: Dict[str, _HostState] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, services: Callable[[], Optional[Dict[str, ServiceInfo]]]):
+        """
+        启动后台探测，services 返回当前需要探测的下载器
+        """
+        self.stop()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, args=(services, self._stop),
+                                        name=f"health{self.log_tag}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def reset(self):
+        with self._lock:
+            self._states.clear()
+
+    def _loop(self, services: Callable[[], Optional[Dict[str, ServiceInfo]]], stop: threading.Event):
+        while not stop.is_set():
+            try:
+                self.probe(list((services() or {}).values()))
+            except Exception as e:
+                logger.error(f"{self.log_tag}探测下载器连接状态出错: {str(e)}")
+            stop.wait(self.interval)
+
+    def active(self, services: Dict[str, ServiceInfo]) -> Dict[str, ServiceInfo]:
+        """
+        返回已连接的下载器
+
+        从未探测过或结果已过期的下载器立即探测（并行，最多等待 timeout），处于退避期的下载器直接跳过。
+        """
+        now = monotonic()
+        with self._lock:
+            due = [service for name, service in services.items()
+                   if name not in self._states
+                   or (self._states[name].active and now - self._states[name].checked_at >= self.interval)
+                   or (not self._states[name].active and now >= self._states[name].next_probe)]
+        if due:
+            self.probe(due)
+        active = {}
+        with self._lock:
+            for name, service in services.items():
+                state = self._states.get(name)
+                if state and state.active:
+                    active[name] = service
+                elif state:
+                    logger.warning(f"{self.log_tag}下载器 {name} 未连接，"
+                                   f"{max(int(state.next_probe - monotonic()), 0)} 秒后重新探测")
+        return active
+
+    def probe(self, services: List[ServiceInfo]):
+        """
+        并行探测下载器，每个下载器最多等待 timeout 秒
+        """
+        now = monotonic()
+        threads = {}
+        started = []
+        with self._lock:
+            for service in services:
+                state = self._states.setdefault(service.name, _HostState())
+                if state.probing:
+                    # 后台探测正在进行，等待其结果
+                    threads[service.name] = (state.thread, state)
+                    continue
+                if not state.active and state.failures and now < state.next_probe:
+                    continue
+                state.probing = True
+                state.thread = threading.Thread(target=self._probe_one, args=(service, state),
+                                                name=f"probe-{service.name}", daemon=True)
+                # 在锁内启动，其他等待该线程的一方不会拿到未启动的线程
+                state.thread.start()
+                threads[service.name] = (state.thread, state)
+                started.append(state.thread)
+        deadline = monotonic() + self.timeout
+        for name, (thread, state) in threads.items():
+            thread.join(max(deadline - monotonic(), 0))
+            if thread.is_alive() and thread in started:
+                # 探测线程仍在等待连接，先按未连接处理，线程返回后更新结果
+                self._update(state, False, f"{self.timeout} 秒内未响应", name)
+
+    def _probe_one(self, service: ServiceInfo, state: _HostState):
+        active, reason = False, "未连接"
+        try:
+            active = bool(service.instance) and not service.instance.is_inactive()
+        except Exception as e:
+            reason = str(e)
+        finally:
+            with self._lock:
+                state.probing = False
+        self._update(state, active, reason, service.name)
+
+    def _update(self, state: _HostState, active: bool, reason: str, name: str):
+        with self._lock:
+            now = monotonic()
+            if active:
+                if not state.active and state.failures:
+                    logger.info(f"{self.log_tag}下载器 {name} 已恢复连接")
+                state.active, state.failures, state.next_probe = True, 0, now
+            elif state.active or not state.failures or now >= state.next_probe:
+                # 同一轮探测超时后线程再返回失败时不重复累计
+                state.active = False
+                state.failures += 1
+                backoff = min(self.interval * 2 ** (state.failures - 1), self.max_backoff)
+                state.next_probe = now + backoff
+                logger.warning(f"{self.log_tag}下载器 {name} 探测失败（{reason}），{int(backoff)} 秒后重试")
+            state.checked_at = now
+
+    def summary(self) -> Dict[str, dict]:
+        """
+        各下载器的连接状态，用于统计接口
+        """
+        now = monotonic()
+        with self._lock:
+            return {name: {"active": state.active,
+                           "failures": state.failures,
+                           "checked": round(now - state.checked_at, 1) if state.checked_at else None,
+                           "next_probe": round(max(state.next_probe - now, 0), 1) if not state.active else 0}
+                    for name, state in self._states.items()}
@@ -0,0 +1,88 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.log import logger
+
+from .throttle import WriteLimiter
+
+
+class WritePipeline:
+    """
+    单个下载器的并发写入，同时保持若干个请求在途
+
+    同一个键（一般为种子hash）的请求按提交顺序依次执行；失败的请求记录下来，在 finish 时统一重试一次。
+    """
+
+    def __init__(self, name: str, workers: int = 4, limiter: WriteLimiter = None, log_tag: str = ""):
+        self.name = name
+        self.workers = max(int(workers or 1), 1)
+        self.limiter = limiter
+        self.log_tag = log_tag
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._futures: List[Future] = []
+        # 键 -> 该键最后提交的请求，后续请求等待其完成后再执行
+        self._tails: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        # (键, 接口, 位置参数, 关键字参数)
+        self._failed: List[Tuple[str, Callable[..., Any], tuple, dict]] = []
+
+    def submit(self, key: str, func: Callable[..., Any], *args, **kwargs):
+        """
+        提交一个写入请求，并发数为1时直接在当前线程执行
+        """
+        if self.workers == 1:
+            self._run(None, key, func, args, kwargs)
+            return
+        if not self._pool:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"write-{self.name}")
+        # 线程池按提交顺序取任务，前一个请求一定已在执行或已完成，等待不会死锁
+        future = self._pool.submit(self._run, self._tails.get(key), key, func, args, kwargs)
+        self._tails[key] = future
+        self._futures.append(future)
+
+    def _run(self, previous: Optional[Future], key: str, func: Callable[..., Any], args: tuple, kwargs: dict):
+        if previous:
+            wait([previous])
+        try:
+            if self.limiter:
+                self.limiter.call(func, *args, **kwargs)
+            else:
+                func(*args, **kwargs)
+        except Exception as e:
+            logger.debug(f"{self.log_tag}下载器 {self.name} 写入失败，稍后重试: {str(e)}")
+            with self._lock:
+                self._failed.append((key, func, args, kwargs))
+
+    def join(self):
+        """
+        等待已提交的请求全部完成，用于分阶段写入（如先移除标签再添加标签）
+        """
+        if self._futures:
+            wait(self._futures)
+            self._futures.clear()
+            self._tails.clear()
+
+    def finish(self) -> int:
+        """
+        等待全部请求完成，按提交顺序重试失败的请求，返回重试后仍失败的数量
+        """
+        self.join()
+        if self._pool:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        failed, self._failed = self._failed, []
+        remaining = 0
+        for key, func, args, kwargs in failed:
+            try:
+                if self.limiter:
+                    self.limiter.call(func, *args, **kwargs)
+                else:
+                    func(*args, **kwargs)
+            except Exception as e:
+                remaining += 1
+                logger.error(f"{self.log_tag}下载器 {self.name} 写入 {key} 重试失败: {str(e)}")
+        if failed:
+            logger.info(f"{self.log_tag}下载器 {self.name} 重试 {len(failed)} 个失败的写入，"
+                        f"{len(failed) - remaining} 个成功")
+        return remaining
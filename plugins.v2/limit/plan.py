@@ -0,0 +1,340 @@
+import json
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.log import logger
+from app.schemas import ServiceInfo
+
+from .pipeline import WritePipeline
+from .snapshot import SnapshotCache
+
+PLAN_VERSION = 1
+PLAN_FILE = "plan.json"
+
+
+def parse_label_map(label_map: str) -> Dict[str, str]:
+    """
+    解析自动标签插件的 关键字:标签 配置，保持行顺序
+    """
+    parsed_map = {}
+    for item in (label_map or "").split("\n"):
+        parts = item.split(":")
+        if len(parts) < 2 or not parts[0].strip() or not parts[1].strip():
+            continue
+        parsed_map[parts[0].strip()] = parts[1].strip()
+    return parsed_map
+
+
+def parse_limit_map(tag_map: str) -> Dict[str, int]:
+    """
+    解析自动限速插件的 标签:限速(KB) 配置，保持行顺序，自动限速和自动标签联动限速共用
+    """
+    parsed_map = {}
+    for item in (tag_map or "").split("\n"):
+        parts = item.split(":")
+        if len(parts) == 2 and parts[1].strip().isdigit():
+            parsed_map[parts[0].strip()] = int(parts[1].strip())
+    return parsed_map
+
+
+class ChangePlan:
+    """
+    单个下载器一次运行的待写入变更，按标签/限速分组后批量写入
+
+    仅生成计划时保存为 plan.json，之后可直接按保存的计划批量写入，无需重新分析种子。
+    """
+
+    # 单次请求最多携带的种子数
+    chunk_size = 500
+
+    def __init__(self, downloader: str, dl_type: str):
+        self.downloader = downloader
+        self.dl_type = dl_type
+        # qb: 标签 -> 需要移除该标签的种子
+        self.remove_tags: Dict[str, List[str]] = {}
+        # qb: 标签 -> 需要添加该标签的种子
+        self.add_tags: Dict[str, List[str]] = {}
+        # tr: 完整标签列表 -> 需要设置为该标签列表的种子
+        self.labels: Dict[Tuple[str, ...], List[str]] = {}
+        # tr: 设置标签列表时新增的标签，其余为种子原有的标签
+        self.added: Set[str] = set()
+        # 上传限速(KB) -> 需要设置该限速的种子
+        self.limits: Dict[int, List[str]] = {}
+        # 规则 -> 命中该规则产生变更的种子数
+        self.rules: Counter = Counter()
+
+    def remove(self, _hash: str, tags: List[str]):
+        for tag in tags:
+            if tag:
+                self.remove_tags.setdefault(tag, []).append(_hash)
+
+    def add(self, _hash: str, tags: List[str]):
+        for tag in tags:
+            if tag:
+                self.add_tags.setdefault(tag, []).append(_hash)
+
+    def set_labels(self, _hash: str, labels: List[str], added: List[str] = None):
+        self.labels.setdefault(tuple(labels), []).append(_hash)
+        self.added.update(added if added is not None else labels)
+
+    def limit(self, _hash: str, speed: int):
+        self.limits.setdefault(speed, []).append(_hash)
+
+    def written_labels(self) -> Set[str]:
+        """
+        新增的标签，不含种子原有的标签
+        """
+        return set(self.add_tags) | self.added
+
+    def note(self, rule: str, num: int = 1):
+        """
+        记录产生变更的规则，用于计划汇总
+        """
+        self.rules[rule] += num
+
+    def _chunks(self, hashes: List[str]):
+        for i in range(0, len(hashes), self.chunk_size):
+            yield hashes[i:i + self.chunk_size]
+
+    def request_count(self) -> int:
+        """
+        批量写入所需的请求数
+        """
+        return sum(len(list(self._chunks(hashes)))
+                   for group in (self.remove_tags, self.add_tags, self.labels, self.limits)
+                   for hashes in group.values())
+
+    def is_empty(self) -> bool:
+        return not (self.remove_tags or self.add_tags or self.labels or self.limits)
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        计划汇总：各类变更的种子数、按规则分组的种子数和预计请求数
+        """
+        return {
+            "downloader": self.downloader,
+            "type": self.dl_type,
+            "remove": {tag: len(hashes) for tag, hashes in self.remove_tags.items()},
+            "add": {tag: len(hashes) for tag, hashes in self.add_tags.items()},
+            "labels": {",".join(labels): len(hashes) for labels, hashes in self.labels.items()},
+            "limits": {str(speed): len(hashes) for speed, hashes in self.limits.items()},
+            "rules": dict(self.rules.most_common()),
+            "requests": self.request_count()
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "downloader": self.downloader,
+            "type": self.dl_type,
+            "remove_tags": self.remove_tags,
+            "add_tags": self.add_tags,
+            # json 不支持元组作为键
+            "labels": [[list(labels), hashes] for labels, hashes in self.labels.items()],
+            "added": sorted(self.added),
+            "limits": {str(speed): hashes for speed, hashes in self.limits.items()},
+            "rules": dict(self.rules)
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ChangePlan":
+        plan = cls(downloader=data.get("downloader"), dl_type=data.get("type"))
+        plan.remove_tags = data.get("remove_tags") or {}
+        plan.add_tags = data.get("add_tags") or {}
+        plan.labels = {tuple(labels): hashes for labels, hashes in data.get("labels") or []}
+        plan.added = set(data.get("added") or [])
+        plan.limits = {int(speed): hashes for speed, hashes in (data.get("limits") or {}).items()}
+        plan.rules = Counter(data.get("rules") or {})
+        return plan
+
+    def patch(self, cache: SnapshotCache):
+        """
+        写入成功后按变更修改共享快照中的记录
+        """
+        for tag, hashes in self.remove_tags.items():
+            cache.patch(hashes, tags=lambda tags, tag=tag: tuple(t for t in tags if t != tag))
+        for tag, hashes in self.add_tags.items():
+            cache.patch(hashes, tags=lambda tags, tag=tag: tags if tag in tags else tags + (tag,))
+        for labels, hashes in self.labels.items():
+            cache.patch(hashes, tags=labels)
+        for speed, hashes in self.limits.items():
+            cache.patch(hashes, up_limit=speed)
+
+    def apply(self, service: ServiceInfo, log_tag: str = "", pipeline: WritePipeline = None) -> Counter:
+        """
+        批量写入变更，先移除标签再添加标签，最后设置限速，返回各接口的调用次数
+
+        传入写入管道时同一阶段的请求并发执行，阶段之间等待前一阶段完成，保证同一种子的写入顺序；
+        失败的请求由调用方在 pipeline.finish() 时重试。MoviePilot 的下载器封装出错时只返回 False，
+        这里直接调用下载器客户端，写入失败时抛出异常，才能重试、触发限流降速并丢弃共享快照。
+        """
+        calls = Counter()
+        if not service or not service.instance or self.is_empty():
+            return calls
+        downloader_obj = service.instance
+        own_pipeline = pipeline is None
+        if own_pipeline:
+            pipeline = WritePipeline(self.downloader, workers=1, log_tag=log_tag)
+        # 下载器api不通用, 因此需分开处理
+        if self.dl_type == "qbittorrent":
+            for tag, hashes in self.remove_tags.items():
+                for chunk in self._chunks(hashes):
+                    pipeline.submit(f"remove:{tag}", downloader_obj.qbc.torrents_remove_tags,
+                                    torrent_hashes=chunk, tags=tag)
+                    calls["torrents_remove_tags"] += 1
+            pipeline.join()
+            for tag, hashes in self.add_tags.items():
+                for chunk in self._chunks(hashes):
+                    pipeline.submit(f"add:{tag}", downloader_obj.qbc.torrents_add_tags,
+                                    torrent_hashes=chunk, tags=tag)
+                    calls["torrents_add_tags"] += 1
+            pipeline.join()
+            for speed, hashes in self.limits.items():
+                for chunk in self._chunks(hashes):
+                    pipeline.submit(f"limit:{speed}", downloader_obj.qbc.torrents_set_upload_limit,
+                                    torrent_hashes=chunk, limit=speed)
+                    calls["torrents_set_upload_limit"] += 1
+        else:
+            for labels, hashes in self.labels.items():
+                for chunk in self._chunks(hashes):
+                    pipeline.submit(f"labels:{','.join(labels)}", downloader_obj.trc.change_torrent,
+                                    ids=chunk, labels=list(labels))
+                    calls["torrent_set"] += 1
+            pipeline.join()
+            for speed, hashes in self.limits.items():
+                for chunk in self._chunks(hashes):
+                    pipeline.submit(f"limit:{speed}", downloader_obj.trc.change_torrent,
+                                    ids=chunk, upload_limit=speed, upload_limited=bool(speed))
+                    calls["torrent_set"] += 1
+        if own_pipeline:
+            pipeline.finish()
+        else:
+            pipeline.join()
+        logger.info(f"{log_tag}下载器 {self.downloader} 批量写入完成，共 {sum(calls.values())} 次请求")
+        return calls
+
+
+def save_plans(path: Path, plugin: str, trigger: str, plans: List[ChangePlan]) -> Dict[str, Any]:
+    """
+    保存计划到 plan.json，返回计划汇总
+    """
+    path.mkdir(parents=True, exist_ok=True)
+    summary = {
+        "plugin": plugin,
+        "trigger": trigger,
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "downloaders": [plan.summary() for plan in plans],
+        "requests": sum(plan.request_count() for plan in plans)
+    }
+    data = {
+        "version": PLAN_VERSION,
+        "summary": summary,
+        "plans": [plan.to_dict() for plan in plans]
+    }
+    with open(path / PLAN_FILE, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    return summary
+
+
+def load_plans(path: Path) -> Optional[Tuple[Dict[str, Any], List[ChangePlan]]]:
+    """
+    读取保存的计划，返回 (计划汇总, 各下载器的计划)，没有计划时返回 None
+    """
+    file = path / PLAN_FILE
+    if not file.exists():
+        return None
+    with open(file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("version") != PLAN_VERSION:
+        raise ValueError(f"不支持的计划版本: {data.get('version')}")
+    return data.get("summary") or {}, [ChangePlan.from_dict(plan) for plan in data.get("plans") or []]
+
+
+def remove_plans(path: Path):
+    (path / PLAN_FILE).unlink(missing_ok=True)
+
+
+def _counts(items: Dict[str, int]) -> str:
+    return "\n".join(f"{key}: {num}" for key, num in items.items()) or "-"
+
+
+def plan_page(summary: Optional[Dict[str, Any]]) -> List[dict]:
+    """
+    已保存计划的汇总，没有计划时不显示
+    """
+    if not summary:
+        return []
+    headers = ['下载器', '移除标签', '添加标签', '设置标签', '限速(KB)', '规则', '预计请求']
+    rows = [[
+        item.get("downloader"),
+        _counts(item.get("remove") or {}),
+        _counts(item.get("add") or {}),
+        _counts(item.get("labels") or {}),
+        _counts(item.get("limits") or {}),
+        _counts(item.get("rules") or {}),
+        item.get("requests")
+    ] for item in summary.get("downloaders") or []]
+    return [
+        {
+            'component': 'VAlert',
+            'props': {
+                'type': 'warning',
+                'variant': 'tonal',
+                'class': 'mb-2',
+                'text': f"{summary.get('time')} 生成的计划尚未执行，预计 {summary.get('requests')} 次写入请求；"
+                        f"开启「执行已保存的计划」后按计划写入"
+            }
+        },
+        {
+            'component': 'VRow',
+            'content': [
+                {
+                    'component': 'VCol',
+                    'props': {
+                        'cols': 12
+                    },
+                    'content': [
+                        {
+                            'component': 'VTable',
+                            'props': {
+                                'hover': True
+                            },
+                            'content': [
+                                {
+                                    'component': 'thead',
+                                    'content': [
+                                        {
+                                            'component': 'th',
+                                            'props': {
+                                                'class': 'text-start ps-4'
+                                            },
+                                            'text': header
+                                        } for header in headers
+                                    ]
+                                },
+                                {
+                                    'component': 'tbody',
+                                    'content': [
+                                        {
+                                            'component': 'tr',
+                                            'content': [
+                                                {
+                                                    'component': 'td',
+                                                    'props': {
+                                                        'class': 'ps-4',
+                                                        'style': 'white-space: pre-line'
+                                                    },
+                                                    'text': str(cell)
+                                                } for cell in row
+                                            ]
+                                        } for row in rows
+                                    ]
+                                }
+                            ]
+                        }
+                    ]
+                }
+            ]
+        }
+    ]
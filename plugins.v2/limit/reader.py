@@ -0,0 +1,214 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from typing import Any, Dict, Iterator, List, Set
+
+from app.log import logger
+from app.schemas import ServiceInfo
+
+from .record import TorrentRecord, qbittorrent_trackers, to_records
+from .snapshot import SnapshotCache
+from .stats import NullStats, RunStats
+
+# Transmission 只请求插件用到的字段
+TR_FIELDS = ["id", "hashString", "name", "downloadDir", "labels", "trackers", "totalSize",
+             "uploadLimit", "uploadLimited"]
+# 增量扫描时列出全部种子只需要hash
+TR_LIST_FIELDS = ["id", "hashString"]
+
+
+class TorrentReader:
+    """
+    读取下载器中的种子
+
+    Transmission 只请求需要的字段；开启增量扫描时，两次全量扫描之间只读取最近有活动的种子和新增的种子。
+    qBittorrent 设置分页时按页读取，处理完一页再读取下一页，内存占用与种子数量无关。
+    设置快照有效期时全量读取使用下载器的共享快照，有效期内不再请求下载器；快照逐页读取和保存，
+    但有效期内会保留全部种子的精简记录。
+    返回的种子已转换为精简记录 TorrentRecord。
+    """
+
+    def __init__(self, log_tag: str = ""):
+        self.log_tag = log_tag
+        # 下载器 -> 上次扫描时的种子hash
+        self._seen: Dict[str, Set[str]] = {}
+        # 下载器 -> 上次全量扫描的时间
+        self._full_at: Dict[str, float] = {}
+
+    def reset(self):
+        self._seen.clear()
+        self._full_at.clear()
+
+    def pages(self, service: ServiceInfo, stats: RunStats = None, incremental: bool = False,
+              full_hours: float = 24, page_size: int = 0, ordered: bool = False,
+              ttl: float = 0) -> Iterator[List[TorrentRecord]]:
+        """
+        按页返回种子，读取失败时记录错误并结束
+
+        :param ordered: 按hash顺序返回，分批扫描从游标继续时使用
+        :param ttl: 快照有效期(秒)，大于0时全量读取使用下载器的共享快照
+        """
+        stats = stats or NullStats()
+        try:
+            if ttl > 0 and not self._incremental_due(service, incremental, full_hours):
+                yield from self._snapshot(service, stats, page_size, ttl)
+                return
+            yield from self._fetch_pages(service, stats, incremental, full_hours, page_size, ordered)
+        except Exception as e:
+            stats.error()
+            logger.error(f"{self.log_tag}下载器 {service.name} 获取种子失败: {str(e)}")
+
+    def _snapshot(self, service: ServiceInfo, stats: RunStats, page_size: int,
+                  ttl: float) -> Iterator[List[TorrentRecord]]:
+        """
+        逐页读取下载器的共享快照，过期时全量读取；快照始终按hash排序，分批扫描可以直接使用
+        """
+        seen = set()
+        pages = SnapshotCache.of(service).pages(ttl, lambda: self._fetch_pages(service, stats, False, 0,
+                                                                               page_size, True))
+        try:
+            for i, (page, hit) in enumerate(pages):
+                if hit and not i:
+                    stats.count("snapshot_hit", service.name)
+                    logger.info(f"{self.log_tag}下载器 {service.name} 使用 {ttl} 秒内的种子快照")
+                if service.type == "transmission":
+                    seen.update(record.hash for record in page)
+                yield page
+        finally:
+            # 提前结束时由快照读完剩余的页
+            pages.close()
+        if service.type == "transmission":
+            self._seen[service.name] = seen
+            self._full_at[service.name] = monotonic()
+
+    def select(self, service: ServiceInfo, hashes: List[str], stats: RunStats = None) -> Iterator[List[TorrentRecord]]:
+        """
+        只读取指定hash的种子，定向运行时使用，不影响增量扫描的状态；读取失败时记录错误并结束
+        """
+        stats = stats or NullStats()
+        try:
+            if service.type == "qbittorrent":
+                torrents = service.instance.qbc.torrents_info(torrent_hashes=hashes)
+                stats.count("torrents_info", service.name)
+            else:
+                torrents = self._torrent_get(service, stats, ids=hashes, arguments=TR_FIELDS)
+            records = to_records(list(torrents or []), service.type, self.log_tag)
+        except Exception as e:
+            stats.error()
+            logger.error(f"{self.log_tag}下载器 {service.name} 获取指定种子失败: {str(e)}")
+            return
+        if records:
+            yield records
+
+    def _incremental_due(self, service: ServiceInfo, incremental: bool, full_hours: float) -> bool:
+        """
+        本次是否为增量读取（仅 Transmission）
+        """
+        return service.type == "transmission" and incremental \
+            and self._full_at.get(service.name) is not None \
+            and monotonic() - self._full_at[service.name] < full_hours * 3600
+
+    def _fetch_pages(self, service: ServiceInfo, stats: RunStats, incremental: bool, full_hours: float,
+                     page_size: int, ordered: bool) -> Iterator[List[TorrentRecord]]:
+        """
+        从下载器读取，读取失败时抛出异常
+        """
+        if service.type == "qbittorrent" and page_size > 0:
+            yield from self._qb_pages(service, stats, page_size)
+            return
+        torrents = self.read(service, stats=stats, incremental=incremental, full_hours=full_hours)
+        records = to_records(torrents, service.type, self.log_tag)
+        del torrents
+        if not records:
+            return
+        if ordered:
+            records.sort(key=lambda record: record.hash or "")
+        yield records
+
+    def _qb_pages(self, service: ServiceInfo, stats: RunStats, page_size: int) -> Iterator[List[TorrentRecord]]:
+        """
+        qBittorrent 按hash排序分页读取
+        """
+        offset = 0
+        while True:
+            page = service.instance.qbc.torrents_info(sort="hash", limit=page_size, offset=offset)
+            stats.count("torrents_info", service.name)
+            if not page:
+                return
+            size = len(page)
+            records = to_records(page, service.type, self.log_tag)
+            del page
+            yield records
+            if size < page_size:
+                return
+            offset += page_size
+
+    def trackers(self, service: ServiceInfo, record: TorrentRecord, stats: RunStats = None) -> List[str]:
+        """
+        种子的有效tracker地址，qBittorrent 首次使用时请求并保存在记录上
+        """
+        if record.trackers is None:
+            self._load_trackers(service, record)
+            (stats or NullStats()).count("torrents_trackers", service.name)
+        return record.tracker_urls()
+
+    def prefetch_trackers(self, service: ServiceInfo, records: List[TorrentRecord], workers: int = 4) -> int:
+        """
+        并发读取一批种子尚未获取的tracker，返回请求数
+        """
+        pending = [record for record in records if record.trackers is None]
+        if service.type != "qbittorrent" or workers <= 1 or len(pending) < 2:
+            return 0
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"trackers-{service.name}") as pool:
+            for record in pending:
+                pool.submit(self._load_trackers, service, record)
+        return len(pending)
+
+    def _load_trackers(self, service: ServiceInfo, record: TorrentRecord):
+        try:
+            record.trackers = qbittorrent_trackers(service.instance.qbc.torrents_trackers(torrent_hash=record.hash))
+        except Exception as e:
+            record.trackers = ()
+            logger.error(f"{self.log_tag}下载器 {service.name} 获取种子 {record.hash} 的tracker失败: {str(e)}")
+
+    def read(self, service: ServiceInfo, stats: RunStats = None, incremental: bool = False,
+             full_hours: float = 24) -> List[Any]:
+        """
+        一次读取下载器返回的全部种子，读取失败时抛出异常
+        """
+        stats = stats or NullStats()
+        if service.type != "transmission":
+            torrents, error = service.instance.get_torrents()
+            stats.count("get_torrents", service.name)
+            if error:
+                raise RuntimeError("下载器返回错误")
+            return torrents or []
+        if self._incremental_due(service, incremental, full_hours):
+            return self._read_recent(service, stats)
+        torrents = self._torrent_get(service, stats, arguments=TR_FIELDS)
+        self._seen[service.name] = {torrent.hashString for torrent in torrents}
+        self._full_at[service.name] = monotonic()
+        return torrents
+
+    def _read_recent(self, service: ServiceInfo, stats: RunStats) -> List[Any]:
+        """
+        增量读取：最近有活动的种子加上次扫描后新增的种子
+        """
+        current = {torrent.hashString for torrent in self._torrent_get(service, stats, arguments=TR_LIST_FIELDS)}
+        added = current - self._seen.get(service.name, set())
+        torrents = [torrent for torrent in self._torrent_get(service, stats, ids="recently-active",
+                                                             arguments=TR_FIELDS)
+                    if torrent.hashString in current]
+        added -= {torrent.hashString for torrent in torrents}
+        if added:
+            torrents += self._torrent_get(service, stats, ids=list(added), arguments=TR_FIELDS)
+        self._seen[service.name] = current
+        logger.info(f"{self.log_tag}下载器 {service.name} 增量扫描，共 {len(current)} 个种子，"
+                    f"读取最近活动及新增的 {len(torrents)} 个")
+        return torrents
+
+    @staticmethod
+    def _torrent_get(service: ServiceInfo, stats: RunStats, ids: Any = None,
+                     arguments: List[str] = None) -> List[Any]:
+        torrents = service.instance.trc.get_torrents(ids=ids, arguments=arguments)
+        stats.count("torrent_get", service.name)
+        return torrents
@@ -0,0 +1,106 @@
+import sys
+from functools import lru_cache
+from typing import Any, Iterable, List, Optional, Tuple
+
+from app.log import logger
+from app.utils.string import StringUtils
+
+_intern = sys.intern
+
+
+class TorrentRecord:
+    """
+    插件处理种子时使用的精简记录，读取后立即从下载器返回的对象转换，不再持有原始对象
+
+    标签、保存路径、tracker地址都是驻留字符串，大量种子共用同一份。
+    qBittorrent 的 tracker 需要单独请求，未读取前为 None。
+    """
+
+    __slots__ = ("hash", "name", "path", "tags", "category", "size", "up_limit", "trackers")
+
+    def __init__(self, _hash: str, name: str = "", path: str = "", tags: Tuple[str, ...] = (),
+                 category: str = "", size: int = 0, up_limit: int = 0,
+                 trackers: Optional[Tuple[Tuple[str, int], ...]] = None):
+        self.hash = _hash
+        self.name = name
+        self.path = path
+        self.tags = tags
+        self.category = category
+        self.size = size
+        # qBittorrent 为种子上传限速(B/s)，Transmission 为未启用限速时 0
+        self.up_limit = up_limit
+        # (tracker地址, 层级)
+        self.trackers = trackers
+
+    def tracker_urls(self) -> List[str]:
+        """
+        有效的tracker地址，排除 DHT/PeX 等层级小于0的条目
+        """
+        return [url for url, tier in self.trackers or () if tier >= 0 and url]
+
+
+def _tags(tags: Iterable[str]) -> Tuple[str, ...]:
+    return tuple(_intern(tag) for tag in (str(tag).strip() for tag in tags) if tag)
+
+
+def _trackers(trackers: Iterable[Tuple[str, int]]) -> Tuple[Tuple[str, int], ...]:
+    return tuple((_intern(url), tier) for url, tier in trackers if url)
+
+
+def from_qbittorrent(torrent: Any) -> TorrentRecord:
+    return TorrentRecord(
+        _hash=torrent.get("hash"),
+        name=torrent.get("name") or "",
+        path=_intern(torrent.get("save_path") or ""),
+        tags=_tags((torrent.get("tags") or "").split(",")),
+        category=_intern(torrent.get("category") or ""),
+        size=torrent.get("total_size") or torrent.get("size") or 0,
+        up_limit=torrent.get("up_limit") or 0
+    )
+
+
+def from_transmission(torrent: Any) -> TorrentRecord:
+    return TorrentRecord(
+        _hash=torrent.hashString,
+        name=torrent.name or "",
+        path=_intern(torrent.download_dir or ""),
+        tags=_tags(torrent.labels or []),
+        size=torrent.total_size or 0,
+        up_limit=torrent.upload_limit if torrent.upload_limited else 0,
+        trackers=_trackers((tracker.announce, tracker.tier) for tracker in torrent.trackers or [])
+    )
+
+
+def qbittorrent_trackers(trackers: Iterable[Any]) -> Tuple[Tuple[str, int], ...]:
+    """
+    qBittorrent 返回的 tracker 列表转换为 (地址, 层级)
+    """
+    return _trackers((tracker.get("url"), tracker.get("tier", -1)) for tracker in trackers or [])
+
+
+def to_records(torrents: List[Any], dl_type: str, log_tag: str = "") -> List[TorrentRecord]:
+    """
+    下载器返回的种子转换为精简记录，转换失败的种子跳过
+
+    转换时逐个从列表中取出原始对象，边转换边释放，列表转换后为空。
+    """
+    convert = from_qbittorrent if dl_type == "qbittorrent" else from_transmission
+    records = []
+    if not torrents:
+        return records
+    torrents.reverse()
+    while torrents:
+        torrent = torrents.pop()
+        try:
+            records.append(convert(torrent))
+        except Exception as e:
+            logger.error(f"{log_tag}读取种子信息失败: {str(e)}")
+    return records
+
+
+@lru_cache(maxsize=4096)
+def tracker_domain(url: str) -> str:
+    """
+    tracker地址的域名，结果缓存并驻留
+    """
+    return _intern(StringUtils.get_url_domain(url) or "")
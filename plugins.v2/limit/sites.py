@@ -0,0 +1,147 @@
+import gzip
+import json
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.log import logger
+
+from .record import tracker_domain
+from .stats import NullStats, RunStats
+
+SITES_VERSION = 1
+SITES_FILE = "sites.json.gz"
+
+
+def sites_key(indexers: Iterable[Dict[str, Any]]) -> str:
+    """
+    站点列表的指纹，站点增删或域名变化时改变
+    """
+    items = sorted(f"{indexer.get('name')}|{indexer.get('domain')}" for indexer in indexers or [])
+    return format(zlib.crc32("\n".join(items).encode()), "08x")
+
+
+class SiteCache:
+    """
+    按hash保存的种子对应的站点名称，未识别站点的种子也保存，持久保存在插件数据目录
+
+    种子的 tracker 很少变化，之后的运行不再为已识别过的种子请求 tracker；站点列表变化时丢弃缓存重新识别。
+    """
+
+    def __init__(self, path: Path, key: str, log_tag: str = ""):
+        self.file = path / SITES_FILE
+        self.key = key
+        self.log_tag = log_tag
+        # hash -> 站点名称，未识别站点为空字符串
+        self._sites: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        # 本次运行用到的hash，全量扫描结束后清理其余的
+        self._seen: Set[str] = set()
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        if not self.file.exists():
+            return
+        try:
+            with gzip.open(self.file, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == SITES_VERSION and data.get("key") == self.key:
+                self._sites = data.get("torrents") or {}
+            else:
+                self._dirty = True
+        except Exception as e:
+            logger.error(f"{self.log_tag}读取种子站点缓存失败: {str(e)}")
+
+    def __contains__(self, _hash: str) -> bool:
+        return _hash in self._sites
+
+    def get(self, _hash: str) -> Optional[str]:
+        self._seen.add(_hash)
+        return self._sites.get(_hash)
+
+    def put(self, _hash: str, site: Optional[str]):
+        with self._lock:
+            self._sites[_hash] = site or ""
+            self._seen.add(_hash)
+            self._dirty = True
+
+    def save(self, prune: bool = False):
+        """
+        保存缓存，prune 时丢弃本次运行未出现的种子
+        """
+        if prune:
+            stale = self._sites.keys() - self._seen
+            for _hash in stale:
+                del self._sites[_hash]
+            self._dirty = self._dirty or bool(stale)
+        if not self._dirty:
+            return
+        try:
+            self.file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.file.with_suffix(".tmp")
+            with gzip.open(tmp, "wt", encoding="utf-8") as f:
+                json.dump({"version": SITES_VERSION, "key": self.key, "torrents": self._sites}, f,
+                          ensure_ascii=False, separators=(",", ":"))
+            tmp.replace(self.file)
+            self._dirty = False
+        except Exception as e:
+            logger.error(f"{self.log_tag}保存种子站点缓存失败: {str(e)}")
+
+
+class SiteResolver:
+    """
+    tracker 域名对应的站点名称，按域名缓存 SitesHelper 的查询结果
+
+    同一站点的种子共用少量 tracker 域名，一次运行中每个域名只查询一次；
+    设置 cache 时按种子保存识别结果，之后的运行不再读取这些种子的 tracker。
+    """
+
+    def __init__(self, sites_helper: Any, stats: RunStats = None, cache: SiteCache = None):
+        self.sites_helper = sites_helper
+        self.stats = stats or NullStats()
+        self.cache = cache
+        # 域名 -> 站点名称，未识别的域名为 None
+        self._sites: Dict[str, Optional[str]] = {}
+
+    def site(self, domain: str) -> Optional[str]:
+        if domain in self._sites:
+            return self._sites[domain]
+        with self.stats.phase("站点匹配"):
+            site_info = self.sites_helper.get_indexer(domain) if domain else None
+        self.stats.count("get_indexer")
+        self._sites[domain] = site_info.get("name") if site_info else None
+        return self._sites[domain]
+
+    def resolve(self, trackers: Iterable[str]) -> Optional[Tuple[str, str]]:
+        """
+        按顺序返回第一个能识别的 tracker 对应的 (站点名称, 域名)
+        """
+        for tracker in trackers:
+            domain = tracker_domain(tracker)
+            site = self.site(domain)
+            if site:
+                return site, domain
+        return None
+
+    def known(self, _hash: str) -> bool:
+        """
+        种子是否已识别过，已识别的种子不需要读取 tracker
+        """
+        return self.cache is not None and _hash in self.cache
+
+    def torrent_site(self, _hash: str, trackers: Callable[[], List[str]]) -> Optional[str]:
+        """
+        种子对应的站点名称，未识别过时读取 tracker 识别；读取不到 tracker 时不保存结果，下次运行重新识别
+        """
+        if self.cache is not None:
+            site = self.cache.get(_hash)
+            if site is not None:
+                return site or None
+        urls = trackers()
+        resolved = self.resolve(urls)
+        site = resolved[0] if resolved else None
+        if self.cache is not None and urls:
+            self.cache.put(_hash, site)
+        return site
@@ -0,0 +1,161 @@
+import threading
+import zlib
+from time import monotonic
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from app.schemas import ServiceInfo
+
+from .record import TorrentRecord
+
+
+class SnapshotCache:
+    """
+    下载器种子快照，有效期内的读取直接使用快照，同时发起的读取共用一次请求
+
+    快照按读取时的分页保存，读取过程中每读到一页就交给调用方处理，同时发起的其他读取也逐页跟随，
+    不需要先把全部种子收集到一个列表；快照本身仍保存全部种子的精简记录，直到过期。
+    快照挂在下载器实例上，自动标签、自动限速以及其他使用该快照的插件共用。快照只用内置类型保存，
+    与创建它的插件无关；其中的记录按 TorrentRecord 的字段区分，字段不同的插件版本各自使用一份快照。
+    通过插件写入后按写入内容修改快照中的记录，写入失败时丢弃快照。
+    """
+
+    # 挂在下载器实例上的属性名
+    attr = "_torrent_snapshot_" + format(zlib.crc32(",".join(TorrentRecord.__slots__).encode()), "08x")
+
+    def __init__(self, name: str, state: Dict[str, Any] = None):
+        self.name = name
+        # 共用状态：锁、按页保存的种子记录、hash 索引、读取时间、正在进行的读取、命中数
+        self._state = state or self.new_state()
+        self._lock: threading.Lock = self._state["lock"]
+
+    @staticmethod
+    def new_state() -> Dict[str, Any]:
+        return {"lock": threading.Lock(), "pages": None, "index": None, "at": 0.0, "inflight": None,
+                "hits": 0, "misses": 0}
+
+    @classmethod
+    def of(cls, service: ServiceInfo) -> "SnapshotCache":
+        state = cls.new_state()
+        try:
+            # dict.setdefault 为原子操作，两个插件同时获取时只保留一份快照
+            state = vars(service.instance).setdefault(cls.attr, state)
+        except TypeError:
+            pass
+        return cls(service.name, state=state)
+
+    @property
+    def hits(self) -> int:
+        return self._state["hits"]
+
+    @property
+    def misses(self) -> int:
+        return self._state["misses"]
+
+    def pages(self, ttl: float, fetch: Callable[[], Iterator[List[TorrentRecord]]]) \
+            -> Iterator[Tuple[List[TorrentRecord], bool]]:
+        """
+        逐页返回 (种子记录, 是否未请求下载器)
+
+        快照有效时返回快照；其他读取正在进行时跟随其逐页返回；否则调用 fetch 逐页读取，全部读取完成后保存为快照。
+        fetch 读取失败时抛出异常，跟随的读取同样抛出异常。
+        """
+        state = self._state
+        owner = False
+        with self._lock:
+            if state["pages"] is not None and monotonic() - state["at"] < ttl:
+                state["hits"] += 1
+                pages, inflight = state["pages"], None
+            elif state["inflight"] is not None:
+                state["hits"] += 1
+                pages, inflight = None, state["inflight"]
+            else:
+                state["misses"] += 1
+                pages, inflight = None, {"pages": [], "done": False, "failed": False, "stale": False,
+                                         "cond": threading.Condition(self._lock)}
+                state["inflight"], owner = inflight, True
+        if pages is not None:
+            for page in pages:
+                yield page, True
+        elif owner:
+            yield from self._fetch(fetch, inflight)
+        else:
+            yield from self._follow(inflight)
+
+    def _append(self, inflight: Dict[str, Any], page: List[TorrentRecord]):
+        with self._lock:
+            inflight["pages"].append(page)
+            inflight["cond"].notify_all()
+
+    def _fetch(self, fetch: Callable[[], Iterator[List[TorrentRecord]]], inflight: Dict[str, Any]) \
+            -> Iterator[Tuple[List[TorrentRecord], bool]]:
+        state = self._state
+        complete = False
+        try:
+            pages = fetch()
+            try:
+                for page in pages:
+                    self._append(inflight, page)
+                    yield page, False
+            except GeneratorExit:
+                # 调用方提前结束（预算用尽、停止服务）时读完剩余的页，快照保持完整，下次运行直接使用
+                try:
+                    for page in pages:
+                        self._append(inflight, page)
+                    complete = True
+                except Exception:
+                    pass
+                raise
+            complete = True
+        finally:
+            with self._lock:
+                if state["inflight"] is inflight:
+                    state["inflight"] = None
+                if complete and not inflight["stale"]:
+                    state["pages"], state["index"], state["at"] = inflight["pages"], None, monotonic()
+                inflight["done" if complete else "failed"] = True
+                inflight["cond"].notify_all()
+
+    def _follow(self, inflight: Dict[str, Any]) -> Iterator[Tuple[List[TorrentRecord], bool]]:
+        """
+        跟随正在进行的读取，逐页返回已读取的页，等待后续的页
+        """
+        i = 0
+        while True:
+            with self._lock:
+                while i >= len(inflight["pages"]) and not inflight["done"] and not inflight["failed"]:
+                    inflight["cond"].wait()
+                if i < len(inflight["pages"]):
+                    page = inflight["pages"][i]
+                elif inflight["failed"]:
+                    raise RuntimeError("共用的种子读取失败")
+                else:
+                    return
+            i += 1
+            yield page, True
+
+    def patch(self, hashes: List[str], **fields):
+        """
+        修改快照中种子记录的字段，tags 支持传入函数根据原标签计算新标签
+        """
+        state = self._state
+        with self._lock:
+            if state["inflight"] is not None:
+                # 读取中的快照可能已包含写入前的记录，读取完成后不再保存
+                state["inflight"]["stale"] = True
+            if state["pages"] is None:
+                return
+            if state["index"] is None:
+                state["index"] = {record.hash: record for page in state["pages"] for record in page}
+            index = state["index"]
+        for _hash in hashes:
+            record = index.get(_hash)
+            if not record:
+                continue
+            for key, value in fields.items():
+                setattr(record, key, value(getattr(record, key)) if callable(value) else value)
+
+    def invalidate(self):
+        with self._lock:
+            if self._state["inflight"] is not None:
+                self._state["inflight"]["stale"] = True
+            self._state["pages"], self._state["index"] = None, None
@@ -0,0 +1,252 @@
+import threading
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from time import perf_counter
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# 关闭统计时所有计时共用的空上下文
+_NULL_CONTEXT = nullcontext()
+# 迭代结束标记
+_END = object()
+
+
+class RunStats:
+    """
+    单次运行的分阶段耗时、下载器接口调用次数和各下载器汇总
+    """
+
+    enabled = True
+
+    def __init__(self, trigger: str = "定时任务"):
+        self.trigger = trigger
+        self.started = datetime.now()
+        self._start = perf_counter()
+        # 阶段 -> 累计耗时（秒）
+        self.phases: Dict[str, float] = defaultdict(float)
+        # 接口类型 -> 调用次数
+        self.calls: Counter = Counter()
+        # 下载器 -> {"torrents": 种子数, "seconds": 耗时, "calls": 调用次数, "writes": 写入次数, "throttled": 限流等待}
+        self.downloaders: Dict[str, Dict[str, Any]] = {}
+        self.errors = 0
+
+    def downloader(self, name: str) -> Dict[str, Any]:
+        if name not in self.downloaders:
+            self.downloaders[name] = {"torrents": 0, "seconds": 0.0, "calls": 0, "writes": 0, "throttled": 0.0}
+        return self.downloaders[name]
+
+    @contextmanager
+    def phase(self, name: str, downloader: str = None):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            self.phases[name] += elapsed
+            if downloader:
+                self.downloader(downloader)["seconds"] += elapsed
+
+    def timed(self, iterable: Iterable, name: str, downloader: str = None) -> Iterator:
+        """
+        逐个取出元素，取元素的耗时计入阶段，用于分页读取
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name, downloader):
+                item = next(iterator, _END)
+            if item is _END:
+                return
+            yield item
+
+    def count(self, kind: str, downloader: str = None, num: int = 1, write: bool = False):
+        self.calls[kind] += num
+        if downloader:
+            item = self.downloader(downloader)
+            item["calls"] += num
+            if write:
+                item["writes"] += num
+
+    def torrents(self, downloader: str, num: int):
+        self.downloader(downloader)["torrents"] += num
+
+    def throttled(self, downloader: str, seconds: float):
+        if seconds:
+            self.downloader(downloader)["throttled"] += seconds
+
+    def error(self, num: int = 1):
+        self.errors += num
+
+    def finish(self) -> Dict[str, Any]:
+        """
+        生成结构化的运行记录
+        """
+        return {
+            "time": self.started.strftime("%Y-%m-%d %H:%M:%S"),
+            "trigger": self.trigger,
+            "seconds": round(perf_counter() - self._start, 3),
+            "phases": {name: round(seconds, 3) for name, seconds in self.phases.items()},
+            "calls": dict(self.calls),
+            "downloaders": {name: {**item, "seconds": round(item["seconds"], 3),
+                                   "throttled": round(item["throttled"], 3)}
+                            for name, item in self.downloaders.items()},
+            "errors": self.errors
+        }
+
+
+class NullStats(RunStats):
+    """
+    关闭统计时使用，所有方法均为空操作
+    """
+
+    enabled = False
+
+    def __init__(self, trigger: str = "定时任务"):
+        pass
+
+    def downloader(self, name: str) -> Dict[str, Any]:
+        return {}
+
+    def phase(self, name: str, downloader: str = None):
+        return _NULL_CONTEXT
+
+    def timed(self, iterable: Iterable, name: str, downloader: str = None) -> Iterator:
+        return iter(iterable)
+
+    def count(self, kind: str, downloader: str = None, num: int = 1, write: bool = False):
+        pass
+
+    def torrents(self, downloader: str, num: int):
+        pass
+
+    def throttled(self, downloader: str, seconds: float):
+        pass
+
+    def error(self, num: int = 1):
+        pass
+
+    def finish(self) -> Optional[Dict[str, Any]]:
+        return None
+
+
+class RunHistory:
+    """
+    最近若干次运行记录，超出后丢弃最早的记录
+    """
+
+    def __init__(self, records: List[Dict[str, Any]] = None, max_size: int = 30):
+        self._records = deque(records or [], maxlen=max_size)
+        self._lock = threading.Lock()
+
+    def add(self, record: Optional[Dict[str, Any]]):
+        if not record:
+            return
+        with self._lock:
+            self._records.append(record)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._records)
+
+
+def runner_alert(summary: Optional[Dict[str, Any]]) -> List[dict]:
+    """
+    运行保护的状态提示，没有合并或跳过的触发时不显示
+    """
+    if not summary or not (summary.get("running") or summary.get("coalesced") or summary.get("skipped")):
+        return []
+    text = f"启动以来合并触发 {summary.get('coalesced')} 次，跳过触发 {summary.get('skipped')} 次"
+    if summary.get("running"):
+        text = f"任务正在运行{'，结束后将合并运行一次' if summary.get('pending') else ''}；{text}"
+    return [{
+        'component': 'VAlert',
+        'props': {
+            'type': 'info',
+            'variant': 'tonal',
+            'class': 'mb-2',
+            'text': text
+        }
+    }]
+
+
+def history_page(records: List[Dict[str, Any]], summary: Dict[str, Any] = None) -> List[dict]:
+    """
+    运行记录的详情页，最近的记录在前
+    """
+    if not records:
+        return runner_alert(summary) + [{
+            'component': 'div',
+            'text': '暂无运行记录，开启运行统计后下一次运行开始记录',
+            'props': {
+                'class': 'text-center',
+            }
+        }]
+    headers = ['时间', '触发', '耗时', '下载器', '种子数', '接口调用', '写入', '错误', '各阶段耗时']
+    rows = []
+    for record in reversed(records):
+        downloaders = record.get("downloaders") or {}
+        rows.append([
+            record.get("time"),
+            record.get("trigger"),
+            f"{record.get('seconds')}s",
+            "\n".join(f"{name}: {item.get('seconds')}s"
+                      + (f" (限流 {item.get('throttled')}s)" if item.get("throttled") else "")
+                      for name, item in downloaders.items()) or "-",
+            sum(item.get("torrents", 0) for item in downloaders.values()),
+            sum((record.get("calls") or {}).values()),
+            sum(item.get("writes", 0) for item in downloaders.values()),
+            record.get("errors"),
+            "\n".join(f"{name}: {seconds}s" for name, seconds in (record.get("phases") or {}).items()) or "-"
+        ])
+    return runner_alert(summary) + [
+        {
+            'component': 'VRow',
+            'content': [
+                {
+                    'component': 'VCol',
+                    'props': {
+                        'cols': 12
+                    },
+                    'content': [
+                        {
+                            'component': 'VTable',
+                            'props': {
+                                'hover': True
+                            },
+                            'content': [
+                                {
+                                    'component': 'thead',
+                                    'content': [
+                                        {
+                                            'component': 'th',
+                                            'props': {
+                                                'class': 'text-start ps-4'
+                                            },
+                                            'text': header
+                                        } for header in headers
+                                    ]
+                                },
+                                {
+                                    'component': 'tbody',
+                                    'content': [
+                                        {
+                                            'component': 'tr',
+                                            'content': [
+                                                {
+                                                    'component': 'td',
+                                                    'props': {
+                                                        'class': 'ps-4',
+                                                        'style': 'white-space: pre-line'
+                                                    },
+                                                    'text': str(cell)
+                                                } for cell in row
+                                            ]
+                                        } for row in rows
+                                    ]
+                                }
+                            ]
+                        }
+                    ]
+                }
+            ]
+        }
+    ]
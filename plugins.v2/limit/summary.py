@@ -0,0 +1,50 @@
+from collections import Counter
+from typing import Iterable
+
+from app.log import logger
+
+
+class ChangeSummary:
+    """
+    单个下载器本次运行修改的种子汇总，按标签、规则计数后输出一条日志
+
+    逐个种子的日志按 sample 抽样输出，未抽中的只在调试日志中输出；sample 为 0 时不输出逐个种子的日志。
+    """
+
+    def __init__(self, log_tag: str = "", downloader: str = "", sample: int = 100):
+        self.log_tag = log_tag
+        self.downloader = downloader
+        self.sample = max(sample or 0, 0)
+        self.torrents = 0
+        self.labels = Counter()
+        self.rules = Counter()
+
+    def torrent(self, message: str, labels: Iterable[str] = (), rules: Iterable[str] = ()):
+        """
+        记录一个修改的种子
+        """
+        self.torrents += 1
+        self.labels.update(labels)
+        self.rules.update(rules)
+        if self.sample and (self.torrents - 1) % self.sample == 0:
+            logger.info(f"{self.log_tag}{message}")
+        else:
+            logger.debug(f"{self.log_tag}{message}")
+
+    def flush(self, action: str = "修改"):
+        """
+        输出汇总并清空计数
+        """
+        if not self.torrents:
+            return
+        text = f"{self.log_tag}下载器 {self.downloader} 本次{action} {self.torrents} 个种子"
+        if self.labels:
+            text += "；" + "、".join(f"{label} {num}" for label, num in self.labels.most_common())
+        if self.rules:
+            text += "；规则：" + "、".join(f"{rule} {num}" for rule, num in self.rules.most_common())
+        if self.sample > 1:
+            text += f"；逐个种子的日志每 {self.sample} 个输出一条，其余见调试日志"
+        logger.info(text)
+        self.torrents = 0
+        self.labels.clear()
+        self.rules.clear()
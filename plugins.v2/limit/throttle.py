@@ -0,0 +1,106 @@
+import threading
+from time import monotonic, perf_counter, sleep
+from typing import Any, Callable, Dict
+
+from app.log import logger
+from app.schemas import ServiceInfo
+
+
+class WriteLimiter:
+    """
+    下载器写入接口的令牌桶限流，接口变慢或出错时自动降低速率
+
+    令牌、降速倍数等状态挂在下载器实例上，自动标签和自动限速插件共用。状态只用内置类型保存，
+    与创建它的插件及其版本无关；速率和突发数按各插件自己的配置，调整配置不会重置共用的状态。
+    """
+
+    # 挂在下载器实例上的属性名，状态的结构变化时修改
+    attr = "_write_limiter_v2"
+    # 单次写入超过该耗时(秒)或明显慢于平时视为下载器繁忙
+    slow_latency = 1.0
+    # 降速的最大倍数
+    max_backoff = 16.0
+
+    def __init__(self, name: str, rate: float = 0, burst: int = 1, state: Dict[str, Any] = None):
+        self.name = name
+        self.rate = max(float(rate or 0), 0.0)
+        self.burst = max(int(burst or 1), 1)
+        # 共用状态：锁、令牌数、上次补充时间、降速倍数（实际速率为 rate / backoff）、写入耗时的滑动平均
+        self._state = state or self.new_state(self.burst)
+        self._lock: threading.Lock = self._state["lock"]
+        # 本插件通过该限流器累计等待的时间（秒）
+        self.throttled = 0.0
+
+    @staticmethod
+    def new_state(burst: int = 1) -> Dict[str, Any]:
+        return {"lock": threading.Lock(), "tokens": float(burst), "last": monotonic(), "backoff": 1.0,
+                "latency": 0.0}
+
+    @classmethod
+    def of(cls, service: ServiceInfo, rate: float = 0, burst: int = 1) -> "WriteLimiter":
+        """
+        获取下载器的限流器，使用下载器实例上共用的状态
+        """
+        state = cls.new_state(burst)
+        try:
+            # dict.setdefault 为原子操作，两个插件同时获取时只保留一份状态
+            state = vars(service.instance).setdefault(cls.attr, state)
+        except TypeError:
+            pass
+        return cls(service.name, rate=rate, burst=burst, state=state)
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    @property
+    def backoff(self) -> float:
+        return self._state["backoff"]
+
+    def acquire(self) -> float:
+        """
+        取一个令牌，不足时等待，返回等待的秒数
+        """
+        if not self.enabled:
+            return 0.0
+        state = self._state
+        with self._lock:
+            now = monotonic()
+            rate = self.rate / state["backoff"]
+            state["tokens"] = min(self.burst, state["tokens"] + (now - state["last"]) * rate) - 1
+            state["last"] = now
+            wait = -state["tokens"] / rate if state["tokens"] < 0 else 0.0
+            self.throttled += wait
+        if wait > 0:
+            sleep(wait)
+        return wait
+
+    def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        限流后调用写入接口，并按耗时和结果调整速率
+        """
+        self.acquire()
+        start = perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self._feedback(perf_counter() - start, error=True)
+            raise
+        self._feedback(perf_counter() - start)
+        return result
+
+    def _feedback(self, latency: float, error: bool = False):
+        if not self.enabled:
+            return
+        state = self._state
+        with self._lock:
+            slow = error or latency > max(self.slow_latency, state["latency"] * 3)
+            state["latency"] = latency if not state["latency"] else state["latency"] * 0.8 + latency * 0.2
+            if slow:
+                backoff = min(state["backoff"] * 2, self.max_backoff)
+                if backoff != state["backoff"]:
+                    logger.info(f"下载器 {self.name} {'写入出错' if error else '响应变慢'}，"
+                                f"写入速率降为 {round(self.rate / backoff, 2)} 次/秒")
+                state["backoff"] = backoff
+            elif state["backoff"] > 1:
+                state["backoff"] = max(state["backoff"] * 0.9, 1.0)
@@ -1,17 +1,30 @@
-import datetime
 import threading
+from collections import Counter
+from time import monotonic
 from typing import List, Tuple, Dict, Any, Optional
 
-import pytz
-from app.helper.sites import SitesHelper
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
+from app import schemas
 from app.core.config import settings
-from app.helper.downloader import DownloaderHelper
 from app.log import logger
 from app.plugins import _PluginBase
 from app.schemas import ServiceInfo
-from app.utils.string import StringUtils
+
+from .budget import ScanBudget, ScanCursor
+from .capture import TorrentRecorder
+from .content import TR_FILES_CHUNK, ContentCache, ContentRule, parse_content_map
+from .health import DownloaderHealth
+from .jobs import Job, JobRegistry
+from .pipeline import WritePipeline
+from .plan import ChangePlan, load_plans, parse_label_map, parse_limit_map, plan_page, remove_plans, save_plans
+from .reader import TorrentReader
+from .record import TorrentRecord, tracker_domain
+from .registry import LabelRegistry
+from .rules import Rule, RuleEngine, parse_rules
+from .runner import SingleFlight
+from .snapshot import SnapshotCache
+from .stats import RunStats, NullStats, RunHistory, history_page
+from .summary import ChangeSummary
+from .throttle import WriteLimiter
 
 
 class Tag(_PluginBase):
@@ -22,7 +35,7 @@ class Tag(_PluginBase):
     # 插件图标
     plugin_icon = "Youtube-dl_B.png"
     # 插件版本
-    plugin_version = "1.2.1"
+    plugin_version = "1.3.27"
     # 插件作者
     plugin_author = "ClarkChen"
     # 作者主页
@@ -38,14 +51,39 @@ class Tag(_PluginBase):
 
     # 退出事件
     _event = threading.Event()
+    # 运行保护，定时任务与立即运行共用
+    _runner = SingleFlight(LOG_TAG)
+    # 接口提交的定向运行
+    _jobs = JobRegistry()
+    # 种子读取，保存增量扫描的状态
+    _reader = TorrentReader(LOG_TAG)
+    _health = DownloaderHealth(LOG_TAG)
     # 私有属性
-    sites_helper = None
-    downloader_helper = None
-    _scheduler = None
+    _sites_helper = None
+    _downloader_helper = None
+    # (生成时间, 表单中的下载器选项)
+    _form_options = None
     _enabled = False
     _onlyonce = False
     _cover = False
+    _reconcile = False
     _site_first = False
+    _pipeline = False
+    _capture = False
+    _stats = False
+    _dry_run = False
+    _apply_plan = False
+    _budget_seconds = 0
+    _budget_calls = 0
+    _write_rate = 0
+    _write_burst = 5
+    _concurrency = 4
+    _log_sample = 100
+    _incremental = False
+    _full_hours = 24
+    _page_size = 0
+    _snapshot_ttl = 0
+    _history: RunHistory = None
     _interval = "计划任务"
     _interval_cron = "0 12 * * *"
     _interval_time = 24
@@ -53,16 +91,35 @@ class Tag(_PluginBase):
     _downloaders = None
     _tracker_map = "tracker地址:站点标签"
     _save_path_map = "保存地址:标签"
+    _content_map = ""
+    _rule_map = ""
+    _rule_engine: RuleEngine = None
+    # 配置的默认示例行，不产生标签
+    _examples = {("tracker地址", "站点标签"), ("保存地址", "标签")}
 
     def init_plugin(self, config: dict = None):
-        self.sites_helper = SitesHelper()
-        self.downloader_helper = DownloaderHelper()
         # 读取配置
         if config:
             self._enabled = config.get("enabled")
             self._onlyonce = config.get("onlyonce")
             self._cover = config.get("cover")
+            self._reconcile = config.get("reconcile")
             self._site_first = config.get("site_first")
+            self._pipeline = config.get("pipeline")
+            self._capture = config.get("capture")
+            self._stats = config.get("stats")
+            self._dry_run = config.get("dry_run")
+            self._apply_plan = config.get("apply_plan")
+            self._budget_seconds = self.str_to_number(config.get("budget_seconds"), 0)
+            self._budget_calls = self.str_to_number(config.get("budget_calls"), 0)
+            self._write_rate = self.str_to_number(config.get("write_rate"), 0)
+            self._write_burst = self.str_to_number(config.get("write_burst"), 5)
+            self._concurrency = self.str_to_number(config.get("concurrency"), 4)
+            self._log_sample = self.str_to_number(config.get("log_sample"), 100)
+            self._incremental = config.get("incremental")
+            self._full_hours = self.str_to_number(config.get("full_hours"), 24)
+            self._page_size = self.str_to_number(config.get("page_size"), 0)
+            self._snapshot_ttl = self.str_to_number(config.get("snapshot_ttl"), 0)
             self._interval = config.get("interval") or "计划任务"
             self._interval_cron = config.get("interval_cron") or "0 12 * * *"
             self._interval_time = self.str_to_number(config.get("interval_time"), 24)
@@ -70,26 +127,80 @@ class Tag(_PluginBase):
             self._downloaders = config.get("downloaders")
             self._tracker_map = config.get("tracker_map") or "tracker地址:站点标签"
             self._save_path_map = config.get("save_path_map") or "保存地址:标签"
+            self._content_map = config.get("content_map") or ""
+            self._rule_map = config.get("rule_map") or ""
+
+        # 规则在配置变更时编译一次，扫描时每个种子一次匹配
+        rules, errors = parse_rules(self._rule_map)
+        for error in errors:
+            logger.warning(f"{self.LOG_TAG}忽略无法解析的规则 {error}")
+        self._rule_engine = RuleEngine(rules)
+
+        # 运行记录在首次使用时读取，下拉选项在配置变更后重新生成
+        self._history = None
+        self._form_options = None
 
         # 停止现有任务
         self.stop_service()
+        # 配置变更后下一次运行重新全量扫描
+        self._reader.reset()
+        # 后台探测下载器连接状态，运行时不再等待未连接的下载器
+        self._health.reset()
+        if self._enabled and self._downloaders:
+            self._health.start(self._configured_services)
 
         if self._onlyonce:
-            # 创建定时任务控制器
-            self._scheduler = BackgroundScheduler(timezone=settings.TZ)
             # 执行一次, 关闭onlyonce
             self._onlyonce = False
             config.update({"onlyonce": self._onlyonce})
             self.update_config(config)
-            # 启动自动标签
-            self._scheduler.add_job(func=self._complemented_tags, trigger='date',
-                                    run_date=datetime.datetime.now(
-                                        tz=pytz.timezone(settings.TZ)) + datetime.timedelta(seconds=3)
-                                    )
-            if self._scheduler and self._scheduler.get_jobs():
-                # 启动服务
-                self._scheduler.print_jobs()
-                self._scheduler.start()
+            # 启动自动标签，正在运行时合并到当前运行之后
+            self._runner.submit(self._complemented_tags, trigger="立即运行")
+
+        if self._apply_plan:
+            # 执行一次, 关闭apply_plan
+            self._apply_plan = False
+            config.update({"apply_plan": self._apply_plan})
+            self.update_config(config)
+            self._runner.submit(self._apply_saved_plan, trigger="执行计划")
+
+    @property
+    def sites_helper(self):
+        """
+        站点帮助类，首次使用时创建
+        """
+        if self._sites_helper is None:
+            from app.helper.sites import SitesHelper
+            self._sites_helper = SitesHelper()
+        return self._sites_helper
+
+    @property
+    def downloader_helper(self):
+        """
+        下载器帮助类，首次使用时创建
+        """
+        if self._downloader_helper is None:
+            from app.helper.downloader import DownloaderHelper
+            self._downloader_helper = DownloaderHelper()
+        return self._downloader_helper
+
+    @property
+    def history(self) -> RunHistory:
+        """
+        运行记录，首次使用时读取
+        """
+        if self._history is None:
+            self._history = RunHistory(self.get_data("history") or [])
+        return self._history
+
+    def _downloader_options(self) -> List[Dict[str, str]]:
+        """
+        表单中的下载器选项，缓存至插件配置变更，最长一分钟
+        """
+        if self._form_options is None or monotonic() - self._form_options[0] > 60:
+            self._form_options = (monotonic(), [{"title": config.name, "value": config.name}
+                                                for config in self.downloader_helper.get_configs().values()])
+        return self._form_options[1]
 
     @property
     def service_infos(self) -> Optional[Dict[str, ServiceInfo]]:
@@ -97,17 +208,13 @@ class Tag(_PluginBase):
             logger.warning("尚未配置下载器，请检查配置")
             return None
 
-        services = self.downloader_helper.get_services(name_filters=self._downloaders)
+        services = self._configured_services()
         if not services:
             logger.warning("获取下载器实例失败，请检查配置")
             return None
 
-        active_services = {}
-        for service_name, service_info in services.items():
-            if service_info.instance.is_inactive():
-                logger.warning(f"下载器 {service_name} 未连接，请检查配置")
-            else:
-                active_services[service_name] = service_info
+        # 使用后台探测缓存的连接状态，未连接的下载器跳过
+        active_services = self._health.active(services)
 
         if not active_services:
             logger.warning("没有已连接的下载器，请检查配置")
@@ -115,6 +222,14 @@ class Tag(_PluginBase):
 
         return active_services
 
+    def _configured_services(self) -> Optional[Dict[str, ServiceInfo]]:
+        """
+        已配置的下载器，不检查连接状态
+        """
+        if not self._downloaders:
+            return None
+        return self.downloader_helper.get_services(name_filters=self._downloaders)
+
     def get_state(self) -> bool:
         return self._enabled
 
@@ -123,7 +238,91 @@ class Tag(_PluginBase):
         pass
 
     def get_api(self) -> List[Dict[str, Any]]:
-        pass
+        return [{
+            "path": "/stats",
+            "endpoint": self.get_stats,
+            "methods": ["GET"],
+            "summary": "运行统计",
+            "description": "最近运行的分阶段耗时、下载器接口调用次数、各下载器汇总和连接状态",
+        }, {
+            "path": "/plan",
+            "endpoint": self.get_plan,
+            "methods": ["GET"],
+            "summary": "变更计划",
+            "description": "仅生成计划时保存的完整计划，包含各下载器待写入的种子",
+        }, {
+            "path": "/run",
+            "endpoint": self.run_job,
+            "methods": ["GET", "POST"],
+            "summary": "定向运行",
+            "description": "只处理指定下载器(downloader)、指定种子(hashes，英文逗号分隔)或只应用一条规则"
+                           "(rule，规则配置的行号)，返回任务id",
+        }, {
+            "path": "/status",
+            "endpoint": self.get_status,
+            "methods": ["GET"],
+            "summary": "运行进度",
+            "description": "指定任务id(job)时返回该任务的进度，否则返回最近的任务",
+        }]
+
+    def get_stats(self, apikey: str) -> schemas.Response:
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        return schemas.Response(success=True, data={
+            "history": self.history.list(),
+            "runner": self._runner.summary(),
+            "health": self._health.summary()
+        })
+
+    def get_plan(self, apikey: str) -> schemas.Response:
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        try:
+            saved = load_plans(self.get_data_path())
+        except Exception as e:
+            return schemas.Response(success=False, message=f"读取计划失败: {str(e)}")
+        if not saved:
+            return schemas.Response(success=False, message="没有已保存的计划")
+        summary, plans = saved
+        return schemas.Response(success=True, data={
+            "summary": summary,
+            "plans": [plan.to_dict() for plan in plans]
+        })
+
+    def run_job(self, apikey: str, downloader: str = None, hashes: str = None,
+                rule: str = None) -> schemas.Response:
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        if not self._enabled:
+            return schemas.Response(success=False, message="插件未启用")
+        if downloader and downloader not in (self._downloaders or []):
+            return schemas.Response(success=False, message=f"下载器 {downloader} 未在插件中配置")
+        hash_list = [_hash.strip().lower() for _hash in (hashes or "").split(",") if _hash.strip()]
+        only_rule = None
+        if rule:
+            line = self.str_to_number(rule, 0)
+            only_rule = next((item for item in (self._rule_engine.rules if self._rule_engine else [])
+                              if item.line == line), None)
+            if not only_rule:
+                return schemas.Response(success=False, message=f"第 {rule} 行没有规则")
+        job = self._jobs.create(params={"downloader": downloader, "hashes": len(hash_list), "rule": rule})
+        # 排队等待正在进行的运行结束，不与定时任务合并
+        self._runner.enqueue(self._run_job, trigger="接口", job=job, downloader=downloader or None,
+                             hashes=hash_list or None, only_rule=only_rule)
+        return schemas.Response(success=True, data={"job": job.id})
+
+    def get_status(self, apikey: str, job: str = None) -> schemas.Response:
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        if job:
+            item = self._jobs.get(job)
+            if not item:
+                return schemas.Response(success=False, message=f"任务 {job} 不存在")
+            return schemas.Response(success=True, data=item.to_dict())
+        return schemas.Response(success=True, data={
+            "jobs": self._jobs.list(),
+            "runner": self._runner.summary()
+        })
 
     def get_service(self) -> List[Dict[str, Any]]:
         """
@@ -144,7 +343,7 @@ class Tag(_PluginBase):
                             "id": "Tag",
                             "name": "自动补全标签",
                             "trigger": "interval",
-                            "func": self._complemented_tags,
+                            "func": self._scheduled_run,
                             "kwargs": {
                                 "hours": self._interval_time
                             }
@@ -157,17 +356,18 @@ class Tag(_PluginBase):
                             "id": "Tag",
                             "name": "自动补全标签",
                             "trigger": "interval",
-                            "func": self._complemented_tags,
+                            "func": self._scheduled_run,
                             "kwargs": {
                                 "minutes": self._interval_time
                             }
                         }]
                 else:
+                    from apscheduler.triggers.cron import CronTrigger
                     return [{
                         "id": "Tag",
                         "name": "自动补全标签",
                         "trigger": CronTrigger.from_crontab(self._interval_cron),
-                        "func": self._complemented_tags,
+                        "func": self._scheduled_run,
                         "kwargs": {}
                     }]
         return []
@@ -176,149 +376,536 @@ class Tag(_PluginBase):
     def str_to_number(s: str, i: int) -> int:
         try:
             return int(s)
-        except ValueError:
+        except (TypeError, ValueError):
             return i
 
-    def _complemented_tags(self):
-        if not self.service_infos:
+    def _scheduled_run(self):
+        """
+        定时任务入口，上一次运行未结束时合并触发
+        """
+        self._runner.run(self._complemented_tags, trigger="定时任务")
+
+    def _run_job(self, trigger: str, job: Job, **kwargs):
+        """
+        运行接口提交的定向任务，记录任务状态
+        """
+        job.start()
+        try:
+            self._complemented_tags(trigger=trigger, job=job, **kwargs)
+        except Exception as e:
+            job.finish("failed", str(e))
+            raise
+        job.finish("stopped" if self._event.is_set() else "done")
+
+    def _complemented_tags(self, trigger: str = "定时任务", job: Job = None, downloader: str = None,
+                           hashes: List[str] = None, only_rule: Rule = None):
+        """
+        :param job: 记录进度的任务，接口提交时传入
+        :param downloader: 只处理该下载器
+        :param hashes: 只处理这些种子
+        :param only_rule: 只应用这一条规则，不按保存路径、站点、文件贴标签
+        """
+        job = job or Job(trigger)
+        service_infos = self.service_infos
+        if not service_infos:
+            job.message = "没有可用的下载器"
             return
-        logger.info(f"{self.LOG_TAG}开始执行 ...")
+        targeted = bool(downloader or hashes or only_rule)
+        if downloader:
+            if downloader not in service_infos:
+                logger.warning(f"{self.LOG_TAG}下载器 {downloader} 未连接")
+                job.message = f"下载器 {downloader} 未连接"
+                return
+            service_infos = {downloader: service_infos[downloader]}
+        dry_run = self._dry_run
+        logger.info(f"{self.LOG_TAG}开始执行{'，仅生成计划' if dry_run else ''} ...")
+        stats = RunStats(trigger=trigger) if self._stats else NullStats()
+        # 生成计划需要分析全部种子，不分批扫描；定向运行处理的种子较少，也不分批
+        budget = ScanBudget() if dry_run or targeted \
+            else ScanBudget(seconds=self._budget_seconds, calls=self._budget_calls)
+        cursor = ScanCursor(self.get_data("cursor") if budget.enabled else None)
+        if cursor:
+            logger.info(f"{self.LOG_TAG}从下载器 {cursor.downloader} 上次的位置继续扫描")
+        recorder = self._get_recorder()
         # 所有站点索引
-        indexers = [indexer.get("name") for indexer in self.sites_helper.get_indexers()]
+        with stats.phase("站点索引"):
+            site_indexers = self.sites_helper.get_indexers()
+        if recorder:
+            recorder.add_indexers(site_indexers)
+        indexers = [indexer.get("name") for indexer in site_indexers]
         indexers = set(indexers)
-        tracker_maps = self._tracker_map.split("\n")
-        save_path_maps = self._save_path_map.split("\n")
-        tracker_map = {}
-        save_path_map = {}
-        for item in tracker_maps:
-            i = item.split(":")
-            _tracker = i[0]
-            _label = i[1]
-            tracker_map[_tracker] = _label
-        for item in save_path_maps:
-            i = item.split(":")
-            _path = i[0]
-            _label = i[1]
-            save_path_map[_path] = _label
-        for service in self.service_infos.values():
-            downloader = service.name
+        tracker_map = self._label_map(self._tracker_map)
+        save_path_map = self._label_map(self._save_path_map)
+        # 按文件构成贴标签时读取持久缓存，只请求未缓存种子的文件列表
+        content_rules = parse_content_map(self._content_map) if not only_rule else []
+        content = ContentCache(self.get_data_path(), log_tag=self.LOG_TAG) if content_rules else None
+        # 登记当前配置产生的标签，配置中已删除的标签为失效标签
+        registry = LabelRegistry(self.get_data("labels"))
+        active = self._config_labels(tracker_map, save_path_map, content_rules)
+        registry.manage(active)
+        if not only_rule:
+            registry.forget(active)
+        # 失效标签 -> 本次运行中仍带有该标签的种子数
+        stale = Counter()
+        if self._reconcile and not self._cover and not only_rule:
+            stale.update({label: 0 for label in registry.retired(set(active) | indexers)})
+            if stale:
+                logger.info(f"{self.LOG_TAG}清理失效标签：{'、'.join(stale)}，本次全量扫描")
+        # 联动限速，读取自动限速插件的配置
+        limit_config = self._get_limit_config()
+        # 分批扫描时按下载器名称、种子hash的固定顺序处理，便于从游标处继续
+        downloaders = cursor.remaining(list(service_infos)) if budget.enabled else list(service_infos)
+        plans: List[ChangePlan] = []
+        for downloader in downloaders:
+            service = service_infos[downloader]
             downloader_obj = service.instance
+            if budget.exhausted():
+                cursor.move(downloader)
+                break
             logger.info(f"{self.LOG_TAG}开始扫描下载器 {downloader} ...")
             if not downloader_obj:
                 logger.error(f"{self.LOG_TAG} 获取下载器失败 {downloader}")
                 continue
-            # 获取下载器中的种子
-            torrents, error = downloader_obj.get_torrents()
-            # 如果下载器获取种子发生错误 或 没有种子 则跳过
-            if error or not torrents:
-                continue
+            # 获取下载器中的种子，qBittorrent 设置分页时处理完一页再读取下一页
+            if hashes:
+                pages = self._reader.select(service, hashes, stats=stats)
+            else:
+                pages = self._reader.pages(service, stats=stats, incremental=self._incremental and not stale,
+                                           full_hours=self._full_hours, page_size=self._page_size,
+                                           ttl=self._snapshot_ttl, ordered=budget.enabled)
             logger.info(f"{self.LOG_TAG}下载器 {downloader} 分析种子信息中 ...")
-            for torrent in torrents:
-                try:
-                    if self._event.is_set():
-                        logger.info(f"{self.LOG_TAG}停止服务")
-                        return
-                    # 获取种子hash
-                    _hash = self._get_hash(torrent=torrent, dl_type=service.type)
-                    # 获取种子存储地址
-                    _path = self._get_path(torrent=torrent, dl_type=service.type)
-                    if not _hash or not _path:
-                        continue
-                    torrent_labels = []
-                    for key, label in save_path_map.items():
-                        if key in _path:
-                            torrent_labels.append(label)
+            limit_map = limit_config.get("tag_map") if downloader in limit_config.get("downloaders") else None
+            plan = ChangePlan(downloader=downloader, dl_type=service.type)
+            changes = ChangeSummary(self.LOG_TAG, downloader, sample=self._log_sample)
+            if cursor.downloader != downloader:
+                cursor.move(downloader)
+            # 预算用尽或停止服务时停在的种子
+            stopped = None
+            for torrents in stats.timed(pages, "获取种子", downloader):
+                budget.spend()
+                stats.torrents(downloader, len(torrents))
+                job.total += len(torrents)
+                if recorder:
+                    recorder.add_downloader(name=downloader, dl_type=service.type, torrents=torrents,
+                                            load_trackers=lambda t: self._reader.trackers(service, t, stats))
+                # 本页剩余预算内可以分析的种子，预读的请求已计入预算，分析这些种子时不再因预算停止
+                pending = [torrent for torrent in torrents
+                           if not (budget.enabled and cursor.done(downloader, torrent.hash))]
+                affordable = self._affordable(pending, budget=budget, indexers=indexers, dl_type=service.type,
+                                              content=content, only_rule=only_rule)
+                prefetched = set()
+                # 并发读取本页需要按tracker匹配站点的种子
+                if self._concurrency > 1:
+                    wanted = [torrent for torrent in affordable
+                              if self._needs_trackers(torrent, indexers, only_rule=only_rule)]
+                    with stats.phase("获取tracker"):
+                        fetched = self._reader.prefetch_trackers(service, wanted, workers=self._concurrency)
+                    stats.count("torrents_trackers", downloader, num=fetched)
+                    budget.spend(fetched)
+                    prefetched.update(torrent.hash for torrent in affordable)
+                if content:
+                    budget.spend(content.prefetch(service, affordable, workers=self._concurrency, stats=stats))
+                    prefetched.update(torrent.hash for torrent in affordable)
+                with stats.phase("分析种子", downloader):
+                    for torrent in affordable:
+                        if self._event.is_set() or (budget.exhausted() and torrent.hash not in prefetched):
+                            stopped = torrent.hash
                             break
-                    site = None
-                    torrent_tags = None
-                    if service.type == "qbittorrent":
-                        torrent_tags = self._get_tags(torrent=torrent, dl_type=service.type)
-                        if self._cover:
-                            downloader_obj.qbc.torrents_remove_tags(torrent_hashes= _hash,tags= torrent_tags)
-                            torrent_tags = None
-                        else:
-                            site = indexers.intersection(set(torrent_tags))
+                        try:
+                            final_tags = self._plan_torrent_tags(plan=plan, torrent=torrent, service=service,
+                                                                 indexers=indexers, tracker_map=tracker_map,
+                                                                 save_path_map=save_path_map, stats=stats,
+                                                                 budget=budget, changes=changes,
+                                                                 content=content, content_rules=content_rules,
+                                                                 stale=stale, only_rule=only_rule)
+                            if limit_map and final_tags is not None:
+                                self._plan_torrent_limit(plan=plan, torrent=torrent, dl_type=service.type,
+                                                         tags=final_tags, limit_map=limit_map,
+                                                         cover=limit_config.get("cover"))
+                        except Exception as e:
+                            stats.error()
+                            job.errors += 1
+                            logger.error(
+                                f"{self.LOG_TAG}分析种子信息时发生了错误: {str(e)}")
+                        job.processed += 1
+                        cursor.move(downloader, torrent.hash)
                     else:
-                        if not self._cover:
-                            torrent_tags = self._get_tags(torrent=torrent, dl_type=service.type)
-                            site = indexers.intersection(set(torrent_tags))
-                    if not site:
-                        trackers = self._get_trackers(torrent=torrent, dl_type=service.type)
-                        for tracker in trackers:
-                            for key, label in tracker_map.items():
-                                if key in tracker:
-                                    site = label
-                                    break
-                            else:
-                                domain = StringUtils.get_url_domain(tracker)
-                                site_info = self.sites_helper.get_indexer(domain)
-                                if site_info:
-                                    site = site_info.get("name")
-                            if site:
-                                torrent_labels.append(site)
-                                break
-                    if torrent_labels:
-                        self._set_torrent_info(service=service, _hash=_hash, _tags=torrent_labels, _original_tags=torrent_tags)
-                except Exception as e:
-                    logger.error(
-                        f"{self.LOG_TAG}分析种子信息时发生了错误: {str(e)}")
+                        if len(affordable) < len(pending):
+                            # 超出本次预算的种子下次运行继续
+                            stopped = pending[len(affordable)].hash
+                if stopped is not None:
+                    break
+            # 提前结束时关闭读取，共享快照读完剩余的页后保存，之后的写入才能同步修改快照
+            pages.close()
+            changes.flush("计划补全标签" if dry_run else "补全标签")
+            if stopped is not None and not budget.enabled:
+                if content:
+                    content.save()
+                if registry.dirty:
+                    self.save_data("labels", registry.to_dict())
+                logger.info(f"{self.LOG_TAG}停止服务")
+                return
+            if dry_run:
+                plans.append(plan)
+                logger.info(f"{self.LOG_TAG}下载器 {downloader} 计划 {plan.request_count()} 次写入请求，本次不写入")
+                continue
+            requests = self._write_plan(service=service, plan=plan, stats=stats, job=job, registry=registry)
+            job.writes += requests
+            budget.spend(requests)
+            if stopped is not None:
+                break
+            # 下载器处理完毕，下一个下载器从头开始
+            cursor.move(None)
+            if budget.enabled:
+                self.save_data("cursor", cursor.to_dict())
+        if dry_run and targeted:
+            # 定向运行的计划只包含部分种子，不保存，避免覆盖完整扫描生成的计划
+            job.message = f"仅生成计划，预计 {sum(plan.request_count() for plan in plans)} 次写入请求，定向运行不保存计划"
+        elif dry_run:
+            self._save_plans(plans, trigger=trigger)
+        if stale and not budget.enabled and not targeted and len(service_infos) == len(self._downloaders or []):
+            # 完整扫描中已没有种子带有的失效标签不再登记，本次移除的标签下次运行确认后再移除登记
+            registry.drop(label for label, num in stale.items() if not num)
+        if registry.dirty:
+            self.save_data("labels", registry.to_dict())
+        if content:
+            # 全部下载器完整扫描后清理已删除种子的缓存
+            content.save(prune=not budget.enabled and not self._incremental and not targeted
+                         and len(service_infos) == len(self._downloaders or []))
+        if budget.enabled:
+            self.save_data("cursor", cursor.to_dict())
+            if cursor:
+                reason = "停止服务" if self._event.is_set() else "本次运行预算已用尽"
+                logger.info(f"{self.LOG_TAG}{reason}，下次从下载器 {cursor.downloader} 继续扫描")
+        if recorder:
+            self._save_recorder(recorder)
+        self._save_stats(stats)
         logger.info(f"{self.LOG_TAG}执行完成")
 
-    @staticmethod
-    def _get_hash(torrent: Any, dl_type: str):
+    def _write_plan(self, service: ServiceInfo, plan: ChangePlan, stats: RunStats, job: Job = None,
+                    registry: LabelRegistry = None) -> int:
+        """
+        批量写入单个下载器的变更计划，返回请求数
+
+        :param registry: 记录写入过的标签，之后配置中删除时才清理
+        """
+        downloader = service.name
+        limiter = WriteLimiter.of(service, rate=self._write_rate, burst=self._write_burst)
+        throttled = limiter.throttled
+        requests = 0
         try:
-            return torrent.get("hash") if dl_type == "qbittorrent" else torrent.hashString
+            pipeline = WritePipeline(downloader, workers=self._concurrency, limiter=limiter, log_tag=self.LOG_TAG)
+            with stats.phase("写入", downloader):
+                calls = plan.apply(service=service, log_tag=self.LOG_TAG, pipeline=pipeline)
+                failed = pipeline.finish()
+            if registry:
+                registry.wrote(plan.written_labels())
+            stats.error(failed)
+            if job:
+                job.errors += failed
+            # 写入全部成功时同步修改共享快照，否则丢弃快照
+            if failed:
+                SnapshotCache.of(service).invalidate()
+            else:
+                plan.patch(SnapshotCache.of(service))
+            for kind, num in calls.items():
+                stats.count(kind, downloader, num=num, write=True)
+            requests = sum(calls.values())
         except Exception as e:
-            print(str(e))
-            return ""
+            stats.error()
+            if job:
+                job.errors += 1
+            logger.error(f"{self.LOG_TAG}下载器 {downloader} 写入标签时发生了错误: {str(e)}")
+        if limiter.throttled > throttled:
+            stats.throttled(downloader, limiter.throttled - throttled)
+            logger.info(f"{self.LOG_TAG}下载器 {downloader} 写入限流等待 {round(limiter.throttled - throttled, 1)} 秒")
+        return requests
 
-    @staticmethod
-    def _get_path(torrent: Any, dl_type: str):
+    def _save_plans(self, plans: List[ChangePlan], trigger: str):
+        """
+        保存本次生成的计划，详情页显示汇总
+        """
         try:
-            return torrent.get("save_path") if dl_type == "qbittorrent" else torrent.download_dir
+            summary = save_plans(self.get_data_path(), plugin="Tag", trigger=trigger, plans=plans)
         except Exception as e:
-            print(str(e))
-            return ""
+            logger.error(f"{self.LOG_TAG}保存计划失败: {str(e)}")
+            return
+        self.save_data("plan", summary)
+        logger.info(f"{self.LOG_TAG}计划已生成，共 {len(plans)} 个下载器，预计 {summary.get('requests')} 次写入请求")
 
-    @staticmethod
-    def _get_trackers(torrent: Any, dl_type: str):
+    def _apply_saved_plan(self, trigger: str = "执行计划"):
+        """
+        按保存的计划批量写入，不重新分析种子，执行后删除计划
+        """
         try:
-            if dl_type == "qbittorrent":
-                return [tracker.get("url") for tracker in (torrent.trackers or []) if tracker.get("tier", -1) >= 0 and tracker.get("url")]
-            else:
-                return [tracker.announce for tracker in (torrent.trackers or []) if tracker.tier >= 0 and tracker.announce]
+            saved = load_plans(self.get_data_path())
         except Exception as e:
-            print(str(e))
-            return []
+            logger.error(f"{self.LOG_TAG}读取计划失败: {str(e)}")
+            return
+        if not saved:
+            logger.warning(f"{self.LOG_TAG}没有已保存的计划")
+            return
+        summary, plans = saved
+        service_infos = self.service_infos
+        if not service_infos:
+            return
+        logger.info(f"{self.LOG_TAG}开始执行 {summary.get('time')} 生成的计划 ...")
+        stats = RunStats(trigger=trigger) if self._stats else NullStats()
+        registry = LabelRegistry(self.get_data("labels"))
+        # 下载器不可用时保留其计划，下次继续执行
+        remaining = []
+        for plan in plans:
+            if self._event.is_set():
+                logger.info(f"{self.LOG_TAG}停止服务")
+                break
+            service = service_infos.get(plan.downloader)
+            if not service or service.type != plan.dl_type:
+                logger.warning(f"{self.LOG_TAG}下载器 {plan.downloader} 不可用，保留其计划")
+                remaining.append(plan)
+                continue
+            self._write_plan(service=service, plan=plan, stats=stats, registry=registry)
+        if registry.dirty:
+            self.save_data("labels", registry.to_dict())
+        if self._event.is_set():
+            return
+        if remaining:
+            self._save_plans(remaining, trigger=summary.get("trigger"))
+        else:
+            remove_plans(self.get_data_path())
+            self.del_data("plan")
+        self._save_stats(stats)
+        logger.info(f"{self.LOG_TAG}计划执行完成")
 
-    @staticmethod
-    def _get_tags(torrent: Any, dl_type: str):
+    def _save_stats(self, stats: RunStats):
+        """
+        保存本次运行记录
+        """
+        if not stats.enabled:
+            return
+        self.history.add(stats.finish())
+        self.save_data("history", self.history.list())
+
+    def _get_recorder(self) -> Optional[TorrentRecorder]:
+        """
+        开启录制样本时，记录本次运行获取到的数据
+        """
+        if not self._capture:
+            return None
+        return TorrentRecorder(plugin="Tag", configs={"Tag": self.get_config("Tag"), "Limit": self.get_config("Limit")})
+
+    def _save_recorder(self, recorder: TorrentRecorder):
+        """
+        保存录制的样本，只录制一次，保存后关闭录制
+        """
         try:
-            return [str(tag).strip() for tag in torrent.get("tags", "").split(',')] \
-                if dl_type == "qbittorrent" else torrent.labels or []
+            file = recorder.save(self.get_data_path())
+            logger.info(f"{self.LOG_TAG}样本已保存: {file}")
         except Exception as e:
-            print(str(e))
-            return []
+            logger.error(f"{self.LOG_TAG}保存样本失败: {str(e)}")
+        self._capture = False
+        config = self.get_config() or {}
+        config.update({"capture": False})
+        self.update_config(config)
 
-    def _set_torrent_info(self, service: ServiceInfo, _hash: str, _tags=None, _original_tags: list = None):
-        if not service or not service.instance:
-            return
-        downloader_obj = service.instance
+    def _get_limit_config(self) -> Dict[str, Any]:
+        """
+        联动限速时读取自动限速插件的配置
+        """
+        if not self._pipeline:
+            return {"downloaders": []}
+        config = self.get_config("Limit") or {}
+        tag_map = parse_limit_map(config.get("tag_map"))
+        if not config.get("enabled") or not tag_map:
+            logger.info(f"{self.LOG_TAG}自动限速插件未启用或未配置标签限速，跳过联动限速")
+            return {"downloaders": []}
+        return {
+            "downloaders": config.get("downloaders") or [],
+            "tag_map": tag_map,
+            "cover": config.get("cover")
+        }
+
+    def _label_map(self, label_map: str) -> Dict[str, str]:
+        """
+        解析 关键字:标签 配置，跳过默认的示例行
+        """
+        return {key: label for key, label in parse_label_map(label_map).items() if (key, label) not in self._examples}
+
+    def _config_labels(self, tracker_map: Dict[str, str], save_path_map: Dict[str, str],
+                       content_rules: List[ContentRule]) -> Dict[str, str]:
+        """
+        当前配置产生的标签 -> 来源，来源与计划汇总中的规则一致
+        """
+        labels = {}
+        for key, label in tracker_map.items():
+            labels.setdefault(label, f"tracker {key}")
+        for key, label in save_path_map.items():
+            labels.setdefault(label, f"保存路径 {key}")
+        for rule in content_rules or []:
+            labels.setdefault(rule.label, f"文件 {rule}")
+        for rule in self._rule_engine.rules if self._rule_engine else []:
+            for label in rule.labels:
+                labels.setdefault(label, f"规则 第{rule.line}行")
+        return labels
+
+    def _affordable(self, torrents: List[TorrentRecord], budget: ScanBudget, indexers: set, dl_type: str,
+                    content: ContentCache = None, only_rule: Rule = None) -> List[TorrentRecord]:
+        """
+        按顺序取剩余接口调用次数内可以分析的种子，预读 tracker、文件列表只针对这些种子
+
+        至少包含第一个需要请求的种子，预算很少时每次运行也能向前推进游标。
+        """
+        remaining = budget.remaining_calls()
+        if remaining is None:
+            return torrents
+        calls, files = 0, 0
+        for i, torrent in enumerate(torrents):
+            cost = 1 if self._needs_trackers(torrent, indexers, only_rule=only_rule) else 0
+            if content and torrent.hash and torrent.hash not in content:
+                files += 1
+                # Transmission 每 TR_FILES_CHUNK 个种子一次请求
+                cost += 1 if dl_type == "qbittorrent" or files % TR_FILES_CHUNK == 1 else 0
+            if cost and calls + cost > remaining and i > 0:
+                return torrents[:i]
+            calls += cost
+        return torrents
+
+    def _needs_trackers(self, torrent: TorrentRecord, indexers: set, only_rule: Rule = None) -> bool:
+        """
+        种子是否需要按tracker匹配站点，与 _plan_torrent_tags 的判断一致
+        """
+        if torrent.trackers is not None or not torrent.hash or not torrent.path:
+            return False
+        if only_rule:
+            return only_rule.uses("tracker")
+        if self._rule_engine and self._rule_engine.uses("tracker"):
+            return True
+        return self._cover or not indexers.intersection(torrent.tags)
+
+    def _plan_torrent_tags(self, plan: ChangePlan, torrent: TorrentRecord, service: ServiceInfo, indexers: set,
+                           tracker_map: Dict[str, str], save_path_map: Dict[str, str],
+                           stats: RunStats = None, budget: ScanBudget = None,
+                           changes: ChangeSummary = None, content: ContentCache = None,
+                           content_rules: List[ContentRule] = None,
+                           stale: Counter = None, only_rule: Rule = None) -> Optional[List[str]]:
+        """
+        计算单个种子需要补全的标签并记入变更计划，返回写入后种子的全部标签
+
+        :param stale: 需要清理的失效标签，记录带有各标签的种子数
+        :param only_rule: 只应用这一条规则
+        """
+        stats = stats or NullStats()
+        dl_type = service.type
+        _hash = torrent.hash
+        if not _hash or not torrent.path:
+            return None
+        torrent_labels = []
+        # 标签 -> 产生该标签的规则，用于计划汇总
+        rules = {}
+        if only_rule:
+            # 只应用指定的规则，不按保存路径、站点贴标签
+            save_path_map = {}
+        for key, label in save_path_map.items():
+            if key in torrent.path:
+                torrent_labels.append(label)
+                rules.setdefault(label, f"保存路径 {key}")
+                break
+        site = None
+        torrent_tags = list(torrent.tags)
+        # 本次移除的失效标签
+        removed = []
+        if self._cover:
+            if dl_type == "qbittorrent" and torrent_tags:
+                plan.remove(_hash, torrent_tags)
+                plan.note("覆盖原标签")
+            torrent_tags = []
+        else:
+            if stale:
+                removed = [tag for tag in torrent_tags if tag in stale]
+                if removed:
+                    stale.update(removed)
+                    torrent_tags = [tag for tag in torrent_tags if tag not in stale]
+            site = indexers.intersection(torrent_tags)
+        if not site and not only_rule:
+            if torrent.trackers is None and budget:
+                budget.spend()
+            with stats.phase("获取tracker"):
+                trackers = self._reader.trackers(service, torrent, stats)
+            for tracker in trackers:
+                for key, label in tracker_map.items():
+                    if key in tracker:
+                        site = label
+                        rules.setdefault(site, f"tracker {key}")
+                        break
+                else:
+                    domain = tracker_domain(tracker)
+                    with stats.phase("站点匹配"):
+                        site_info = self.sites_helper.get_indexer(domain)
+                    stats.count("get_indexer")
+                    if site_info:
+                        site = site_info.get("name")
+                        rules.setdefault(site, f"站点 {domain}")
+                if site:
+                    torrent_labels.append(site)
+                    break
+        profile = content.get(_hash) if content and content_rules else None
+        if profile:
+            for rule in content_rules:
+                if rule.match(profile):
+                    torrent_labels.append(rule.label)
+                    rules.setdefault(rule.label, f"文件 {rule}")
+                    break
+        engine = only_rule or self._rule_engine
+        if engine:
+            values = {"name": torrent.name, "category": torrent.category, "path": torrent.path, "size": torrent.size}
+            if engine.uses("tracker"):
+                if torrent.trackers is None and budget:
+                    budget.spend()
+                values["tracker"] = [tracker_domain(url) for url in self._reader.trackers(service, torrent, stats)]
+            with stats.phase("规则匹配"):
+                matched = engine.match(values)
+            if matched:
+                torrent_labels.extend(matched.labels)
+                for label in matched.labels:
+                    rules.setdefault(label, f"规则 第{matched.line}行")
+        new_tags = [tag for tag in dict.fromkeys(torrent_labels) if tag not in torrent_tags]
+        if not new_tags and not removed:
+            return torrent_tags
+        new_rules = [rules.get(tag) or tag for tag in new_tags] + [f"清理失效标签 {tag}" for tag in removed]
+        for rule in new_rules:
+            plan.note(rule)
         # 下载器api不通用, 因此需分开处理
-        if _original_tags:
-            if service.type == "qbittorrent":
-                _tags = list(set(_tags) - set(_original_tags))
-                downloader_obj.set_torrents_tag(ids=_hash, tags=_tags)
-            else:
-                downloader_obj.set_torrent_tag(ids=_hash, tags=_tags, org_tags=_original_tags)
+        if dl_type == "qbittorrent":
+            # 失效标签按标签分组批量移除
+            plan.remove(_hash, removed)
+            plan.add(_hash, new_tags)
+        elif torrent_tags:
+            plan.set_labels(_hash, torrent_tags + new_tags, added=new_tags)
+        elif self._site_first and isinstance(site, str) and site in new_tags:
+            plan.set_labels(_hash, [site] + [tag for tag in new_tags if tag != site], added=new_tags)
         else:
-            if service.type == "qbittorrent":
-                downloader_obj.set_torrents_tag(ids=_hash, tags=_tags)
-            else:
-                if self._site_first:
-                    _tags = _tags[::-1]
-                downloader_obj.trc.change_torrent(ids=_hash,labels=_tags)
-        logger.warn(f"{self.LOG_TAG}下载器: {service.name} 种子id: {_hash} {('  标签: ' + ','.join(_tags)) if _tags else ''}")
+            plan.set_labels(_hash, new_tags, added=new_tags)
+        message = f"下载器: {plan.downloader} 种子id: {_hash}  标签: {','.join(new_tags)}"
+        if removed:
+            message += f"  移除失效标签: {','.join(removed)}"
+        if changes:
+            changes.torrent(message, labels=new_tags, rules=new_rules)
+        else:
+            logger.info(f"{self.LOG_TAG}{message}")
+        return torrent_tags + new_tags
+
+    @staticmethod
+    def _plan_torrent_limit(plan: ChangePlan, torrent: TorrentRecord, dl_type: str, tags: List[str],
+                            limit_map: Dict[str, int], cover: bool = False):
+        """
+        按写入后的标签计算限速并记入变更计划，规则与自动限速插件一致
+        """
+        if dl_type == "qbittorrent" and not cover and torrent.up_limit > 0:
+            return
+        for tag in tags:
+            if tag in limit_map:
+                plan.limit(torrent.hash, limit_map[tag])
+                plan.note(f"限速 {tag}")
+                break
 
     def get_form(self) -> Tuple[List[dict], Dict[str, Any]]:
         return [
@@ -388,6 +975,170 @@ class Tag(_PluginBase):
                                     }
                                 ]
                             },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VCheckboxBtn',
+                                        'props': {
+                                            'model': 'capture',
+                                            'label': '录制样本'
+                                        }
+                                    }
+                                ]
+                            },
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'pipeline',
+                                            'label': '联动限速',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'stats',
+                                            'label': '运行统计',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 6
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VAlert',
+                                        'props': {
+                                            'type': 'info',
+                                            'variant': 'tonal',
+                                            'density': 'compact',
+                                            'text': '开启后贴标签时按自动限速插件的标签限速配置一并限速，自动限速插件不再重复扫描这些下载器。'
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'dry_run',
+                                            'label': '仅生成计划',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'apply_plan',
+                                            'label': '执行已保存的计划',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 6
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VAlert',
+                                        'props': {
+                                            'type': 'info',
+                                            'variant': 'tonal',
+                                            'density': 'compact',
+                                            'text': '仅生成计划时只分析不写入，计划在详情页汇总显示，也可通过 /plan 接口下载；执行已保存的计划时按计划批量写入一次，不重新分析种子。'
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'reconcile',
+                                            'label': '清理失效标签',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 9
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VAlert',
+                                        'props': {
+                                            'type': 'info',
+                                            'variant': 'tonal',
+                                            'density': 'compact',
+                                            'text': '插件会登记配置中出现过的标签，删除配置行后其标签即为失效标签；开启后按标签批量从种子上移除失效标签，不修改其他标签，无需开启覆盖模式重写全部标签。'
+                                        }
+                                    }
+                                ]
+                            }
                         ]
                     },
                     {
@@ -407,8 +1158,7 @@ class Tag(_PluginBase):
                                             'clearable': True,
                                             'model': 'downloaders',
                                             'label': '下载器',
-                                            'items': [{"title": config.name, "value": config.name}
-                                                      for config in self.downloader_helper.get_configs().values()]
+                                            'items': self._downloader_options()
                                         }
                                     }
                                 ]
@@ -495,6 +1245,221 @@ class Tag(_PluginBase):
                             }
                         ]
                     },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 6,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'budget_seconds',
+                                            'label': '单次最长运行(秒)',
+                                            'placeholder': '0'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 6,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'budget_calls',
+                                            'label': '单次最多接口调用',
+                                            'placeholder': '0'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 6
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VAlert',
+                                        'props': {
+                                            'type': 'info',
+                                            'variant': 'tonal',
+                                            'density': 'compact',
+                                            'text': '种子较多时可限制单次运行的时长或接口调用次数，用尽后下次运行从上次的位置继续，0为不限制。'
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'write_rate',
+                                            'label': '写入速率(次/秒)',
+                                            'placeholder': '0',
+                                            'hint': '下载器响应变慢或出错时自动降速，0为不限制，两个插件对同一下载器共用限流',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 6,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'write_burst',
+                                            'label': '突发写入数',
+                                            'placeholder': '5'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 6,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'concurrency',
+                                            'label': '并发请求数',
+                                            'placeholder': '4',
+                                            'hint': '同一下载器同时进行的请求数，1为逐个请求',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'log_sample',
+                                            'label': '种子日志抽样',
+                                            'placeholder': '100',
+                                            'hint': '每N个修改的种子输出一条日志，其余只在调试日志中输出；0为只输出汇总，1为全部输出',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 6,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'incremental',
+                                            'label': '增量扫描(TR)',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 6,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'full_hours',
+                                            'label': '全量扫描间隔(小时)',
+                                            'placeholder': '24',
+                                            'hint': '仅对Transmission生效，两次全量扫描之间只处理最近有活动和新增的种子',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 6,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'page_size',
+                                            'label': '分页读取(QB)',
+                                            'placeholder': '0',
+                                            'hint': '每次从qBittorrent读取的种子数，处理完一页再读下一页，降低内存峰值；'
+                                                    '请求数按页增加，下载器每页都要排序全部种子，0为一次读取全部',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 6,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'snapshot_ttl',
+                                            'label': '种子快照有效期(秒)',
+                                            'placeholder': '0',
+                                            'hint': '有效期内再次读取同一下载器直接使用快照，多个插件共用；有效期内占用全部种子精简记录的内存，0为不使用',
+                                            'persistent-hint': True
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
                     {
                         "component": "VRow",
                         "content": [
@@ -539,6 +1504,60 @@ class Tag(_PluginBase):
                             }
                         ],
                     },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {
+                                    "cols": 12
+                                },
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "content_map",
+                                            "label": "文件扩展名:标签",
+                                            "rows": 3,
+                                            "placeholder": "如:iso:软件\nflac,ape>50:音乐",
+                                            "hint": "包含该类文件，或该类文件按大小占比不低于 > 后的百分比；文件列表读取一次后缓存",
+                                            "persistent-hint": True
+                                        },
+                                    }
+                                ],
+                            }
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {
+                                    "cols": 12
+                                },
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "rule_map",
+                                            "label": "规则",
+                                            "rows": 5,
+                                            "placeholder": "如:name:re:\\b2160p\\b & size:>20G => 4K,大包\n"
+                                                           "category:movie => 电影\n"
+                                                           "path:glob:/volume1/pt/* => PT\n"
+                                                           "tracker:glob:*.m-team.cc => 馒头",
+                                            "hint": "条件为 字段:模式，字段可用 name/category/path/tracker/size，"
+                                                    "模式默认包含(name/path)或完全匹配(category/tracker域名)，"
+                                                    "re: 为正则，glob: 为通配符，size 如 >20G、1G-5G；"
+                                                    "多个条件用 & 连接，=> 后为标签；按行顺序只匹配第一条",
+                                            "persistent-hint": True
+                                        },
+                                    }
+                                ],
+                            }
+                        ],
+                    },
                     {
                         'component': 'VRow',
                         'content': [
@@ -565,27 +1584,44 @@ class Tag(_PluginBase):
         ], {
             "enabled": False,
             "onlyonce": False,
+            "capture": False,
             "cover": False,
+            "reconcile": False,
             "site_first": False,
+            "pipeline": False,
+            "stats": False,
+            "dry_run": False,
+            "apply_plan": False,
             "interval": "计划任务",
             "interval_cron": "0 12 * * *",
             "interval_time": "24",
             "interval_unit": "小时",
+            "budget_seconds": "0",
+            "budget_calls": "0",
+            "write_rate": "0",
+            "write_burst": "5",
+            "concurrency": "4",
+            "log_sample": "100",
+            "incremental": False,
+            "full_hours": "24",
+            "page_size": "0",
+            "snapshot_ttl": "0",
             "tracker_map": "tracker地址:站点标签",
-            "save_path_map": "保存地址:标签"
+            "save_path_map": "保存地址:标签",
+            "content_map": "",
+            "rule_map": ""
         }
 
     def get_page(self) -> List[dict]:
-        pass
+        return plan_page(self.get_data("plan")) \
+            + history_page(self.history.list(), self._runner.summary())
 
     def stop_service(self):
         try:
-            if self._scheduler:
-                self._scheduler.remove_all_jobs()
-                if self._scheduler.running:
-                    self._event.set()
-                    self._scheduler.shutdown()
-                    self._event.clear()
-                self._scheduler = None
+            self._health.stop()
+            self._runner.cancel()
+            self._jobs.cancel_pending()
+            if not self._runner.stop(self._event, timeout=60):
+                logger.warning(f"{self.LOG_TAG}任务 60 秒内未能停止，停止信号保持到该任务结束")
         except Exception as e:
             print(str(e))
@@ -0,0 +1,74 @@
+from time import perf_counter
+from typing import Any, Dict, List, Optional
+
+
+class ScanBudget:
+    """
+    单次运行的时间和接口调用预算，用尽后停止扫描，下次运行从游标处继续
+
+    seconds、calls 为 0 表示不限制，两者都为 0 时不分批扫描。
+    """
+
+    def __init__(self, seconds: int = 0, calls: int = 0):
+        self.seconds = max(seconds or 0, 0)
+        self.calls = max(calls or 0, 0)
+        self.spent = 0
+        self._start = perf_counter()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.seconds or self.calls)
+
+    def spend(self, num: int = 1):
+        self.spent += num
+
+    def remaining_calls(self) -> Optional[int]:
+        """
+        剩余的接口调用次数，不限制时为 None
+        """
+        return max(self.calls - self.spent, 0) if self.calls else None
+
+    def exhausted(self) -> bool:
+        if self.calls and self.spent >= self.calls:
+            return True
+        if self.seconds and perf_counter() - self._start >= self.seconds:
+            return True
+        return False
+
+
+class ScanCursor:
+    """
+    分批扫描的游标：上次停在哪个下载器的哪个种子（按hash排序）
+    """
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None):
+        data = data or {}
+        self.downloader: Optional[str] = data.get("downloader")
+        self.hash: Optional[str] = data.get("hash")
+
+    def __bool__(self):
+        return bool(self.downloader)
+
+    def remaining(self, downloaders: List[str]) -> List[str]:
+        """
+        从游标所在的下载器开始的下载器列表，游标失效时从头开始
+        """
+        downloaders = sorted(downloaders)
+        if self.downloader not in downloaders:
+            self.downloader, self.hash = None, None
+            return downloaders
+        return downloaders[downloaders.index(self.downloader):]
+
+    def done(self, downloader: str, _hash: str) -> bool:
+        """
+        按hash顺序扫描时，种子是否已在上次运行中处理过
+        """
+        return downloader == self.downloader and bool(self.hash) and (_hash or "") <= self.hash
+
+    def move(self, downloader: Optional[str], _hash: Optional[str] = None):
+        self.downloader, self.hash = downloader, _hash
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        if not self.downloader:
+            return None
+        return {"downloader": self.downloader, "hash": self.hash}
@@ -0,0 +1,210 @@
+import gzip
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.log import logger
+from app.schemas import ServiceInfo
+
+from .record import TorrentRecord
+from .stats import NullStats, RunStats
+
+CONTENT_VERSION = 2
+CONTENT_FILE = "content.json.gz"
+# Transmission 单次请求读取文件列表的种子数
+TR_FILES_CHUNK = 100
+
+# 扩展名 -> 按大小计的占比(千分比)，出现即至少为1
+Profile = Dict[str, int]
+
+
+class ContentRule:
+    """
+    按种子文件扩展名匹配的规则：包含某类文件，或某类文件按大小占比不低于 share
+    """
+
+    __slots__ = ("exts", "share", "label")
+
+    def __init__(self, exts: Tuple[str, ...], share: int, label: str):
+        self.exts = exts
+        # 千分比，0 表示包含即可
+        self.share = share
+        self.label = label
+
+    def __str__(self):
+        return ",".join(self.exts) + (f">{self.share // 10}%" if self.share else "")
+
+    def match(self, profile: Profile) -> bool:
+        share = sum(profile.get(ext, 0) for ext in self.exts)
+        return share > 0 and share >= self.share
+
+
+def parse_content_map(content_map: str) -> List[ContentRule]:
+    """
+    解析 扩展名[,扩展名][>占比%]:标签 配置，保持行顺序
+
+    如 iso:软件 表示包含 iso 文件，flac,ape>50:音乐 表示 flac、ape 文件按大小合计占一半以上。
+    """
+    rules = []
+    for item in (content_map or "").split("\n"):
+        parts = item.split(":")
+        if len(parts) < 2 or not parts[0].strip() or not parts[1].strip():
+            continue
+        cond, _, share = parts[0].partition(">")
+        exts = tuple(ext.strip().lower().lstrip(".") for ext in cond.split(",") if ext.strip())
+        share = share.strip().rstrip("%")
+        if not exts or (share and not share.isdigit()):
+            continue
+        rules.append(ContentRule(exts=exts, share=min(int(share or 0), 100) * 10, label=parts[1].strip()))
+    return rules
+
+
+def file_profile(files: Iterable[Tuple[str, int]]) -> Profile:
+    """
+    文件列表 (文件名, 大小) 按扩展名汇总为大小占比
+    """
+    sizes: Dict[str, int] = {}
+    for name, size in files:
+        ext = os.path.splitext(name or "")[1].lower().lstrip(".")
+        if ext:
+            sizes[ext] = sizes.get(ext, 0) + max(size or 0, 0)
+    total = sum(sizes.values())
+    return {sys.intern(ext): max(size * 1000 // total, 1) if total else 1 for ext, size in sizes.items()}
+
+
+class ContentCache:
+    """
+    按hash保存的种子文件扩展名构成，种子内容不会变化，读取一次后持久保存在插件数据目录
+
+    只对未缓存的种子并发读取文件列表，之后的运行不再请求下载器。磁力链接等还没有文件列表的种子不缓存，
+    下次运行重新读取。
+    """
+
+    def __init__(self, path: Path, log_tag: str = ""):
+        self.file = path / CONTENT_FILE
+        self.log_tag = log_tag
+        self._profiles: Dict[str, Profile] = {}
+        self._lock = threading.Lock()
+        # 本次运行用到的hash，全量扫描结束后清理其余的
+        self._seen: Set[str] = set()
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        if not self.file.exists():
+            return
+        try:
+            with gzip.open(self.file, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == CONTENT_VERSION:
+                self._profiles = data.get("profiles") or {}
+            elif data.get("version") == 1:
+                # 旧版本把还没有文件列表的种子也缓存为空，丢弃这些记录以便重新读取
+                self._profiles = {_hash: profile for _hash, profile in (data.get("profiles") or {}).items()
+                                  if profile}
+                self._dirty = True
+        except Exception as e:
+            logger.error(f"{self.log_tag}读取种子文件缓存失败: {str(e)}")
+
+    def __contains__(self, _hash: str) -> bool:
+        return _hash in self._profiles
+
+    def get(self, _hash: str) -> Optional[Profile]:
+        self._seen.add(_hash)
+        return self._profiles.get(_hash)
+
+    def put(self, _hash: str, profile: Profile):
+        with self._lock:
+            self._profiles[_hash] = profile
+            self._seen.add(_hash)
+            self._dirty = True
+
+    def save(self, prune: bool = False):
+        """
+        保存缓存，prune 时丢弃本次运行未出现的种子
+        """
+        if prune:
+            stale = self._profiles.keys() - self._seen
+            for _hash in stale:
+                del self._profiles[_hash]
+            self._dirty = self._dirty or bool(stale)
+        if not self._dirty:
+            return
+        try:
+            self.file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.file.with_suffix(".tmp")
+            with gzip.open(tmp, "wt", encoding="utf-8") as f:
+                json.dump({"version": CONTENT_VERSION, "profiles": self._profiles}, f,
+                          ensure_ascii=False, separators=(",", ":"))
+            tmp.replace(self.file)
+            self._dirty = False
+        except Exception as e:
+            logger.error(f"{self.log_tag}保存种子文件缓存失败: {str(e)}")
+
+    def prefetch(self, service: ServiceInfo, records: List[TorrentRecord], workers: int = 4,
+                 stats: RunStats = None) -> int:
+        """
+        并发读取未缓存种子的文件列表，返回请求数
+        """
+        stats = stats or NullStats()
+        pending = [record.hash for record in records if record.hash and self.get(record.hash) is None]
+        if not pending:
+            return 0
+        if service.type == "qbittorrent":
+            tasks = [[_hash] for _hash in pending]
+            fetch = self._qb_files
+        else:
+            tasks = [pending[i:i + TR_FILES_CHUNK] for i in range(0, len(pending), TR_FILES_CHUNK)]
+            fetch = self._tr_files
+        with stats.phase("获取文件列表"):
+            if workers <= 1 or len(tasks) < 2:
+                failed = sum(self._run(fetch, service, task) for task in tasks)
+            else:
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"files-{service.name}") as pool:
+                    futures = [pool.submit(self._run, fetch, service, task) for task in tasks]
+                failed = sum(future.result() for future in futures)
+        stats.error(failed)
+        stats.count("torrents_files" if service.type == "qbittorrent" else "torrent_get", service.name,
+                    num=len(tasks))
+        return len(tasks)
+
+    def _run(self, fetch: Callable[[ServiceInfo, List[str]], None], service: ServiceInfo, hashes: List[str]) -> int:
+        """
+        读取一批种子的文件列表，出错时记录日志，不影响其他种子，返回出错数
+        """
+        try:
+            fetch(service, hashes)
+            return 0
+        except Exception as e:
+            logger.error(f"{self.log_tag}下载器 {service.name} 获取 {len(hashes)} 个种子的文件列表失败: {str(e)}")
+            return 1
+
+    def _qb_files(self, service: ServiceInfo, hashes: List[str]):
+        for _hash in hashes:
+            try:
+                files = service.instance.qbc.torrents_files(torrent_hash=_hash)
+                if files:
+                    self.put(_hash, file_profile((file.get("name"), file.get("size")) for file in files))
+            except Exception as e:
+                logger.error(f"{self.log_tag}下载器 {service.name} 获取种子 {_hash} 的文件列表失败: {str(e)}")
+
+    def _tr_files(self, service: ServiceInfo, hashes: List[str]):
+        try:
+            torrents = service.instance.trc.get_torrents(ids=hashes, arguments=["id", "hashString", "files"])
+        except Exception as e:
+            logger.error(f"{self.log_tag}下载器 {service.name} 获取 {len(hashes)} 个种子的文件列表失败: {str(e)}")
+            return
+        for torrent in torrents:
+            try:
+                # 直接读取请求的 files 字段，get_files() 还需要 priorities、wanted 字段
+                files = torrent.fields.get("files")
+                if files:
+                    self.put(torrent.hashString, file_profile((file.get("name"), file.get("length"))
+                                                              for file in files))
+            except Exception as e:
+                logger.error(f"{self.log_tag}下载器 {service.name} 解析种子 {torrent.hashString} "
+                             f"的文件列表失败: {str(e)}")
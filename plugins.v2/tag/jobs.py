@@ -0,0 +1,89 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+
+class Job:
+    """
+    一次运行的进度：已处理/总种子数、写入请求数和错误数，供状态接口查询
+
+    进度只由运行线程更新，查询时读取的是某一时刻的近似值。
+    """
+
+    def __init__(self, trigger: str = "", params: Dict[str, Any] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.trigger = trigger
+        self.params = params or {}
+        # pending/running/done/stopped/failed/cancelled
+        self.state = "pending"
+        self.created = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.started: Optional[str] = None
+        self.finished: Optional[str] = None
+        self.total = 0
+        self.processed = 0
+        self.writes = 0
+        self.errors = 0
+        self.message = ""
+
+    def start(self):
+        self.state = "running"
+        self.started = time.strftime("%Y-%m-%d %H:%M:%S")
+
+    def finish(self, state: str = "done", message: str = ""):
+        self.state = state
+        self.message = message or self.message
+        self.finished = time.strftime("%Y-%m-%d %H:%M:%S")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "trigger": self.trigger,
+            "params": self.params,
+            "state": self.state,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "total": self.total,
+            "processed": self.processed,
+            "writes": self.writes,
+            "errors": self.errors,
+            "message": self.message
+        }
+
+
+class JobRegistry:
+    """
+    最近的定向运行，按创建顺序保留 keep 个
+    """
+
+    def __init__(self, keep: int = 20):
+        self.keep = keep
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, trigger: str = "接口", params: Dict[str, Any] = None) -> Job:
+        job = Job(trigger=trigger, params=params)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.keep:
+                self._jobs.popitem(last=False)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel_pending(self, message: str = "插件停止，任务已取消"):
+        """
+        尚未开始的任务标记为已取消，与 SingleFlight.cancel() 一同调用
+        """
+        with self._lock:
+            for job in self._jobs.values():
+                if job.state == "pending":
+                    job.finish("cancelled", message)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [job.to_dict() for job in reversed(self._jobs.values())]
@@ -0,0 +1,74 @@
+import time
+from typing import Any, Dict, Iterable, Optional, Set
+
+
+class LabelRegistry:
+    """
+    插件管理的标签：当前配置产生的标签，记录来源、最后一次出现的时间以及插件是否写入过
+
+    配置中删除某行后，其标签不再由当前配置产生，即为失效标签；清理时只移除插件写入过的失效标签，
+    未写入过的只移除登记。不在登记表中的标签（用户自行添加的标签、按站点索引匹配的站点标签）不会被修改。
+    """
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None):
+        # 标签 -> {"source": 来源, "time": 最后一次出现的时间, "written": 插件是否写入过}
+        self.labels: Dict[str, Dict[str, Any]] = dict(data or {})
+        self._dirty = False
+
+    def __contains__(self, label: str) -> bool:
+        return label in self.labels
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty
+
+    def manage(self, labels: Dict[str, str]):
+        """
+        登记标签，labels: 标签 -> 来源，如 tracker hudbt、保存路径 /volume1/pt/
+        """
+        now = time.strftime("%Y-%m-%d %H:%M:%S")
+        for label, source in labels.items():
+            if not label:
+                continue
+            item = self.labels.get(label)
+            if item and item.get("source") == source and item.get("time", "")[:10] == now[:10]:
+                # 同一天内不重复更新，避免每次运行都保存
+                continue
+            self.labels[label] = {"source": source, "time": now, "written": bool(item and item.get("written"))}
+            self._dirty = True
+
+    def wrote(self, labels: Iterable[str]):
+        """
+        记录插件写入过的标签，未登记的标签忽略
+        """
+        for label in labels:
+            item = self.labels.get(label)
+            if item and not item.get("written"):
+                item["written"] = True
+                self._dirty = True
+
+    def retired(self, active: Iterable[str]) -> Set[str]:
+        """
+        插件写入过、当前配置不再产生的标签
+        """
+        active = set(active)
+        return {label for label, item in self.labels.items() if item.get("written") and label not in active}
+
+    def forget(self, active: Iterable[str]):
+        """
+        移除未写入过、当前配置不再产生的标签的登记，种子上的同名标签不是插件写入的，无需清理
+        """
+        active = set(active)
+        self.drop([label for label, item in self.labels.items() if not item.get("written") and label not in active])
+
+    def drop(self, labels: Iterable[str]):
+        """
+        清理完成后移除失效标签的登记
+        """
+        for label in labels:
+            if self.labels.pop(label, None) is not None:
+                self._dirty = True
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        self._dirty = False
+        return self.labels
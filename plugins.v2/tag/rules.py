@@ -0,0 +1,285 @@
+import fnmatch
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# 规则可以匹配的字段
+FIELDS = ("name", "category", "path", "tracker", "size")
+# 大小单位
+_UNITS = {"": 1, "B": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+_SIZE = re.compile(r"^\s*([\d.]+)\s*([KMGT]?)B?\s*$", re.IGNORECASE)
+# 分组引用在合并后的正则中编号会变化，这类规则单独匹配
+_BACKREF = re.compile(r"\\[1-9]|\(\?P=")
+# 每个合并正则包含的规则数，候选规则的其余条件不满足时只需在同一块内继续查找
+BLOCK_SIZE = 32
+
+
+def _size(text: str) -> int:
+    match = _SIZE.match(text)
+    if not match:
+        raise ValueError(f"无法识别的大小: {text}")
+    return int(float(match.group(1)) * _UNITS[match.group(2).upper()])
+
+
+class Condition:
+    """
+    规则中的一个条件
+
+    name、path 默认为包含匹配，category、tracker 默认为完全匹配（tracker 为域名）；
+    re: 前缀为正则（搜索），glob: 前缀为通配符（完全匹配）；size 为 >20G、<2G、1G-5G 形式的范围。
+    """
+
+    __slots__ = ("field", "kind", "pattern", "regex", "low", "high")
+
+    def __init__(self, text: str):
+        field, sep, pattern = text.strip().partition(":")
+        field, pattern = field.strip().lower(), pattern.strip()
+        if not sep or field not in FIELDS or not pattern.strip():
+            raise ValueError(f"无法识别的条件: {text.strip()}")
+        self.field = field
+        self.regex = None
+        self.low, self.high = 0, None
+        if field == "size":
+            self.kind, self.pattern = "size", pattern.strip()
+            self._parse_size(self.pattern)
+            return
+        if pattern.startswith("re:"):
+            self.kind, self.pattern = "re", pattern[3:]
+            self.regex = re.compile(self.pattern)
+        elif pattern.startswith("glob:"):
+            self.kind, self.pattern = "glob", pattern[5:]
+            self.regex = re.compile(fnmatch.translate(self.pattern))
+        elif field in ("category", "tracker"):
+            self.kind, self.pattern = "exact", pattern.strip()
+        else:
+            self.kind, self.pattern = "substr", pattern
+
+    def _parse_size(self, text: str):
+        if text.startswith(">"):
+            self.low = _size(text[1:]) + 1
+        elif text.startswith("<"):
+            self.high = _size(text[1:]) - 1
+        elif "-" in text:
+            low, high = text.split("-", 1)
+            self.low, self.high = _size(low), _size(high)
+        else:
+            raise ValueError(f"无法识别的大小范围: {text}")
+
+    def source(self) -> Optional[str]:
+        """
+        合并到同一字段的正则中使用的片段，在字符串任意位置搜索；不能合并时为 None
+        """
+        if self.kind == "substr":
+            return re.escape(self.pattern)
+        if self.kind == "glob":
+            return r"\A" + fnmatch.translate(self.pattern)
+        if self.kind == "re" and not _BACKREF.search(self.pattern):
+            return "(?:" + self.pattern + ")"
+        return None
+
+    def test_value(self, value: Any) -> bool:
+        if self.kind == "size":
+            return value >= self.low and (self.high is None or value <= self.high)
+        if self.kind == "exact":
+            return value == self.pattern
+        if self.kind == "substr":
+            return self.pattern in value
+        if self.kind == "glob":
+            return self.regex.match(value) is not None
+        return self.regex.search(value) is not None
+
+    def test(self, values: Dict[str, Any]) -> bool:
+        value = values.get(self.field)
+        if self.field == "tracker":
+            return any(self.test_value(domain) for domain in value or ())
+        return self.test_value(value if value is not None else ("" if self.kind != "size" else 0))
+
+
+class Rule:
+    """
+    一行规则：多个条件用 & 连接，全部满足时设置 => 后的标签（多个用英文逗号分隔）
+    """
+
+    __slots__ = ("index", "line", "conditions", "labels", "text", "primary")
+
+    def __init__(self, index: int, text: str, line: int = 0):
+        cond, sep, labels = text.rpartition("=>")
+        if not sep:
+            raise ValueError("缺少 =>")
+        # 在已解析规则中的序号，决定匹配的先后
+        self.index = index
+        # 在规则配置中的行号，从1开始，跳过的空行、注释行也计入
+        self.line = line or index + 1
+        self.text = text.strip()
+        self.conditions = [Condition(item) for item in cond.split(" & ")]
+        self.labels = [label.strip() for label in labels.split(",") if label.strip()]
+        if not self.labels:
+            raise ValueError("缺少标签")
+        self.primary = self._primary()
+
+    def _primary(self) -> Condition:
+        """
+        用于分派的条件：优先完全匹配，其次名称、保存路径上可合并的正则（tracker 域名的通配符往往命中大量种子），
+        再次其余可合并的正则，最后为大小等需要逐个判断的条件
+        """
+        for condition in self.conditions:
+            if condition.kind == "exact":
+                return condition
+        combinable = [condition for condition in self.conditions if condition.source() is not None]
+        for condition in combinable:
+            if condition.field in ("name", "path"):
+                return condition
+        return combinable[0] if combinable else self.conditions[0]
+
+    def test(self, values: Dict[str, Any]) -> bool:
+        return all(condition.test(values) for condition in self.conditions)
+
+    def uses(self, field: str) -> bool:
+        return any(condition.field == field for condition in self.conditions)
+
+    def match(self, values: Dict[str, Any]) -> Optional["Rule"]:
+        """
+        与 RuleEngine.match 一致，只应用这一条规则时代替规则引擎
+        """
+        return self if self.test(values) else None
+
+
+def parse_rules(rule_map: str) -> Tuple[List[Rule], List[str]]:
+    """
+    解析规则配置，保持行顺序，返回 (规则, 无法解析的行及原因)
+    """
+    rules, errors = [], []
+    for number, line in enumerate((rule_map or "").split("\n"), 1):
+        if not line.strip() or line.strip().startswith("#"):
+            continue
+        try:
+            rules.append(Rule(index=len(rules), text=line, line=number))
+        except Exception as e:
+            errors.append(f"第 {number} 行 {line.strip()}: {str(e)}")
+    return rules, errors
+
+
+class RuleEngine:
+    """
+    编译后的规则，按行顺序返回第一条全部条件满足的规则
+
+    初始化时按每条规则的分派条件分组：完全匹配的放入按值索引的字典，正则、通配符、包含匹配
+    按字段每 BLOCK_SIZE 条合并为一个正则；同一位置上按行号顺序尝试，依次搜索每个命中位置即可得到
+    块内满足条件、行号最小的规则，未命中的块整体跳过。大小等其余条件逐个判断。
+    """
+
+    def __init__(self, rules: List[Rule]):
+        self.rules = rules
+        # 字段 -> 值 -> 规则行号（升序）
+        self._exact: Dict[str, Dict[str, List[int]]] = {}
+        # 字段 -> [(合并后的正则, 分组名 -> 块内位置, 块内按行号排列的规则)]
+        self._combined: Dict[str, List[Tuple[re.Pattern, Dict[str, int], List[Rule]]]] = {}
+        # 逐个判断分派条件的规则
+        self._scan: List[Rule] = []
+        grouped: Dict[str, List[Rule]] = {}
+        for rule in rules:
+            primary = rule.primary
+            if primary.kind == "exact":
+                self._exact.setdefault(primary.field, {}).setdefault(primary.pattern, []).append(rule.index)
+            elif primary.source() is not None and self._compiles(primary.source()):
+                grouped.setdefault(primary.field, []).append(rule)
+            else:
+                self._scan.append(rule)
+        for field, group in grouped.items():
+            for i in range(0, len(group), BLOCK_SIZE):
+                block = group[i:i + BLOCK_SIZE]
+                try:
+                    regex = re.compile("|".join(f"{rule.primary.source()}(?P<r{rule.index}>)" for rule in block))
+                except re.error:
+                    # 个别正则无法合并（如重复的分组名），该块的规则逐个判断
+                    self._scan.extend(block)
+                    continue
+                self._combined.setdefault(field, []).append(
+                    (regex, {f"r{rule.index}": pos for pos, rule in enumerate(block)}, block))
+        self._scan.sort(key=lambda rule: rule.index)
+        self.fields = {condition.field for rule in rules for condition in rule.conditions}
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    @staticmethod
+    def _compiles(source: str) -> bool:
+        """
+        片段能否单独编译，如正则中间的全局标志 (?i) 无法放入合并后的正则
+        """
+        try:
+            re.compile(source)
+            return True
+        except re.error:
+            return False
+
+    @staticmethod
+    def _match_block(regex: re.Pattern, groups: Dict[str, int], block: List[Rule], texts: Tuple[str, ...],
+                     values: Dict[str, Any], best: int) -> Optional[int]:
+        """
+        块内全部条件满足、行号小于 best 的第一条规则
+        """
+        start = None
+        for text in texts:
+            match = regex.search(text)
+            while match:
+                pos = groups[match.lastgroup]
+                if start is None or pos < start:
+                    start = pos
+                if start == 0 or match.start() >= len(text):
+                    break
+                # 同一位置只返回行号最小的一条，从下一位置继续搜索其余命中
+                match = regex.search(text, match.start() + 1)
+        if start is None:
+            return None
+        for rule in block[start:]:
+            if rule.index >= best:
+                break
+            # 先判断分派条件，多数规则在这里即被排除
+            if rule.primary.test(values) and rule.test(values):
+                return rule.index
+        return None
+
+    def summary(self) -> Dict[str, int]:
+        """
+        各匹配方式的规则数
+        """
+        return {"combined": sum(len(block) for blocks in self._combined.values() for _, _, block in blocks),
+                "exact": sum(len(indexes) for table in self._exact.values() for indexes in table.values()),
+                "scan": len(self._scan)}
+
+    def uses(self, field: str) -> bool:
+        return field in self.fields
+
+    def match(self, values: Dict[str, Any]) -> Optional[Rule]:
+        """
+        values: name、category、path 为字符串，tracker 为域名列表，size 为字节数
+        """
+        best = len(self.rules)
+        # 完全匹配：字典中取出全部候选，按行号检查其余条件
+        for field, table in self._exact.items():
+            keys = values.get(field) or () if field == "tracker" else (values.get(field) or "",)
+            for key in keys:
+                for index in table.get(key, ()):
+                    if index >= best:
+                        break
+                    if self.rules[index].test(values):
+                        best = index
+                        break
+        # 合并的正则：得到块内分派条件满足的最小行号，从这里开始依次检查块内的规则
+        for field, blocks in self._combined.items():
+            texts = values.get(field) or () if field == "tracker" else (values.get(field) or "",)
+            for regex, groups, block in blocks:
+                if block[0].index >= best:
+                    break
+                index = self._match_block(regex, groups, block, texts, values, best)
+                if index is not None:
+                    # 后续块的行号更大
+                    best = index
+                    break
+        for rule in self._scan:
+            if rule.index >= best:
+                break
+            if rule.test(values):
+                best = rule.index
+                break
+        return self.rules[best] if best < len(self.rules) else None
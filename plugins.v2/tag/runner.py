@@ -0,0 +1,149 @@
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.log import logger
+
+
+class SingleFlight:
+    """
+    同一插件同时只运行一个任务，运行期间到达的触发合并为结束后的一次补充运行
+
+    带参数的定向运行不合并，排队等待前一个任务结束后逐个运行。
+    """
+
+    def __init__(self, log_tag: str = ""):
+        self.log_tag = log_tag
+        self._lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+        # 等待补充运行的触发 (任务, 触发来源, 参数)
+        self._pending: Optional[Tuple[Callable[..., Any], str, Dict[str, Any]]] = None
+        # 丢弃排队中的定向运行时递增
+        self._generation = 0
+        # stop() 超时时仍在运行的任务结束后需要清除的停止信号
+        self._stop_event: Optional[threading.Event] = None
+        # 运行期间被合并的触发次数
+        self.coalesced = 0
+        # 已有补充运行时再到达而被跳过的触发次数
+        self.skipped = 0
+
+    @property
+    def running(self) -> bool:
+        return not self._idle.is_set()
+
+    def run(self, func: Callable[..., Any], trigger: str = "定时任务", **kwargs) -> bool:
+        """
+        在当前线程运行任务，已有任务在运行时合并本次触发并立即返回False
+        """
+        with self._lock:
+            if self.running:
+                if self._pending:
+                    self.skipped += 1
+                    logger.info(f"{self.log_tag}任务正在运行且已有待补充运行，跳过本次触发：{trigger}")
+                else:
+                    self._pending = (func, trigger, kwargs)
+                    self.coalesced += 1
+                    logger.info(f"{self.log_tag}任务正在运行，本次触发将在结束后合并运行：{trigger}")
+                return False
+            self._idle.clear()
+        self._drain(func, trigger, kwargs)
+        return True
+
+    def run_queued(self, func: Callable[..., Any], trigger: str = "接口", generation: int = None, **kwargs) -> bool:
+        """
+        在当前线程运行任务，已有任务在运行时等待其结束后再运行，不与其他触发合并
+
+        generation 为排队时的代数，之后调用过 cancel() 时不再运行，返回False。
+        """
+        if generation is None:
+            generation = self._generation
+        while True:
+            self._idle.wait()
+            with self._lock:
+                if self._generation != generation:
+                    logger.info(f"{self.log_tag}排队中的任务已取消：{trigger}")
+                    return False
+                if not self.running:
+                    self._idle.clear()
+                    break
+        self._drain(func, trigger, kwargs)
+        return True
+
+    def _drain(self, func: Callable[..., Any], trigger: str, kwargs: Dict[str, Any]):
+        """
+        运行任务及其运行期间合并的补充运行，调用前已标记为运行中
+        """
+        try:
+            while True:
+                try:
+                    func(trigger=trigger, **kwargs)
+                except Exception as e:
+                    logger.error(f"{self.log_tag}任务运行出错: {str(e)}")
+                with self._lock:
+                    if not self._pending:
+                        return
+                    func, trigger, kwargs = self._pending
+                    trigger = f"{trigger}(合并)"
+                    self._pending = None
+        finally:
+            with self._lock:
+                self._pending = None
+                if self._stop_event is not None:
+                    # 收到停止信号的任务已结束，清除信号后之后的运行才能正常进行
+                    self._stop_event.clear()
+                    self._stop_event = None
+                self._idle.set()
+
+    def submit(self, func: Callable[..., Any], trigger: str = "立即运行", **kwargs) -> threading.Thread:
+        """
+        在后台线程运行任务，与定时任务共用同一个运行保护
+        """
+        thread = threading.Thread(target=self.run, args=(func, trigger), kwargs=kwargs, daemon=True)
+        thread.start()
+        return thread
+
+    def enqueue(self, func: Callable[..., Any], trigger: str = "接口", **kwargs) -> threading.Thread:
+        """
+        在后台线程排队运行任务，见 run_queued；排队时记录代数，线程启动前调用 cancel() 同样会取消
+        """
+        with self._lock:
+            generation = self._generation
+        thread = threading.Thread(target=self.run_queued, args=(func, trigger, generation), kwargs=kwargs,
+                                  daemon=True)
+        thread.start()
+        return thread
+
+    def cancel(self):
+        """
+        丢弃待补充的运行和排队中的定向运行
+        """
+        with self._lock:
+            self._pending = None
+            self._generation += 1
+
+    def stop(self, event: threading.Event, timeout: float = None) -> bool:
+        """
+        设置停止信号并等待当前任务结束，返回是否已结束
+
+        停止信号在任务结束时清除；超时时任务仍在运行，信号保持设置，直到该任务结束。
+        """
+        with self._lock:
+            if not self.running:
+                return True
+            self._stop_event = event
+            event.set()
+        return self._idle.wait(timeout)
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        等待当前任务结束
+        """
+        return self._idle.wait(timeout)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "pending": bool(self._pending),
+            "coalesced": self.coalesced,
+            "skipped": self.skipped
+        }